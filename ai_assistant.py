@@ -1,9 +1,13 @@
 import streamlit as st
-import google.generativeai as genai
 import os
 import pandas as pd # Import pandas to handle DataFrame
 import re # Import regex for text processing
 import google.api_core.exceptions # Import specific exceptions for better error handling
+import logging
+from prompt_builder import build_prompt, DEFAULT_TOKEN_BUDGET
+from llm_cache import get_gemini_model, get_response_cache, model_identity, data_snapshot_version
+
+logger = logging.getLogger(__name__)
 
 def initialize_gemini_client():
     """
@@ -17,19 +21,8 @@ def initialize_gemini_client():
         return None
 
     try:
-        genai.configure(api_key=api_key)
-        # Optional: Test a simple call to check if the key is valid
-        # try:
-        #     models = genai.list_models()
-        #     print("Successfully connected to Gemini API.")
-        # except Exception as e:
-        #      st.error(f"⚠️ Error connecting to Gemini API with provided key: {e}")
-        #      return None
-
-        # Return the generative model object, not the client itself
-        # The common usage is to get the model directly after configuring
-        model = genai.GenerativeModel('gemini-pro') # Or another suitable model
-        return model
+        # Shared model per API key: genai.configure() and GenerativeModel() run only once
+        return get_gemini_model(api_key)
 
     except google.api_core.exceptions.GoogleAPIError as e:
         st.error(f"⚠️ Google API Error during Gemini client initialization: {e}")
@@ -57,40 +50,45 @@ def format_ai_response(response_text):
     return formatted_text
 
 
-def generate_ai_advice(user_query, gemini_model, historical_data=None):
+def generate_ai_advice(user_query, gemini_model, historical_data=None, reviews_data=None,
+                       token_budget=DEFAULT_TOKEN_BUDGET, return_prompt=False, cache=None):
     """
     Generates AI advice based on the user prompt, historical data, and the Gemini model.
+    The data is reduced to compact aggregates that fit within `token_budget` (see prompt_builder).
+    Repeat questions over the same data are answered from the response cache (see llm_cache);
+    pass cache=False to always call the model.
     Processes and formats the response before returning.
+    With return_prompt=True, returns (advice, PromptBuild) so callers can report the prompt size.
     """
     if gemini_model is None:
         st.warning("Gemini client is not initialized. Please set the API key in settings.")
-        return "AI assistant is not available."
-
-    prompt_parts = []
-    prompt_parts.append("Analyze the following data and provide insights and actionable advice based on the user's question.")
-
-    if historical_data is not None and not historical_data.empty: # Check if data is not None and not empty
-        prompt_parts.append("\n\nHistorical Analysis Data:")
-        # Convert DataFrame to a string format, e.g., markdown table or string
-        # Using to_string() for simplicity, consider to_markdown() for better formatting
-        prompt_parts.append(historical_data.to_string(index=False))
-    elif historical_data is not None and historical_data.empty:
-        prompt_parts.append("\n\nNo historical analysis data available.")
-
+        advice = "AI assistant is not available."
+        return (advice, None) if return_prompt else advice
 
-    prompt_parts.append(f"\n\nUser's Question: {user_query}")
+    prompt = build_prompt(user_query, historical_data, reviews_data, token_budget=token_budget)
+    logger.info(f"AI prompt: ~{prompt.tokens}/{prompt.token_budget} tokens, sections={prompt.sections}, "
+                f"dropped={prompt.dropped}")
+    if cache is None:
+        cache = get_response_cache()
+    data_version = data_snapshot_version(historical_data, reviews_data) if cache else None
+    advice = _generate(gemini_model, prompt.text, cache, data_version)
+    return (advice, prompt) if return_prompt else advice
 
-    # Add constraints or desired output format, asking for clear paragraphs
-    prompt_parts.append("\n\nProvide a concise summary and focus on actionable recommendations based on the available data and the user's question. Ensure the response is formatted with clear paragraph breaks.")
-
-
-    full_prompt = "\n".join(prompt_parts)
 
+def _generate(gemini_model, full_prompt, cache=None, data_version=None):
+    """Sends the prompt to the model (through the cache) and maps API errors to user-facing messages."""
     try:
-        # Use the model object to generate content
-        response = gemini_model.generate_content(full_prompt)
+        # Use the model object to generate content; errors are never cached
+        if cache:
+            response_text = cache.get_or_generate(
+                model_identity(gemini_model), full_prompt,
+                lambda: gemini_model.generate_content(full_prompt).text,
+                data_version=data_version,
+            )
+        else:
+            response_text = gemini_model.generate_content(full_prompt).text
         # Process and format the raw response text
-        formatted_advice = format_ai_response(response.text)
+        formatted_advice = format_ai_response(response_text)
         return formatted_advice
     except google.api_core.exceptions.DeadlineExceeded as e:
         st.error(f"⚠️ The Gemini API request timed out: {e}")
@@ -111,3 +109,51 @@ def generate_ai_advice(user_query, gemini_model, historical_data=None):
         st.error(f"⚠️ Unexpected Error generating AI advice: {e}")
         return "Error generating advice from AI."
 
+
+# Offline check: run the prompt pipeline against a fake model (no API key or network needed)
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from llm_cache import ResponseCache
+
+    class FakeModel:
+        def __init__(self, latency=0.0):
+            self.prompts = []
+            self.latency = latency
+
+        def generate_content(self, prompt):
+            self.prompts.append(prompt)
+            time.sleep(self.latency)
+            return type('Response', (), {'text': "Summary.\n\n\n\nRecommendation."})()
+
+    runs = pd.DataFrame({
+        'target_site': ['A', 'A', 'B'] * 200,
+        'created_at': pd.date_range('2024-01-01', periods=600, freq='h'),
+        'total_reviews': 50,
+        'positive_percentage': [60.0, 70.0, 40.0] * 200,
+        'avg_compound_score': [0.2, 0.3, -0.1] * 200,
+    })
+    reviews = pd.DataFrame({
+        'نص التعليق': ['delivery was late and packaging damaged', 'great product', 'ok'] * 1000,
+        'شدة السلبية/الإيجابية': [-0.7, 0.8, 0.0] * 1000,
+        'تصنيف المشاعر': ['سلبي', 'إيجابي', 'محايد'] * 1000,
+    })
+    model = FakeModel()
+    for budget in (100, 400, 2000):
+        advice, prompt = generate_ai_advice("What should we fix first?", model, runs, reviews,
+                                            token_budget=budget, return_prompt=True, cache=False)
+        print(f"budget={budget}: ~{prompt.tokens} tokens, sections={prompt.sections}, dropped={prompt.dropped}")
+        assert prompt.tokens <= budget or not prompt.sections
+        assert model.prompts[-1] == prompt.text
+    print(f"full to_string() dump would be ~{len(runs.to_string(index=False)) // 4} tokens")
+
+    # Cache + coalescing: 8 concurrent identical questions -> 1 model call, then a cache hit
+    slow_model = FakeModel(latency=0.5)
+    cache = ResponseCache(persistent=False)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: generate_ai_advice("Top issue?", slow_model, runs, reviews, cache=cache), range(8)))
+    started = time.perf_counter()
+    generate_ai_advice("Top issue?", slow_model, runs, reviews, cache=cache)
+    print(f"model calls={len(slow_model.prompts)}, cache stats={cache.stats}, "
+          f"repeat answered in {(time.perf_counter() - started) * 1000:.1f} ms")
+    assert len(slow_model.prompts) == 1
@@ -0,0 +1,165 @@
+# alert_stream.py - مرحلة تنبيه فورية داخل خط الزحف/التحليل (عتبة + نافذة تجميع + حد للمعدل)
+
+import logging
+import os
+import threading
+import time
+
+from database import SessionLocal
+from outbox import enqueue_critical_alerts
+
+logger = logging.getLogger(__name__)
+
+# ----------------- الإعدادات الافتراضية (قابلة للتغيير من متغيرات البيئة أو config.json) -----------------
+
+DEFAULT_ALERT_THRESHOLD = float(os.getenv("ALERT_THRESHOLD", -0.5))
+DEFAULT_ALERT_WINDOW_SECONDS = float(os.getenv("ALERT_WINDOW_SECONDS", 30))   # مدة تجميع التنبيهات قبل إرسالها
+DEFAULT_ALERT_MAX_PER_WINDOW = int(os.getenv("ALERT_MAX_PER_WINDOW", 20))     # الحد الأقصى للتنبيهات في كل نافذة
+DEFAULT_ALERT_POLL_SECONDS = 1.0  # فترة poll() في خيط start_poller
+
+# ----------------- مرحلة التنبيه -----------------
+
+class StreamingAlertStage:
+    """
+    تستقبل كل مراجعة فور تقييمها؛ المراجعات التي تقل درجتها عن العتبة تُجمع
+    في نافذة زمنية ثم تُكتب دفعة واحدة في صندوق الإشعارات (Outbox) ليرسلها الموزّع.
+
+    - التجميع: تنبيه واحد لكل نافذة بدلاً من رسالة لكل مراجعة.
+    - حد المعدل: لا يُضاف أكثر من max_per_window تنبيه في كل نافذة؛ الباقي يُحصى كـ suppressed
+      ويُسجل في السجل (التعليقات تبقى محفوظة في قاعدة البيانات ويمكن مراجعتها من لوحة التحكم).
+    - observe() لا يلمس قاعدة البيانات أبداً؛ إرسال النافذة المنتهية يتم في poll() التي يستدعيها
+      المُستدعي دورياً (من منفّذ خارج حلقة الأحداث في الزحف غير المتزامن).
+    """
+
+    def __init__(self, recipient, site_name, analysis_run_id=None, threshold=DEFAULT_ALERT_THRESHOLD,
+                 window_seconds=DEFAULT_ALERT_WINDOW_SECONDS, max_per_window=DEFAULT_ALERT_MAX_PER_WINDOW,
+                 dispatcher=None):
+        self.recipient = recipient
+        self.site_name = site_name
+        self.analysis_run_id = analysis_run_id
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_per_window = max_per_window
+        self.dispatcher = dispatcher  # OutboxDispatcher اختياري لإيقاظه بعد كل دفعة
+
+        self._buffer = []
+        self._window_started = None
+        self._window_count = 0
+        self._lock = threading.Lock()
+        self._poller = None
+        self._stop_polling = threading.Event()
+        self.stats = {'seen': 0, 'critical': 0, 'enqueued': 0, 'suppressed': 0, 'flushes': 0}
+
+    @classmethod
+    def from_config(cls, config, analysis_run_id=None, dispatcher=None):
+        """
+        إنشاء المرحلة من config.json (قسم alerts اختياري، والمستلم من قسم email).
+        ترجع None إذا كانت التنبيهات معطلة أو لا يوجد مستلم.
+        """
+        alerts_config = config.get('alerts', {})
+        recipient = config.get('email', {}).get('receiver')
+        if not alerts_config.get('enabled', True) or not recipient:
+            return None
+        return cls(
+            recipient=recipient,
+            site_name=config.get('target_site_name', 'موقع غير معروف'),
+            analysis_run_id=analysis_run_id,
+            threshold=alerts_config.get('threshold', DEFAULT_ALERT_THRESHOLD),
+            window_seconds=alerts_config.get('window_seconds', DEFAULT_ALERT_WINDOW_SECONDS),
+            max_per_window=alerts_config.get('max_per_window', DEFAULT_ALERT_MAX_PER_WINDOW),
+            dispatcher=dispatcher,
+        )
+
+    def observe(self, score, review_text, title=None, review_id=None):
+        """
+        تمرير مراجعة مُقيّمة عبر المرحلة.
+
+        Returns:
+            True إذا اعتُبرت المراجعة حرجة وأضيفت إلى النافذة الحالية
+        """
+        with self._lock:
+            self.stats['seen'] += 1
+            now = time.monotonic()
+
+            if score is None or score > self.threshold:
+                return False
+            self.stats['critical'] += 1
+
+            if self._window_count >= self.max_per_window:
+                self.stats['suppressed'] += 1
+                return False
+
+            self._window_count += 1
+            self._buffer.append({'review_id': review_id, 'title': title, 'review_text': review_text, 'score': score})
+            if self._window_started is None:
+                self._window_started = now
+            return True
+
+    def poll(self):
+        """إرسال النافذة الحالية إذا انتهت مدتها. ترجع عدد التنبيهات المضافة إلى صندوق الإشعارات."""
+        with self._lock:
+            return self._roll_window(time.monotonic())
+
+    def start_poller(self, interval=DEFAULT_ALERT_POLL_SECONDS):
+        """
+        استدعاء poll() دورياً في خيط خلفي حتى close(): للمستدعي المتزامن الذي قد ينتظر الصفحات
+        طويلاً بين دفعتين (المحلل)، فتُرسل النافذة المنتهية خلال ثوانٍ.
+        """
+        if self._poller is None:
+            def run():
+                while not self._stop_polling.wait(interval):
+                    self.poll()
+            self._poller = threading.Thread(target=run, name=f"alert-poller-{self.analysis_run_id}", daemon=True)
+            self._poller.start()
+        return self
+
+    def close(self):
+        """إرسال ما تبقى في النافذة (عند انتهاء الزحف أو التحليل)."""
+        if self._poller is not None:
+            self._stop_polling.set()
+            self._poller.join()
+            self._poller = None
+        with self._lock:
+            self._flush()
+        if self.stats['suppressed']:
+            logger.warning(f"⚠️ {self.stats['suppressed']} critical reviews exceeded the alert rate limit "
+                           f"for {self.site_name}")
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- داخلي ---
+
+    def _roll_window(self, now):
+        if self._window_started is not None and now - self._window_started >= self.window_seconds:
+            return self._flush()
+        return 0
+
+    def _flush(self):
+        buffer, self._buffer = self._buffer, []
+        self._window_started = None
+        self._window_count = 0
+        if not buffer:
+            return 0
+
+        db = SessionLocal()
+        try:
+            added = enqueue_critical_alerts(db, self.analysis_run_id, self.recipient, self.site_name, buffer)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Failed to enqueue streaming alerts: {e}")
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+
+        self.stats['enqueued'] += added
+        self.stats['flushes'] += 1
+        if added and self.dispatcher is not None:
+            self.dispatcher.notify()
+        logger.info(f"🚨 Streamed {added} critical alerts for {self.site_name}")
+        return added
@@ -1,249 +1,339 @@
-[  ] # analyzer.py - منطق عمل التطبيق: إدارة التحليل والاستخلاص والحفظ
-[  ] 
-[  ] # استيرادات الأساسية
-[  ] from datetime import datetime
-[  ] from db_helpers import (
-[  ]     get_db, 
-[  ]     create_analysis_run,
-[  ]     update_analysis_run_status, 
-[  ]     create_review, 
-[  ]     create_sales_opportunity,
-[  ]     get_review_stats
-[  ] )
-[  ] from models import AnalysisRun # نستورد النماذج للعرض
-[  ] # استيرادات منطق العمل (يجب تثبيتها: pip install requests beautifulsoup4 textblob)
-[  ] import requests
-[  ] from bs4 import BeautifulSoup
-[  ] from textblob import TextBlob
-[  ] import re 
-[  ] import time
-[  ] # استيراد خدمة الإشعارات (يفترض أن ملف notifier.py موجود)
-[  ] from notifier import send_analysis_notification 
-[  ] 
-[  ] # ----------------- 1. دوال الاستخلاص والتحليل الفعلية -----------------
-[  ] 
-[  ] def scrape_reviews(url: str, review_selector: str) -> list[dict]:
-[  ]     """
-[  ]     استخلاص نصوص المراجعات والتقييمات الفعلية من صفحة واحدة.
-[  ]     *** ملاحظة: هذه الدالة تحتاج للتخصيص الكامل حسب هيكل HTML للموقع المستهدف. ***
-[  ]     """
-[  ]     reviews_list = []
-[  ]     
-[  ]     try:
-[  ]         response = requests.get(url, timeout=15)
-[  ]         response.raise_for_status() # إطلاق استثناء لأخطاء HTTP
-[  ]         
-[  ]         soup = BeautifulSoup(response.content, 'html.parser')
-[  ]         
-[  ]         review_elements = soup.select(review_selector) 
-[  ]         
-[  ]         for element in review_elements:
-[  ]             # يجب تعديل هذه المُحدّدات (.review-title, .review-body, إلخ) لتطابق الموقع
-[  ]             title = element.select_one('.review-title')?.text.strip()
-[  ]             text = element.select_one('.review-body')?.text.strip()
-[  ]             rating_str = element.select_one('.review-rating')?.text.strip() 
-[  ]             
-[  ]             if text:
-[  ]                 # استخراج القيمة الرقمية للتقييم
-[  ]                 rating = re.search(r'\d+', rating_str).group(0) if rating_str and re.search(r'\d+', rating_str) else None
-[  ] 
-[  ]                 reviews_list.append({
-[  ]                     'title': title,
-[  ]                     'review_text': text,
-[  ]                     'rating': rating,
-[  ]                     # حقول التحليل سيتم ملؤها لاحقاً
-[  ]                 })
-[  ] 
-[  ]     except requests.exceptions.RequestException as e:
-[  ]         print(f"خطأ في الاستخلاص من {url}: {e}")
-[  ]     
-[  ]     return reviews_list
-[  ] 
-[  ] def analyze_sentiment(text: str) -> tuple[str, float, float, str]:
-[  ]     """
-[  ]     تحليل نص المراجعة للحصول على المشاعر والذاتية واللغة.
-[  ]     *** ملاحظة: TextBlob لا يدعم العربية بشكل كامل ويجب استبداله بمكتبة عربية متخصصة. ***
-[  ]     """
-[  ]     try:
-[  ]         # استخدام TextBlob (يجب استبداله بنموذج عربي في الإنتاج)
-[  ]         analysis = TextBlob(text)
-[  ]         
-[  ]         sentiment_score = analysis.sentiment.polarity # من -1 (سلبي) إلى +1 (إيجابي)
-[  ]         subjectivity_score = analysis.sentiment.subjectivity
-[  ]         language = 'ar' 
-[  ]         
-[  ]         if sentiment_score > 0.3:
-[  ]             label = 'إيجابي'
-[  ]         elif sentiment_score < -0.1:
-[  ]             label = 'سلبي'
-[  ]         else:
-[  ]             label = 'محايد'
-[  ]             
-[  ]         return label, sentiment_score, subjectivity_score, language
-[  ] 
-[  ]     except Exception as e:
-[  ]         print(f"خطأ في تحليل المشاعر: {e}")
-[  ]         return 'محايد', 0.0, 0.5, 'unknown'
-[  ] 
-[  ] def find_sales_intent(text: str) -> tuple[bool, str | None]:
-[  ]     """
-[  ]     تحديد ما إذا كان النص يشير إلى فرصة مبيعات أو تحسين (فرصة).
-[  ]     """
-[  ]     keywords = ["أتمنى لو", "يحتاج إلى", "يجب أن", "لو كان هناك", "نقص في"]
-[  ]     
-[  ]     if any(k in text.lower() for k in keywords):
-[  ]         product_title = f"طلب ميزة/تحسين: {text[:30].replace(text[:30].split()[0], '')}..."
-[  ]         return True, product_title
-[  ]         
-[  ]     return False, None
-[  ] 
-[  ] # ----------------- 2. وظائف إدارة عملية التحليل -----------------
-[  ] 
-[  ] def start_new_analysis_run(target_site: str, start_url: str) -> AnalysisRun | None:
-[  ]     """
-[  ]     تبدأ عملية تحليل جديدة عن طريق إنشاء سجل AnalysisRun في قاعدة البيانات بحالة 'pending'.
-[  ]     """
-[  ]     run_data = {
-[  ]         "target_site": target_site,
-[  ]         "start_url": start_url,
-[  ]         "status": "pending",  
-[  ]         "created_at": datetime.utcnow()
-[  ]     }
-[  ] 
-[  ]     with get_db() as db:
-[  ]         new_run = create_analysis_run(db, run_data)
-[  ]     
-[  ]     if new_run:
-[  ]         print(f"✅ تم بدء عملية تحليل جديدة للموقع: {target_site} بالمعرّف (ID): {new_run.id}")
-[  ]     else:
-[  ]         print(f"❌ فشل في بدء عملية التحليل للموقع: {target_site}")
-[  ] 
-[  ]     return new_run
-[  ] 
-[  ] 
-[  ] def process_analysis_run(run_to_process: AnalysisRun):
-[  ]     """
-[  ]     إدارة عملية التحليل بالكامل: التحديث، الاستخلاص، التحليل، الحفظ، والإشعار.
-[  ]     """
-[  ]     run_id = run_to_process.id
-[  ]     start_url = run_to_process.start_url
-[  ]     
-[  ]     print(f"\n--- بدء تحليل ID: {run_id} للموقع: {run_to_process.target_site} ---")
-[  ]     
-[  ]     # 1. تحديث الحالة إلى "running" (قيد التشغيل)
-[  ]     with get_db() as db:
-[  ]         updated_run = update_analysis_run_status(db, run_id, "running")
-[  ]         if not updated_run:
-[  ]             print(f"❌ فشل تحديث حالة التشغيل ID: {run_id} إلى 'running'.")
-[  ]             return
-[  ] 
-[  ]     print(f"🔄 تم تحديث الحالة إلى: {updated_run.status}")
-[  ] 
-[  ]     try:
-[  ]         # 2. الاستخلاص الفعلي
-[  ]         review_selector = 'div.review-card' # يجب تخصيصه
-[  ]         raw_reviews = scrape_reviews(start_url, review_selector)
-[  ]         
-[  ]         # 3. تحليل وحفظ البيانات
-[  ]         reviews_to_save = []
-[  ]         opportunities_to_save = []
-[  ]         
-[  ]         for r_data in raw_reviews:
-[  ]             # التحليل
-[  ]             label, score, subjectivity, lang = analyze_sentiment(r_data['review_text'])
-[  ]             is_opportunity, op_title = find_sales_intent(r_data['review_text'])
-[  ]             
-[  ]             review_final_data = {
-[  ]                 'analysis_run_id': run_id,
-[  ]                 'title': r_data.get('title'),
-[  ]                 'review_text': r_data['review_text'],
-[  ]                 'rating': r_data.get('rating'),
-[  ]                 'sentiment_label': label,
-[  ]                 'compound_score': score,
-[  ]                 'subjectivity': subjectivity,
-[  ]                 'language': lang,
-[  ]                 'has_sales_intent': is_opportunity,
-[  ]                 'scraped_at': datetime.utcnow()
-[  ]             }
-[  ]             reviews_to_save.append(review_final_data)
-[  ] 
-[  ]             if is_opportunity:
-[  ]                 opportunities_to_save.append({
-[  ]                     'analysis_run_id': run_id,
-[  ]                     'product_title': op_title,
-[  ]                     'review_text': r_data['review_text'],
-[  ]                     'compound_score': score,
-[  ]                     'estimated_value': 50.0, # قيمة افتراضية
-[  ]                     'status': 'pending',
-[  ]                     'created_at': datetime.utcnow(),
-[  ]                 })
-[  ]             
-[  ]         # 4. حفظ البيانات وحساب الإحصائيات النهائية
-[  ]         total_reviews = len(reviews_to_save)
-[  ]         positive_count = sum(1 for r in reviews_to_save if r['sentiment_label'] == 'إيجابي')
-[  ]         negative_count = sum(1 for r in reviews_to_save if r['sentiment_label'] == 'سلبي')
-[  ]         neutral_count = total_reviews - (positive_count + negative_count)
-[  ]         avg_compound_score = sum(r['compound_score'] for r in reviews_to_save) / total_reviews if total_reviews else 0
-[  ]         positive_perc = (positive_count / total_reviews) * 100 if total_reviews else 0
-[  ] 
-[  ]         with get_db() as db:
-[  ]             # حفظ المراجعات وفرص المبيعات
-[  ]             for r_data in reviews_to_save:
-[  ]                 create_review(db, r_data)
-[  ]             for o_data in opportunities_to_save:
-[  ]                 create_sales_opportunity(db, o_data)
-[  ]             
-[  ]             # 5. تحديث سجل التحليل بـ "completed" والنتائج
-[  ]             final_data = {
-[  ]                 "total_reviews": total_reviews,
-[  ]                 "positive_count": positive_count,
-[  ]                 "negative_count": negative_count,
-[  ]                 "neutral_count": neutral_count,
-[  ]                 "positive_percentage": positive_perc,
-[  ]                 "avg_compound_score": avg_compound_score,
-[  ]                 "completed_at": datetime.utcnow(),
-[  ]                 "status": "completed"
-[  ]             }
-[  ]             
-[  ]             db.query(AnalysisRun).filter(AnalysisRun.id == run_id).update(final_data)
-[  ]             db.commit()
-[  ]             
-[  ]             print(f"✅ اكتمل التحليل ID: {run_id}. المراجعات الكلية: {total_reviews}")
-[  ]             
-[  ]             # 6. إرسال إشعار النجاح
-[  ]             send_analysis_notification(run_to_process, is_success=True)
-[  ] 
-[  ]     except Exception as e:
-[  ]         error_msg = str(e)
-[  ]         print(f"❌ حدث خطأ غير متوقع أثناء التحليل ID {run_id}: {error_msg}")
-[  ]         
-[  ]         # 7. تحديث الحالة إلى "failed" وإرسال إشعار الفشل
-[  ]         with get_db() as db:
-[  ]             run_to_process.status = "failed"
-[  ]             db.add(run_to_process)
-[  ]             db.commit()
-[  ]             
-[  ]             send_analysis_notification(run_to_process, is_success=False, error_message=error_msg)
-[  ]             
-[  ] # ----------------------------------------------------
-[  ] # مثال على التنفيذ (يجب ربطه بـ Streamlit)
-[  ] # ----------------------------------------------------
-[  ] if __name__ == "__main__":
-[  ]     
-[  ]     # 1. بدء عملية جديدة
-[  ]     run_obj = start_new_analysis_run("منصة تجريبية X", "http://test.com/reviews")
-[  ]     
-[  ]     if run_obj:
-[  ]         # 2. معالجة العملية الجديدة (وهي عملية طويلة المدى)
-[  ]         # ملاحظة: في تطبيق Streamlit، يجب تشغيل هذه الدالة في مؤشر ترابط (Thread) أو عملية منفصلة
-[  ]         # لتجنب حظر واجهة المستخدم.
-[  ]         process_analysis_run(run_obj)
-[  ]         
-[  ]         # 3. التحقق من النتيجة النهائية
-[  ]         with get_db() as db:
-[  ]             final_run = db.query(AnalysisRun).filter(AnalysisRun.id == run_obj.id).first()
-[  ]             if final_run:
-[  ]                 print(f"\n*** تقرير نهائي (ID: {final_run.id}) ***")
-[  ]                 print(f"الحالة النهائية: {final_run.status}")
-[  ]                 print(f"إجمالي المراجعات: {final_run.total_reviews}")
-[  ]
\ No newline at end of file
+# analyzer.py - منطق عمل التطبيق: إدارة التحليل والاستخلاص والحفظ
+
+# استيرادات الأساسية
+from contextlib import nullcontext
+from datetime import datetime
+from database import SessionLocal
+from models import AnalysisRun # نستورد النماذج للعرض
+from rollups import apply_run_to_rollup
+# استيرادات منطق العمل (يجب تثبيتها: pip install aiohttp beautifulsoup4 textblob)
+# TextBlob يُستورد عند أول تحليل (استيراده وحده ~0.4 ثانية)
+import math
+# استيراد خدمة الإشعارات (يفترض أن ملف notifier.py موجود)
+from notifier import enqueue_run_notification
+from alert_stream import StreamingAlertStage
+from enrichment import maybe_enrich_run
+from search import index_run
+from review_batch import ReviewBatch
+from text_dedup import Canonical, DuplicateIndex, fingerprint
+from scraper_core import iter_site_reviews_sync
+from config import CONFIG_PATH, load_config
+from profiling import maybe_profile
+
+# ----------------- 1. دوال الاستخلاص والتحليل الفعلية -----------------
+
+PIPELINE_BATCH_SIZE = 500  # أقصى عدد مراجعات في الذاكرة بين الاستخلاص والحفظ
+DEFAULT_MAX_PAGES = 50     # عدد الصفحات الأقصى لكل تشغيل
+DEFAULT_CONCURRENCY = 10   # عدد الصفحات التي تُجلب بالتوازي
+
+def iter_site_reviews(start_url: str, config: dict, max_pages: int = DEFAULT_MAX_PAGES,
+                      concurrency: int = DEFAULT_CONCURRENCY):
+    """
+    استخلاص المراجعات من صفحات الموقع (مع الترقيم) مراجعة بمراجعة: (review_text, title, rating).
+    الجلب غير متزامن عبر زاحف scraper_core (تجمع اتصالات aiohttp واحد) باستخدام مُحدّدات
+    config['selectors']: item_container, item_title, review_text, review_rating, next_page.
+    """
+    return iter_site_reviews_sync(start_url, config, max_pages, concurrency, buffer_size=PIPELINE_BATCH_SIZE * 2)
+
+def scrape_reviews(url: str, config: dict, batch: ReviewBatch | None = None,
+                   max_pages: int = DEFAULT_MAX_PAGES, concurrency: int = DEFAULT_CONCURRENCY) -> ReviewBatch:
+    """استخلاص جميع مراجعات الموقع إلى دفعة مراجعات واحدة (ReviewBatch)."""
+    batch = batch if batch is not None else ReviewBatch()
+    for text, title, rating in iter_site_reviews(url, config, max_pages, concurrency):
+        batch.append(text, title=title, rating=rating)
+    return batch
+
+def analyze_sentiment(text: str) -> tuple[str, float, float, str]:
+    """
+    تحليل نص المراجعة للحصول على المشاعر والذاتية واللغة.
+    *** ملاحظة: TextBlob لا يدعم العربية بشكل كامل ويجب استبداله بمكتبة عربية متخصصة. ***
+    """
+    from textblob import TextBlob
+
+    try:
+        # استخدام TextBlob (يجب استبداله بنموذج عربي في الإنتاج)
+        analysis = TextBlob(text)
+        
+        sentiment_score = analysis.sentiment.polarity # من -1 (سلبي) إلى +1 (إيجابي)
+        subjectivity_score = analysis.sentiment.subjectivity
+        language = 'ar' 
+        
+        if sentiment_score > 0.3:
+            label = 'إيجابي'
+        elif sentiment_score < -0.1:
+            label = 'سلبي'
+        else:
+            label = 'محايد'
+            
+        return label, sentiment_score, subjectivity_score, language
+
+    except Exception as e:
+        print(f"خطأ في تحليل المشاعر: {e}")
+        return 'محايد', 0.0, 0.5, 'unknown'
+
+def find_sales_intent(text: str) -> tuple[bool, str | None]:
+    """
+    تحديد ما إذا كان النص يشير إلى فرصة مبيعات أو تحسين (فرصة).
+    """
+    keywords = ["أتمنى لو", "يحتاج إلى", "يجب أن", "لو كان هناك", "نقص في"]
+    
+    if any(k in text.lower() for k in keywords):
+        product_title = f"طلب ميزة/تحسين: {text[:30].replace(text[:30].split()[0], '')}..."
+        return True, product_title
+        
+    return False, None
+
+# ----------------- 2. خط المعالجة المتدفق -----------------
+# كل مرحلة مولّد يسحب من المرحلة السابقة عند الحاجة فقط (ضغط عكسي طبيعي):
+# لا يُستخلص أكثر من دفعة واحدة قبل أن تُحفظ الدفعة السابقة، فتصل الصفوف إلى
+# قاعدة البيانات أثناء استمرار الاستخلاص وتبقى الذاكرة محدودة بحجم الدفعة.
+
+def batch_reviews(rows, analysis_run_id: int, batch_size: int = PIPELINE_BATCH_SIZE):
+    """تجميع (review_text, title, rating) في دفعات ReviewBatch بحجم batch_size."""
+    batch = ReviewBatch(analysis_run_id=analysis_run_id)
+    for review_text, title, rating in rows:
+        batch.append(review_text, title=title, rating=rating)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = ReviewBatch(analysis_run_id=analysis_run_id)
+    if len(batch):
+        yield batch
+
+def dedupe_batches(batches, index: DuplicateIndex):
+    """
+    بصمة كل مراجعة بعد التطبيع (text_dedup.fingerprint): المكررة تماماً أو تقريباً لمراجعة
+    في الفهرس (من هذا التشغيل أو السابقة) تُربط بها ولا تُحلَّل، والجديدة تُسجَّل في الفهرس.
+    """
+    for batch in batches:
+        for i in range(len(batch)):
+            text_hash, signature = fingerprint(batch.text(i))
+            batch.set_fingerprint(i, text_hash, signature)
+            canonical = index.find(text_hash, signature)
+            if canonical is not None:
+                batch.mark_duplicate(i, canonical)
+                continue
+            canonical = Canonical()
+            if index.add(text_hash, signature, canonical):
+                batch.mark_canonical(i, canonical)
+        yield batch
+
+def score_batches(batches, alert_stage: StreamingAlertStage | None = None):
+    """تحليل المشاعر ونية الشراء لكل مراجعة في الدفعة (النتائج تُكتب في أعمدتها)."""
+    for batch in batches:
+        for i in range(len(batch)):
+            canonical = batch.duplicates.get(i)
+            if canonical is not None:
+                # نتيجة الأصلية بلا تحليل ولا تنبيه ولا فرصة مبيعات مكررة
+                batch.set_scores(i, canonical.label, canonical.score, canonical.subjectivity, canonical.language)
+                continue
+            review_text = batch.text(i)
+            label, score, subjectivity, lang = analyze_sentiment(review_text)
+            is_opportunity, op_title = find_sales_intent(review_text)
+            if alert_stage:
+                alert_stage.observe(score, review_text, title=batch.title(i))
+            batch.set_scores(i, label, score, subjectivity, lang, op_title if is_opportunity else None)
+            canonical = batch.canonicals.get(i)
+            if canonical is not None:
+                canonical.label, canonical.score, canonical.subjectivity, canonical.language = \
+                    label, score, subjectivity, lang
+        yield batch
+
+class RunTotals:
+    """إحصائيات التشغيل التراكمية (تُحدَّث بعد حفظ كل دفعة، دون الاحتفاظ بالمراجعات)."""
+
+    __slots__ = ('total', 'positive', 'negative', 'duplicates', 'score_sum', 'rating_sum', 'rating_count')
+
+    def __init__(self):
+        self.total = self.positive = self.negative = self.duplicates = self.rating_count = 0
+        self.score_sum = self.rating_sum = 0.0
+
+    def add(self, batch: ReviewBatch):
+        positive, negative, _ = batch.label_counts()
+        self.total += len(batch)
+        self.positive += positive
+        self.negative += negative
+        self.duplicates += len(batch.duplicates)
+        self.score_sum += math.fsum(batch.scores)
+        ratings = [r for r in batch.ratings if not math.isnan(r)]
+        self.rating_sum += sum(ratings)
+        self.rating_count += len(ratings)
+
+    @property
+    def neutral(self):
+        return self.total - self.positive - self.negative
+
+    @property
+    def avg_score(self):
+        return self.score_sum / self.total if self.total else 0.0
+
+    @property
+    def avg_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0.0
+
+    @property
+    def positive_percentage(self):
+        return self.positive / self.total * 100 if self.total else 0.0
+
+def persist_batches(batches, totals: RunTotals):
+    """حفظ كل دفعة في معاملة مستقلة فور وصولها، ثم تحديث الإحصائيات التراكمية."""
+    for batch in batches:
+        with SessionLocal() as db:
+            batch.bulk_insert(db)
+            db.commit()
+        totals.add(batch)
+        yield len(batch)
+
+# ----------------- 3. وظائف إدارة عملية التحليل -----------------
+
+def start_new_analysis_run(target_site: str, start_url: str) -> AnalysisRun | None:
+    """
+    تبدأ عملية تحليل جديدة عن طريق إنشاء سجل AnalysisRun في قاعدة البيانات بحالة 'pending'.
+    """
+    new_run = AnalysisRun(target_site=target_site, start_url=start_url, status="pending",
+                          created_at=datetime.utcnow())
+
+    with SessionLocal() as db:
+        try:
+            db.add(new_run)
+            db.commit()
+            db.refresh(new_run)
+            db.expunge(new_run)  # يُمرر لاحقاً إلى process_analysis_run خارج هذه الجلسة
+        except Exception as e:
+            db.rollback()
+            print(f"❌ خطأ في إنشاء سجل التحليل: {e}")
+            new_run = None
+    
+    if new_run:
+        print(f"✅ تم بدء عملية تحليل جديدة للموقع: {target_site} بالمعرّف (ID): {new_run.id}")
+    else:
+        print(f"❌ فشل في بدء عملية التحليل للموقع: {target_site}")
+
+    return new_run
+
+
+def process_analysis_run(run_to_process: AnalysisRun, config: dict | None = None,
+                         max_pages: int = DEFAULT_MAX_PAGES, concurrency: int = DEFAULT_CONCURRENCY,
+                         profile: str | None = None):
+    """
+    إدارة عملية التحليل بالكامل: التحديث، الاستخلاص، التحليل، الحفظ، والإشعار.
+    config: إعدادات الموقع (المُحدّدات)؛ تُقرأ من SCRAPER_CONFIG/config.json إذا لم تُمرر.
+    profile: وضع قياس الأداء الاختياري ('sampling' أو 'cprofile')؛ التقرير يُحفظ مرتبطاً بالتشغيل.
+    """
+    with maybe_profile(profile, analysis_run_id=run_to_process.id, label=run_to_process.target_site):
+        _process_analysis_run(run_to_process, config, max_pages, concurrency)
+
+def _process_analysis_run(run_to_process: AnalysisRun, config: dict | None, max_pages: int, concurrency: int):
+    run_id = run_to_process.id
+    start_url = run_to_process.start_url
+    
+    print(f"\n--- بدء تحليل ID: {run_id} للموقع: {run_to_process.target_site} ---")
+    
+    # 1. تحديث الحالة إلى "running" (قيد التشغيل)
+    with SessionLocal() as db:
+        updated = db.query(AnalysisRun).filter(AnalysisRun.id == run_id).update({"status": "running"})
+        db.commit()
+    if not updated:
+        print(f"❌ فشل تحديث حالة التشغيل ID: {run_id} إلى 'running'.")
+        return
+
+    print("🔄 تم تحديث الحالة إلى: running")
+
+    try:
+        # 2-4. الاستخلاص ← التحليل ← الحفظ كخط متدفق: كل دفعة تُحفظ قبل استخلاص التالية
+        config = config if config is not None else load_config(CONFIG_PATH)
+        # مرحلة التنبيه الفوري (قسم alerts في الإعدادات كما في الزحف المتعدد): المراجعات الحرجة تُرسل
+        # إلى صندوق الإشعارات أثناء التحليل؛ None إذا كانت التنبيهات معطلة
+        alert_stage = StreamingAlertStage.from_config(config, analysis_run_id=run_id)
+        totals = RunTotals()
+        # فهرس إزالة التكرار: يبدأ بالمراجعات الأصلية المحفوظة لنفس الموقع
+        dedup_index = DuplicateIndex()
+        with SessionLocal() as db:
+            loaded = dedup_index.load_recent(db, run_to_process.target_site)
+        rows = iter_site_reviews(start_url, config, max_pages, concurrency)
+        pipeline = persist_batches(
+            score_batches(dedupe_batches(batch_reviews(rows, run_id), dedup_index), alert_stage),
+            totals,
+        )
+        # الخروج من with يرسل ما تبقى في النافذة حتى عند فشل الزحف أو التحليل
+        with alert_stage.start_poller() if alert_stage else nullcontext():
+            for saved in pipeline:
+                print(f"💾 تم حفظ {saved} مراجعة (الإجمالي: {totals.total})")
+        if totals.duplicates:
+            print(f"🔁 {totals.duplicates} مراجعة مكررة رُبطت بالأصلية دون إعادة تحليل "
+                  f"(تطابق تام: {dedup_index.exact_hits}، تقريبي: {dedup_index.near_hits}، "
+                  f"من تشغيلات سابقة في الفهرس: {loaded})")
+
+        total_reviews = totals.total
+        positive_count, negative_count, neutral_count = totals.positive, totals.negative, totals.neutral
+        avg_compound_score = totals.avg_score
+        positive_perc = totals.positive_percentage
+
+        with SessionLocal() as db:
+            # 5. تحديث سجل التحليل بـ "completed" والنتائج
+            completed_at = datetime.utcnow()
+            final_data = {
+                "total_reviews": total_reviews,
+                "positive_count": positive_count,
+                "negative_count": negative_count,
+                "neutral_count": neutral_count,
+                "positive_percentage": positive_perc,
+                "avg_compound_score": avg_compound_score,
+                "completed_at": completed_at,
+                "status": "completed"
+            }
+            
+            db.query(AnalysisRun).filter(AnalysisRun.id == run_id).update(final_data)
+            # تحديث التجميع اليومي (موقع × يوم) في نفس المعاملة
+            apply_run_to_rollup(
+                db, run_to_process.target_site, completed_at.date(), total_reviews,
+                positive_count, negative_count, neutral_count, avg_compound_score
+            )
+            
+            # 6. إشعار النجاح يُكتب في صندوق الإشعارات (Outbox) ضمن نفس المعاملة،
+            # ويرسله الموزّع الخلفي بعد الحفظ دون انتظار خادم البريد
+            completed_run = db.query(AnalysisRun).filter(AnalysisRun.id == run_id).first()
+            stats = {'avg_rating': totals.avg_rating}
+            enqueue_run_notification(db, completed_run, is_success=True, stats=stats)
+            db.commit()
+            
+            print(f"✅ اكتمل التحليل ID: {run_id}. المراجعات الكلية: {total_reviews}")
+
+        # 7. مرحلة اختيارية: إثراء المراجعات بالنموذج اللغوي (المواضيع ونوع النية) على دفعات
+        maybe_enrich_run(run_id)
+
+        # 8. فهرسة المراجعات الجديدة للبحث النصي (الفشل لا يُفشل التحليل)
+        index_run(run_id)
+
+    except Exception as e:
+        error_msg = str(e)
+        print(f"❌ حدث خطأ غير متوقع أثناء التحليل ID {run_id}: {error_msg}")
+        
+        # 9. تحديث الحالة إلى "failed" وإضافة إشعار الفشل إلى صندوق الإشعارات
+        with SessionLocal() as db:
+            failed_run = db.query(AnalysisRun).filter(AnalysisRun.id == run_id).first()
+            if failed_run is not None:
+                failed_run.status = "failed"
+                enqueue_run_notification(db, failed_run, is_success=False, error_message=error_msg)
+                db.commit()
+            
+# ----------------------------------------------------
+# مثال على التنفيذ (يجب ربطه بـ Streamlit)
+# ----------------------------------------------------
+if __name__ == "__main__":
+    
+    # 1. بدء عملية جديدة
+    run_obj = start_new_analysis_run("منصة تجريبية X", "http://test.com/reviews")
+    
+    if run_obj:
+        # 2. معالجة العملية الجديدة (وهي عملية طويلة المدى)
+        # ملاحظة: في تطبيق Streamlit، يجب تشغيل هذه الدالة في مؤشر ترابط (Thread) أو عملية منفصلة
+        # لتجنب حظر واجهة المستخدم.
+        process_analysis_run(run_obj)
+        
+        # 3. التحقق من النتيجة النهائية
+        with SessionLocal() as db:
+            final_run = db.query(AnalysisRun).filter(AnalysisRun.id == run_obj.id).first()
+            if final_run:
+                print(f"\n*** تقرير نهائي (ID: {final_run.id}) ***")
+                print(f"الحالة النهائية: {final_run.status}")
+                print(f"إجمالي المراجعات: {final_run.total_reviews}")
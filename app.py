@@ -1,14 +1,14 @@
 # app.py - لوحة مدير الأداء الذكي (Final Dashboard)
 
 import streamlit as st
-import asyncio
 import os
 import json
+import tempfile
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from scraper_core import FeedbackAnalystScraper, load_config, LOG_FILENAME
-from social_publisher import publish_to_social_media
+from config import load_config, get_alert_digest_window, LOG_FILENAME
+from social_publisher import publish_to_social_media, PublishScheduler, PLATFORMS
 from db_helpers import (
     get_all_analysis_runs, 
     get_analysis_run_by_id,
@@ -20,20 +20,40 @@ from db_helpers import (
     get_analysis_summary_stats,
     delete_analysis_run
 )
-from email_notifier import EmailNotifier, send_critical_alerts
+from notifier import get_notifier_delivery_service
+from outbox import OutboxDispatcher
+from kpi_engine import get_run_kpis, evaluate_scenario_grid, build_scenarios_table, build_sensitivity_table
+from rollups import get_sentiment_trend, get_rollup_sites
+from exporter import export_run, get_default_export_basename, is_parquet_available, EXPORT_FORMATS, EXPORT_KINDS
 from database import init_db
+from search import search_reviews
+from profiling import maybe_profile, list_profiles, load_profile, PROFILE_MODES
 import time
 import datetime
-
-# تهيئة قاعدة البيانات عند بدء التطبيق
-try:
-    init_db()
-except Exception as e:
-    import logging
-    logging.warning(f"⚠️ تحذير: فشل تهيئة قاعدة البيانات: {e}")
+# وحدات الزحف والبريد تُستورد داخل القسم الذي يستخدمها فقط:
+# Streamlit يعيد تنفيذ هذا الملف مع كل تفاعل، والاستيراد الأول هو ما يحدد زمن الإقلاع البارد.
 
 # ----------------- دوال المساعدة -----------------
 
+@st.cache_resource
+def ensure_database():
+    """تهيئة قاعدة البيانات مرة واحدة لكل عملية Streamlit (وليس مع كل إعادة تنفيذ للصفحة)."""
+    try:
+        init_db()
+    except Exception as e:
+        import logging
+        logging.warning(f"⚠️ تحذير: فشل تهيئة قاعدة البيانات: {e}")
+
+@st.cache_resource
+def start_outbox_dispatcher():
+    """تشغيل موزّع صندوق الإشعارات في الخلفية مرة واحدة لكل عملية Streamlit."""
+    return OutboxDispatcher(get_notifier_delivery_service(), digest_window=get_alert_digest_window()).start()
+
+@st.cache_resource
+def start_publish_scheduler():
+    """طابور النشر المجدول على الشبكات الاجتماعية (خيط خلفي واحد لكل عملية Streamlit)."""
+    return PublishScheduler().start()
+
 def get_config_files(config_dir='.'):
     """جلب قائمة بملفات config.json في المجلد."""
     return [f for f in os.listdir(config_dir) if f.endswith('.json') and f.startswith('config')]
@@ -49,6 +69,32 @@ def get_log_content(n_lines=100):
     except Exception as e:
         return f"Error reading log: {e}"
 
+@st.cache_data(ttl=300)
+def load_sentiment_trend(days, target_site=None):
+    """جلب الاتجاه اليومي من جدول التجميع (مخزن مؤقتاً لتسريع إعادة الرسم)."""
+    return get_sentiment_trend(days, target_site)
+
+@st.cache_data(ttl=60)
+def load_search_results(query, analysis_run_id=None, sentiment_label=None, page=1):
+    """البحث النصي في المراجعات المحفوظة (مخزن مؤقتاً لدقيقة حتى لا يتكرر مع كل إعادة رسم)."""
+    return search_reviews(query, analysis_run_id=analysis_run_id, sentiment_label=sentiment_label, page=page)
+
+@st.cache_data(ttl=300)
+def load_rollup_sites():
+    """جلب قائمة المواقع المتوفرة في جدول التجميع."""
+    return get_rollup_sites()
+
+def get_session_kpis():
+    """مؤشرات الأداء للتحليل الحالي في الجلسة (تُحسب مرة واحدة لكل تشغيل)."""
+    detailed_df = st.session_state['detailed_data']
+    return get_run_kpis(
+        st.session_state.get('analysis_key'),
+        detailed_df['تصنيف المشاعر'].to_numpy(),
+        detailed_df['شدة السلبية/الإيجابية'].to_numpy(),
+        detailed_df['الموضوعية (0-1)'].to_numpy(),
+        detailed_df['فرصة مبيعات محتملة'].to_numpy(),
+    )
+
 def set_rtl_css():
     """حقن أكواد CSS لضبط اتجاه النص من اليمين إلى اليسار (RTL) وتحسين الخط."""
     st.markdown(
@@ -86,12 +132,18 @@ def set_rtl_css():
 
 st.set_page_config(layout="wide", page_title="Smart Performance Analyst")
 set_rtl_css() # تطبيق CSS
+ensure_database()
+start_outbox_dispatcher()
 
 # تحميل الإعدادات
 config_files = get_config_files()
 current_config = {}
 selected_config = 'config.json' 
 if config_files:
+    selected_config = st.sidebar.selectbox(
+        "📁 ملف الإعدادات (الموقع):", config_files,
+        index=config_files.index('config.json') if 'config.json' in config_files else 0
+    )
     current_config = load_config(selected_config)
 
 site_name = current_config.get('target_site_name', 'موقع غير معروف')
@@ -169,6 +221,15 @@ with tab_control:
         pages_to_scrape = st.number_input("عدد الصفحات القصوى:", min_value=1, value=5, step=1)
     with col_concurrency:
         max_concurrency = st.number_input("التزامن (Concurrency):", min_value=1, value=5, step=1)
+
+    col_profile, col_profile_mode = st.columns([1, 1])
+    with col_profile:
+        profile_enabled = st.checkbox("🔬 قياس الأداء (Profiling)",
+                                      help="يسجل أين يذهب الوقت (التحليل، المشاعر، SQL، الشبكة) ويعرض التقرير في تبويب المراقبة.")
+    with col_profile_mode:
+        profile_mode = st.selectbox("وضع القياس:", PROFILE_MODES, disabled=not profile_enabled,
+                                    help="sampling: عينات من كل الخيوط (Flamegraph) | cprofile: عدد الاستدعاءات وأزمنتها الدقيقة")
+    run_profile = profile_mode if profile_enabled else None
     
     if st.button("▶️ ابدأ التحليل (Async/NLP)", type="primary"):
         status_placeholder = st.empty()
@@ -178,23 +239,61 @@ with tab_control:
             # تحديث config.json بـ Tokens الحالية قبل التشغيل
             current_config['api_tokens'] = st.session_state.api_tokens 
             
-            scraper = FeedbackAnalystScraper(selected_config)
+            # نفس مسار main.py --url: سجل AnalysisRun ومراجعة لكل صف، ثم تُقرأ النتائج من قاعدة البيانات
+            from batch_crawl import crawl_single_site
             start_time = time.time()
-            total_scraped, metrics = asyncio.run(scraper.run_scraper_async(start_url, pages_to_scrape, max_concurrency))
+            with maybe_profile(run_profile, label=f"dashboard {start_url}") as profiler:
+                crawl_summary = crawl_single_site(current_config, start_url, pages_to_scrape, max_concurrency)
+                if profiler is not None:
+                    profiler.analysis_run_id = crawl_summary['run_id']  # ربط التقرير بالتشغيل عند حفظه
             end_time = time.time()
             
-            if total_scraped > 0:
-                detailed_data, sentiment_summary = scraper.generate_analysis()
-                st.session_state['detailed_data'] = detailed_data 
-                st.session_state['sentiment_summary'] = sentiment_summary
+            if crawl_summary['status'] != 'completed':
+                status_placeholder.error(f"❌ فشل التحليل: {crawl_summary['error']}")
+            elif crawl_summary['reviews'] > 0:
+                reviews = get_reviews_by_analysis_run(crawl_summary['run_id'])
+                st.session_state['detailed_data'] = reviews_to_dataframe(reviews)
+                st.session_state['sentiment_summary'] = get_sentiment_summary_from_reviews(reviews)
+                st.session_state['analysis_key'] = f"{start_url}@{end_time}"
+                # معرف التشغيل المحفوظ لربط التنبيهات بمراجعاته
+                st.session_state['analysis_run_id'] = crawl_summary['run_id']
+                load_sentiment_trend.clear()
                 
-                status_placeholder.success(f"🎉 اكتمل التحليل! تم جمع {total_scraped} تعليق في {end_time - start_time:.2f} ثانية.")
+                status_placeholder.success(f"🎉 اكتمل التحليل! تم جمع {crawl_summary['reviews']} تعليق في {end_time - start_time:.2f} ثانية.")
                 
             else:
                 status_placeholder.warning("انتهى التحليل دون جمع أي تعليقات.")
                 
         except Exception as e:
             status_placeholder.error(f"❌ خطأ فادح: فشل التشغيل. Error: {e}")
+    
+    st.markdown("---")
+    st.subheader("🗂️ التحليل الجماعي لعدة مواقع (Batch)")
+    
+    batch_configs = st.multiselect("اختر ملفات الإعدادات (موقع لكل ملف):", config_files, default=config_files)
+    col_global, col_site = st.columns(2)
+    with col_global:
+        global_concurrency = st.number_input("ميزانية التزامن الكلية:", min_value=1, value=20, step=1)
+    with col_site:
+        site_concurrency = st.number_input("الحد لكل موقع:", min_value=1, value=int(max_concurrency), step=1)
+    
+    if st.button("▶️ ابدأ التحليل الجماعي", disabled=not batch_configs):
+        with st.spinner(f"جاري تحليل {len(batch_configs)} موقع بالتوازي..."):
+            # داخل Streamlit نستخدم خيوطاً لتحليل الصفحات بدلاً من العمليات
+            from batch_crawl import run_batch_crawl
+            summaries, elapsed = run_batch_crawl(
+                batch_configs, pages_to_scrape, global_concurrency, site_concurrency, use_processes=False,
+                profile=run_profile
+            )
+        batch_df = pd.DataFrame(summaries)
+        sequential_estimate = batch_df['elapsed'].sum()
+        st.success(f"🎉 اكتمل التحليل الجماعي في {elapsed:.1f} ثانية "
+                   f"(مجموع أزمنة المواقع: {sequential_estimate:.1f} ثانية).")
+        st.dataframe(batch_df.rename(columns={
+            'config_path': 'ملف الإعدادات', 'target_site': 'الموقع', 'run_id': 'معرف التحليل',
+            'pages': 'الصفحات', 'reviews': 'المراجعات', 'status': 'الحالة', 'elapsed': 'الزمن (ث)', 'error': 'الخطأ',
+        }), use_container_width=True)
+        load_sentiment_trend.clear()
 
 # ----------------- تبويب تحليل المشاعر -----------------
 with tab_analysis:
@@ -205,10 +304,11 @@ with tab_analysis:
         detailed_df = st.session_state['detailed_data']
 
         # لوحة مقاييس الأداء الرئيسية (KPIs)
-        total_reviews = summary_df['العدد'].sum()
-        positive_pct = summary_df[summary_df['تصنيف المشاعر'].isin(['Positive', 'إيجابي'])]['النسبة المئوية (%)'].sum()
-        negative_count = summary_df[summary_df['تصنيف المشاعر'].isin(['Negative', 'سلبي'])]['العدد'].sum()
-        avg_subjectivity = detailed_df['الموضوعية (0-1)'].mean()
+        kpis = get_session_kpis()
+        total_reviews = kpis['total_reviews']
+        positive_pct = kpis['positive_pct']
+        negative_count = kpis['negative_count']
+        avg_subjectivity = kpis['avg_subjectivity']
         
         col1, col2, col3, col4 = st.columns(4)
         
@@ -273,16 +373,19 @@ with tab_analysis:
                 email_config = st.session_state.get('email_config', {})
                 if email_config.get('sender') and email_config.get('receiver') and email_config.get('password'):
                     with st.spinner("جاري إرسال التنبيه..."):
+                        from email_notifier import send_critical_alerts
                         result = send_critical_alerts(
                             negative_comments,
                             email_config,
                             site_name,
-                            threshold=-0.5
+                            threshold=-0.5,
+                            analysis_run_id=st.session_state.get('analysis_run_id'),
+                            alert_scope=st.session_state.get('analysis_key'),
                         )
                         if result:
                             st.success("✅ تم إرسال التنبيه بنجاح!")
                         else:
-                            st.warning("⚠️ لم يتم العثور على تعليقات سلبية حرجة (أقل من -0.5)")
+                            st.warning("⚠️ لا توجد تعليقات سلبية حرجة جديدة (أقل من -0.5) لم يُرسل عنها تنبيه من قبل")
                 else:
                     st.error("❌ يرجى تكوين إعدادات البريد الإلكتروني في الشريط الجانبي أولاً.")
         else:
@@ -313,6 +416,54 @@ with tab_history:
     # جلب جميع التحليلات
     analysis_runs = get_all_analysis_runs(limit=50)
     
+    # البحث النصي في كل المراجعات المحفوظة
+    st.subheader("🔎 البحث في المراجعات")
+    search_query = st.text_input("كلمات البحث:", key="review_search_query",
+                                 placeholder="مثال: الشحن متأخر")
+    search_col1, search_col2, search_col3 = st.columns([2, 1, 1])
+    with search_col1:
+        search_run_options = {"كل التحليلات": None}
+        for run in analysis_runs or []:
+            search_run_options[f"#{run.id} - {run.target_site}"] = run.id
+        search_run_label = st.selectbox("التحليل:", options=list(search_run_options.keys()), key="review_search_run")
+    with search_col2:
+        search_sentiment = st.selectbox("المشاعر:", options=["الكل", "إيجابي", "سلبي", "محايد"],
+                                        key="review_search_sentiment")
+    with search_col3:
+        search_page = st.number_input("الصفحة:", min_value=1, value=1, step=1, key="review_search_page")
+    
+    if search_query.strip():
+        try:
+            search_result = load_search_results(
+                search_query.strip(),
+                analysis_run_id=search_run_options[search_run_label],
+                sentiment_label=None if search_sentiment == "الكل" else search_sentiment,
+                page=int(search_page),
+            )
+        except Exception as e:
+            st.error(f"تعذر البحث: {e}")
+        else:
+            total_label = f"{search_result['total']}+" if search_result['truncated'] else str(search_result['total'])
+            st.caption(f"{total_label} نتيجة — صفحة {search_result['page']} من {max(search_result['pages'], 1)} "
+                       f"({search_result['elapsed_ms']:.0f} ms)")
+            if search_result['results']:
+                search_df = pd.DataFrame(search_result['results']).rename(columns={
+                    'id': 'رقم المراجعة',
+                    'analysis_run_id': 'رقم التحليل',
+                    'title': 'العنوان',
+                    'review_text': 'نص المراجعة',
+                    'rating': 'التقييم',
+                    'sentiment_label': 'تصنيف المشاعر',
+                    'compound_score': 'شدة السلبية/الإيجابية',
+                    'scraped_at': 'تاريخ الجمع',
+                    'score': 'درجة المطابقة',
+                })
+                st.dataframe(search_df, use_container_width=True, hide_index=True)
+            else:
+                st.info("لا توجد مراجعات مطابقة.")
+    
+    st.markdown("---")
+    
     if analysis_runs:
         st.subheader("اختر تحليلاً سابقاً للعرض:")
         
@@ -401,7 +552,37 @@ with tab_history:
                         st.dataframe(sales_df, use_container_width=True)
                 else:
                     st.warning("لا توجد تعليقات محفوظة لهذا التحليل.")
-                
+
+                # تصدير نتائج التحليل (متدفق من قاعدة البيانات)
+                st.markdown("---")
+                st.subheader("📦 تصدير نتائج التحليل:")
+                export_col1, export_col2 = st.columns(2)
+                with export_col1:
+                    export_kind = st.selectbox("البيانات:", EXPORT_KINDS, key=f"export_kind_{selected_run_id}",
+                                               format_func=lambda k: "التعليقات" if k == 'reviews' else "فرص المبيعات")
+                with export_col2:
+                    export_format = st.selectbox("الصيغة:", EXPORT_FORMATS, key=f"export_format_{selected_run_id}")
+
+                if st.button("📤 تجهيز ملف التصدير", key=f"export_{selected_run_id}"):
+                    if export_format == 'parquet' and not is_parquet_available():
+                        st.warning("⚠️ مكتبة pyarrow غير مثبتة، سيتم التصدير بصيغة CSV.")
+                        export_format = 'csv'
+                    export_name = f"{get_default_export_basename(selected_config)}_run{selected_run_id}_{export_kind}.{export_format}"
+                    # الملف المؤقت يُحذف بعد قراءته؛ download_button يحتفظ بالمحتوى
+                    with tempfile.TemporaryDirectory(prefix='export_') as export_dir:
+                        export_path = os.path.join(export_dir, export_name)
+                        with st.spinner("جاري التصدير..."):
+                            exported_rows = export_run(selected_run_id, export_path, export_kind, export_format)
+                        with open(export_path, 'rb') as export_file:
+                            export_data = export_file.read()
+                    st.download_button(
+                        label=f"📥 تحميل {export_name} ({exported_rows:,} صف)",
+                        data=export_data,
+                        file_name=export_name,
+                        mime='application/octet-stream' if export_format == 'parquet' else 'text/csv',
+                        key=f"download_{selected_run_id}"
+                    )
+
                 # زر الحذف
                 st.markdown("---")
                 if st.button("🗑️ حذف هذا التحليل", key=f"delete_{selected_run_id}"):
@@ -411,32 +592,29 @@ with tab_history:
                     else:
                         st.error("❌ فشل حذف التحليل.")
         
-        # المقارنة الزمنية
+        # المقارنة الزمنية (من جدول التجميع اليومي)
         st.markdown("---")
-        st.subheader("📈 المقارنة الزمنية (آخر 10 تحليلات)")
+        st.subheader("📈 المقارنة الزمنية (الاتجاه اليومي)")
         
-        if len(analysis_runs) >= 2:
-            # إنشاء رسم بياني للاتجاه الزمني
-            trend_data = []
-            for run in analysis_runs[:10]:
-                trend_data.append({
-                    'التاريخ': run.created_at.strftime('%Y-%m-%d'),
-                    'النسبة الإيجابية': run.positive_percentage,
-                    'عدد التعليقات': run.total_reviews,
-                    'ID': run.id
-                })
-            
-            trend_df = pd.DataFrame(trend_data)
-            
+        trend_col1, trend_col2 = st.columns(2)
+        with trend_col1:
+            trend_window = st.selectbox("النافذة الزمنية:", [30, 90, 180, 365], index=3,
+                                        format_func=lambda d: f"آخر {d} يوم", key="trend_window")
+        with trend_col2:
+            trend_site = st.selectbox("الموقع:", ["جميع المواقع"] + load_rollup_sites(), key="trend_site")
+        
+        trend_df = load_sentiment_trend(trend_window, None if trend_site == "جميع المواقع" else trend_site)
+        
+        if len(trend_df) >= 2:
             # رسم بياني خطي للنسبة الإيجابية
             fig_trend = go.Figure()
             fig_trend.add_trace(go.Scatter(
-                x=trend_df['التاريخ'],
-                y=trend_df['النسبة الإيجابية'],
+                x=trend_df['day'],
+                y=trend_df['positive_percentage'],
                 mode='lines+markers',
                 name='النسبة الإيجابية',
                 line=dict(color='#28a745', width=3),
-                marker=dict(size=10)
+                marker=dict(size=6)
             ))
             fig_trend.update_layout(
                 title='اتجاه النسبة الإيجابية عبر الزمن',
@@ -446,18 +624,18 @@ with tab_history:
             )
             st.plotly_chart(fig_trend, use_container_width=True)
             
-            # رسم بياني عمودي لعدد التعليقات
+            # رسم بياني عمودي لعدد التعليقات حسب المشاعر
             fig_count = px.bar(
                 trend_df,
-                x='التاريخ',
-                y='عدد التعليقات',
+                x='day',
+                y=['positive_count', 'neutral_count', 'negative_count'],
                 title='عدد التعليقات المستخلصة عبر الزمن',
-                color='عدد التعليقات',
-                color_continuous_scale='Blues'
+                labels={'day': 'التاريخ', 'value': 'عدد التعليقات', 'variable': 'المشاعر'},
+                color_discrete_map={'positive_count': '#28a745', 'neutral_count': '#ffc107', 'negative_count': '#dc3545'}
             )
             st.plotly_chart(fig_count, use_container_width=True)
         else:
-            st.info("يجب أن يكون لديك تحليلان على الأقل لعرض المقارنة الزمنية.")
+            st.info("يجب أن تتوفر بيانات يومين على الأقل ضمن النافذة لعرض المقارنة الزمنية.")
     
     else:
         st.info("لا توجد تحليلات محفوظة بعد. قم بتشغيل تحليل جديد من تبويب 'التحكم والتشغيل'.")
@@ -518,17 +696,35 @@ with tab_marketing:
             post_content = st.text_area("نص المنشور (يمكنك التعديل):", value=best_comment)
             
             platforms = st.multiselect("اختر المنصات للنشر:", 
-                                       ['facebook', 'twitter', 'linkedin'], 
+                                       list(PLATFORMS), 
                                        default=['facebook'])
             
+            schedule_post = st.checkbox("⏰ جدولة النشر لوقت لاحق")
+            if schedule_post:
+                col_date, col_time = st.columns(2)
+                publish_date = col_date.date_input("تاريخ النشر:", value=datetime.date.today())
+                publish_time = col_time.time_input("وقت النشر:", value=(datetime.datetime.now() + datetime.timedelta(hours=1)).time())
+            
+            scheduler = start_publish_scheduler()
             if st.button("🚀 انشر المحتوى على المنصات المختارة", type="primary"):
                 api_tokens = st.session_state.api_tokens
-                with st.spinner("جاري النشر على الشبكات الاجتماعية..."):
-                    results = publish_to_social_media(post_content, platforms, api_tokens)
-                    
-                    st.success("✅ اكتمل طلب النشر:")
-                    for platform, result in results.items():
-                        st.markdown(f"- **{platform.capitalize()}**: {result}")
+                if schedule_post:
+                    publish_at = datetime.datetime.combine(publish_date, publish_time)
+                    scheduler.schedule(post_content, platforms, publish_at, api_tokens)
+                    st.success(f"✅ تمت جدولة المنشور في {publish_at:%Y-%m-%d %H:%M}")
+                else:
+                    with st.spinner("جاري النشر على الشبكات الاجتماعية..."):
+                        results = publish_to_social_media(post_content, platforms, api_tokens)
+                        
+                        st.success("✅ اكتمل طلب النشر:")
+                        for platform, result in results.items():
+                            st.markdown(f"- **{platform.capitalize()}**: {result['message']} ({result['latency_ms']:.0f} ms)")
+            
+            pending_posts = scheduler.pending()
+            if pending_posts:
+                with st.expander(f"📅 المنشورات المجدولة ({len(pending_posts)})"):
+                    for post_id, publish_at, post_platforms, message in pending_posts:
+                        st.markdown(f"- **{publish_at:%Y-%m-%d %H:%M}** → {', '.join(post_platforms)}: {message[:80]}")
         else:
              st.warning("لا توجد تعليقات إيجابية يمكن استخدامها كمحتوى ترويجي.")
              
@@ -538,14 +734,12 @@ with tab_marketing:
         
         summary_df = st.session_state.get('sentiment_summary', pd.DataFrame())
         if not summary_df.empty:
-            total_reviews = summary_df['العدد'].sum()
-            positive_pct = summary_df[summary_df['تصنيف المشاعر'].isin(['Positive', 'إيجابي'])]['النسبة المئوية (%)'].sum()
-            negative_count = summary_df[summary_df['تصنيف المشاعر'].isin(['Negative', 'سلبي'])]['العدد'].sum()
-            positive_count = summary_df[summary_df['تصنيف المشاعر'].isin(['Positive', 'إيجابي'])]['العدد'].sum()
-            
-            # حساب معامل الصحة (Health Score)
-            health_score = (positive_pct - (negative_count / total_reviews * 100 * 2)) if total_reviews > 0 else 0
-            health_score = max(0, min(100, health_score))
+            # جميع المؤشرات من محرك KPI (تمريرة متجهة واحدة ومخزنة لكل تشغيل)
+            kpis = get_session_kpis()
+            positive_pct = kpis['positive_pct']
+            negative_count = kpis['negative_count']
+            health_score = kpis['health_score']
+            conversion_rate = kpis['conversion_rate']
             
             # مقاييس الأداء
             st.markdown("#### مؤشرات الأداء الرئيسية:")
@@ -554,14 +748,11 @@ with tab_marketing:
                 st.metric("معامل الصحة", f"{health_score:.1f}%", 
                          help="مؤشر شامل لصحة المنتج بناءً على المشاعر")
             with metric_col2:
-                conversion_rate = (positive_count / total_reviews * 100) if total_reviews > 0 else 0
                 st.metric("معدل التحويل المتوقع", f"{conversion_rate:.1f}%")
             with metric_col3:
-                satisfaction_index = (positive_pct + 50 - (negative_count / total_reviews * 100)) / 1.5 if total_reviews > 0 else 50
-                st.metric("مؤشر الرضا", f"{satisfaction_index:.0f}/100")
+                st.metric("مؤشر الرضا", f"{kpis['satisfaction_index']:.0f}/100")
             with metric_col4:
-                recommendation_score = len(sales_opportunities) / total_reviews * 100 if total_reviews > 0 else 0
-                st.metric("معدل التوصية", f"{recommendation_score:.1f}%")
+                st.metric("معدل التوصية", f"{kpis['recommendation_score']:.1f}%")
             
             st.markdown("---")
             
@@ -579,15 +770,16 @@ with tab_marketing:
             with col_results:
                 st.markdown("**النتائج المتوقعة:**")
                 
-                # حسابات
-                expected_clicks = int(current_budget / cost_per_click)
-                expected_conversions = int(expected_clicks * (conversion_rate / 100))
-                expected_revenue = expected_conversions * avg_order_value
-                roi = ((expected_revenue - current_budget) / current_budget * 100) if current_budget > 0 else 0
+                # حسابات (سيناريو واحد من نفس محرك الشبكة)
+                result = evaluate_scenario_grid(conversion_rate, [current_budget], [cost_per_click], [avg_order_value])
+                expected_clicks = int(result['clicks'][0, 0, 0])
+                expected_conversions = int(result['conversions'][0, 0, 0])
+                expected_revenue = float(result['revenue'][0, 0, 0])
+                roi = float(result['roi'][0, 0, 0])
                 
                 st.info(f"🖱️ **النقرات المتوقعة:** {expected_clicks:,}")
                 st.info(f"✅ **التحويلات المتوقعة:** {expected_conversions}")
-                st.info(f"💵 **الإيرادات المتوقعة:** ${expected_revenue:,}")
+                st.info(f"💵 **الإيرادات المتوقعة:** ${expected_revenue:,.0f}")
                 
                 if roi > 0:
                     st.success(f"📈 **العائد على الاستثمار (ROI):** +{roi:.0f}%")
@@ -634,27 +826,15 @@ with tab_marketing:
             st.markdown("---")
             st.markdown("#### 📊 مقارنة السيناريوهات:")
             
-            scenarios = pd.DataFrame({
-                'السيناريو': ['المحافظ', 'المتوازن', 'العدواني'],
-                'الميزانية ($)': [current_budget * 0.7, current_budget, current_budget * 1.5],
-                'التحويلات المتوقعة': [
-                    int(expected_conversions * 0.7),
-                    expected_conversions,
-                    int(expected_conversions * 1.5)
-                ],
-                'الإيرادات المتوقعة ($)': [
-                    int(expected_revenue * 0.7),
-                    expected_revenue,
-                    int(expected_revenue * 1.5)
-                ],
-                'ROI المتوقع (%)': [
-                    roi * 0.9,
-                    roi,
-                    roi * 1.2
-                ]
-            })
+            scenarios = build_scenarios_table(conversion_rate, current_budget, cost_per_click, avg_order_value)
+            st.dataframe(scenarios.round(1), use_container_width=True, hide_index=True)
             
-            st.dataframe(scenarios, use_container_width=True, hide_index=True)
+            # جدول الحساسية: ROI لكل تركيبة ميزانية × تكلفة نقرة (محسوبة دفعة واحدة)
+            st.markdown("#### 🧮 جدول حساسية العائد (ROI %):")
+            sensitivity_budgets = [current_budget * m for m in (0.5, 0.75, 1.0, 1.25, 1.5, 2.0)]
+            sensitivity_cpcs = [cost_per_click * m for m in (0.5, 0.75, 1.0, 1.25, 1.5)]
+            sensitivity_df = build_sensitivity_table(conversion_rate, sensitivity_budgets, sensitivity_cpcs, avg_order_value)
+            st.dataframe(sensitivity_df.round(0), use_container_width=True)
 
     else:
         st.info("قم بتشغيل المحلل أولاً لعرض أدوات التسويق.")
@@ -663,3 +843,34 @@ with tab_marketing:
 with tab_log:
     st.subheader("ملف السجل المباشر (آخر 100 سطر)")
     st.code(get_log_content(), language='log')
+
+    st.markdown("---")
+    st.subheader("🔬 تقارير قياس الأداء (Profiling)")
+    profiles = list_profiles()
+    if not profiles:
+        st.info("لا توجد تقارير بعد. فعّل \"قياس الأداء\" في تبويب التحكم أو شغّل main.py --profile.")
+    else:
+        profile_labels = {
+            p.id: f"#{p.id} | {p.created_at:%Y-%m-%d %H:%M} | {p.mode} | {p.duration_seconds or 0:.1f}ث | "
+                  f"{p.label or ''}{f' (تحليل {p.analysis_run_id})' if p.analysis_run_id else ''}"
+            for p in profiles
+        }
+        selected_profile = st.selectbox("اختر تقريراً:", list(profile_labels), format_func=profile_labels.get)
+        report = load_profile(selected_profile)
+        if report:
+            summary = report['summary']
+            st.markdown("**أكثر الدوال استهلاكاً للوقت:**")
+            st.dataframe(pd.DataFrame(summary.get('top_functions', [])), use_container_width=True)
+            if summary.get('asyncio_tasks'):
+                st.markdown("**توقيت مهام asyncio:**")
+                st.dataframe(pd.DataFrame(summary['asyncio_tasks']), use_container_width=True)
+            col_folded, col_pstats = st.columns(2)
+            with col_folded:
+                if report['folded']:
+                    st.download_button("⬇️ مكدسات مطوية (Flamegraph / speedscope)", report['folded'],
+                                       file_name=f"profile_{selected_profile}.folded", mime="text/plain")
+            with col_pstats:
+                if report['pstats']:
+                    st.download_button("⬇️ ملف cProfile (.prof لـ snakeviz)", report['pstats'],
+                                       file_name=f"profile_{selected_profile}.prof",
+                                       mime="application/octet-stream")
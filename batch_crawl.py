@@ -0,0 +1,279 @@
+# batch_crawl.py - زحف متعدد المواقع من عدة ملفات إعدادات بالتوازي (ميزانية تزامن عامة + حد لكل موقع)
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import aiohttp
+from sqlalchemy import case, func
+
+from config import DEFAULT_GLOBAL_CONCURRENCY, load_config
+from database import SessionLocal
+from models import AnalysisRun, CrawlCheckpoint, Review
+from crawl_checkpoint import CrawlCheckpointer
+from rollups import apply_run_to_rollup
+from notifier import enqueue_run_notification, get_run_stats
+from search import index_run
+from scraper_core import crawl_site, sentiment_label, get_sentiment_analyzer
+from alert_stream import StreamingAlertStage
+from profiling import maybe_profile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SITE_CONCURRENCY = 5      # الحد الأقصى للطلبات المتزامنة لكل موقع
+
+# ----------------- 1. الإعدادات -----------------
+
+def load_site_config(config_path):
+    """قراءة ملف إعدادات موقع واحد (بنفس بنية config.json)."""
+    return load_config(config_path)
+
+def get_site_start_url(config):
+    """رابط البداية: start_url في الإعدادات إن وُجد، وإلا base_url."""
+    return config.get('start_url') or config.get('base_url')
+
+# ----------------- 2. سجلات التشغيل -----------------
+
+def _create_run(target_site, start_url):
+    db = SessionLocal()
+    try:
+        run = AnalysisRun(target_site=target_site, start_url=start_url, status='running',
+                          created_at=datetime.utcnow())
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+def _finalize_run(run_id, target_site):
+    """
+    تحديث سجل التشغيل والتجميع اليومي من المراجعات المحفوظة (بما فيها ما حُفظ قبل أي انقطاع)
+    في معاملة واحدة، ثم حذف نقطة الاستئناف وفهرسة المراجعات للبحث.
+
+    Returns:
+        (عدد الصفحات، عدد المراجعات)
+    """
+    completed_at = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        total, positive, negative, avg_compound = db.query(
+            func.count(Review.id),
+            func.coalesce(func.sum(case((Review.sentiment_label == 'إيجابي', 1), else_=0)), 0),
+            func.coalesce(func.sum(case((Review.sentiment_label == 'سلبي', 1), else_=0)), 0),
+            func.coalesce(func.avg(Review.compound_score), 0.0),
+        ).filter(Review.analysis_run_id == run_id).one()
+        pages = db.query(CrawlCheckpoint.pages_done).filter(CrawlCheckpoint.analysis_run_id == run_id).scalar()
+
+        db.query(AnalysisRun).filter(AnalysisRun.id == run_id).update({
+            'pages_scraped': pages or 0,
+            'total_reviews': total,
+            'positive_count': positive,
+            'negative_count': negative,
+            'neutral_count': total - positive - negative,
+            'positive_percentage': positive / total * 100 if total else 0.0,
+            'avg_compound_score': avg_compound,
+            'completed_at': completed_at,
+            'status': 'completed',
+        })
+        apply_run_to_rollup(db, target_site, completed_at.date(), total, positive, negative,
+                            total - positive - negative, avg_compound)
+        run = db.query(AnalysisRun).filter(AnalysisRun.id == run_id).first()
+        enqueue_run_notification(db, run, is_success=True, stats=get_run_stats(db, run_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    CrawlCheckpointer.delete(run_id)
+    index_run(run_id)
+    return pages or 0, total
+
+def _fail_run(run_id, error_message):
+    db = SessionLocal()
+    try:
+        run = db.query(AnalysisRun).filter(AnalysisRun.id == run_id).first()
+        if run is not None:
+            run.status = 'failed'
+            enqueue_run_notification(db, run, is_success=False, error_message=error_message)
+            db.commit()
+    except Exception as e:
+        logger.error(f"Failed to mark run {run_id} as failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+# ----------------- 3. التنسيق -----------------
+
+async def _crawl_and_finalize(session, run_id, target_site, config, start_url, pages_to_scrape,
+                              site_concurrency, executor, global_limit, resume_state=None):
+    """زحف موقع واحد مع نقاط استئناف دورية، ثم إنهاء التشغيل. ترجع (عدد الصفحات، عدد المراجعات)."""
+    loop = asyncio.get_running_loop()
+    alert_stage = StreamingAlertStage.from_config(config, analysis_run_id=run_id)
+    checkpointer = CrawlCheckpointer(run_id, sentiment_label)
+    await crawl_site(
+        session, start_url, pages_to_scrape, site_concurrency, config=config,
+        executor=executor, global_limit=global_limit, alert_stage=alert_stage,
+        log_prefix=f"[{target_site}] ", checkpointer=checkpointer, resume_state=resume_state,
+    )
+    if alert_stage:
+        await loop.run_in_executor(None, alert_stage.close)
+    if checkpointer.duplicates:
+        logger.info(f"🔁 [{target_site}] {checkpointer.duplicates} duplicate reviews linked to their originals")
+    return await loop.run_in_executor(None, _finalize_run, run_id, target_site)
+
+def _new_summary(config_path=None):
+    return {'config_path': config_path, 'target_site': None, 'run_id': None, 'pages': 0, 'reviews': 0,
+            'status': 'failed', 'elapsed': 0.0, 'error': None}
+
+async def _crawl_new_site(session, summary, config, target_site, start_url, pages_to_scrape,
+                          site_concurrency, executor, global_limit):
+    """إنشاء سجل التشغيل ونقطة استئنافه ثم الزحف والإنهاء؛ يملأ summary ويرجعه."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    summary['target_site'] = target_site
+    try:
+        if not start_url:
+            raise ValueError("config has no start_url/base_url")
+
+        run_id = await loop.run_in_executor(None, _create_run, target_site, start_url)
+        summary['run_id'] = run_id
+        await loop.run_in_executor(None, CrawlCheckpointer.create, run_id, config, start_url,
+                                   pages_to_scrape, site_concurrency)
+
+        summary['pages'], summary['reviews'] = await _crawl_and_finalize(
+            session, run_id, target_site, config, start_url, pages_to_scrape, site_concurrency,
+            executor, global_limit,
+        )
+        summary['status'] = 'completed'
+    except Exception as e:
+        summary['error'] = str(e)
+        logger.error(f"Crawl failed for {summary['config_path'] or start_url}: {e}")
+        if summary['run_id'] is not None:
+            await loop.run_in_executor(None, _fail_run, summary['run_id'], str(e))
+    summary['elapsed'] = time.perf_counter() - started
+    return summary
+
+async def crawl_sites_async(config_paths, pages_to_scrape, global_concurrency=DEFAULT_GLOBAL_CONCURRENCY,
+                            site_concurrency=DEFAULT_SITE_CONCURRENCY, executor=None):
+    """
+    زحف جميع المواقع بالتوازي عبر جلسة aiohttp واحدة (تجمع اتصالات مشترك)
+    ومنفذ واحد لتحليل الصفحات. لكل موقع سجل AnalysisRun خاص به.
+
+    Returns:
+        قائمة dict لكل موقع: config_path, target_site, run_id, pages, reviews, status, elapsed, error
+    """
+    global_limit = asyncio.Semaphore(global_concurrency)
+    connector = aiohttp.TCPConnector(limit=global_concurrency, limit_per_host=site_concurrency)
+
+    async def crawl_one(session, config_path):
+        summary = _new_summary(config_path)
+        try:
+            config = load_site_config(config_path)
+        except Exception as e:
+            summary['error'] = str(e)
+            logger.error(f"Batch crawl failed for {config_path}: {e}")
+            return summary
+        target_site = config.get('target_site_name') or config.get('base_url') or config_path
+        return await _crawl_new_site(session, summary, config, target_site, get_site_start_url(config),
+                                     pages_to_scrape, site_concurrency, executor, global_limit)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*(crawl_one(session, path) for path in config_paths))
+
+def run_batch_crawl(config_paths, pages_to_scrape, global_concurrency=DEFAULT_GLOBAL_CONCURRENCY,
+                    site_concurrency=DEFAULT_SITE_CONCURRENCY, use_processes=True, cpu_workers=None, profile=None):
+    """
+    نقطة الدخول المتزامنة (سطر الأوامر ولوحة التحكم).
+
+    Args:
+        use_processes: تحليل الصفحات في ProcessPoolExecutor (يتجاوز GIL)؛
+                       False يستخدم خيوطاً (أنسب داخل Streamlit)
+        profile: وضع قياس اختياري ('sampling' أو 'cprofile')؛ التقرير يُحفظ في run_profiles
+
+    Returns:
+        (قائمة ملخصات المواقع، الزمن الكلي بالثواني)
+    """
+    cpu_workers = cpu_workers or os.cpu_count() or 2
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    get_sentiment_analyzer()  # خطأ واضح قبل الزحف إن غاب المعجم؛ العمليات المتفرعة ترث نفس mmap
+    started = time.perf_counter()
+    with maybe_profile(profile, label=f"batch {len(config_paths)} sites"), \
+            executor_cls(max_workers=cpu_workers) as executor:
+        summaries = asyncio.run(crawl_sites_async(
+            config_paths, pages_to_scrape, global_concurrency, site_concurrency, executor
+        ))
+    elapsed = time.perf_counter() - started
+    completed = sum(1 for s in summaries if s['status'] == 'completed')
+    logger.info(f"✅ Batch crawl finished: {completed}/{len(summaries)} sites in {elapsed:.1f}s "
+                f"(sum of per-site times: {sum(s['elapsed'] for s in summaries):.1f}s)")
+    return summaries, elapsed
+
+def crawl_single_site(config, start_url, pages_to_scrape, concurrency=DEFAULT_SITE_CONCURRENCY,
+                      use_processes=False, cpu_workers=None):
+    """
+    زحف موقع واحد بإعدادات في الذاكرة (main.py --url): نفس مسار الزحف المتعدد (سجل AnalysisRun،
+    مراجعة لكل صف، نقاط استئناف، تنبيهات). الافتراضي خيوط لأن الصفحات قليلة غالباً.
+
+    Returns:
+        dict بنفس مفاتيح ملخصات run_batch_crawl
+    """
+    target_site = config.get('target_site_name') or config.get('base_url') or start_url
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    get_sentiment_analyzer()
+
+    async def crawl():
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await _crawl_new_site(session, _new_summary(), config, target_site, start_url,
+                                         pages_to_scrape, concurrency, executor, None)
+
+    with executor_cls(max_workers=cpu_workers or os.cpu_count() or 2) as executor:
+        return asyncio.run(crawl())
+
+def resume_crawl(run_id, global_concurrency=DEFAULT_GLOBAL_CONCURRENCY, use_processes=True, cpu_workers=None):
+    """
+    استئناف تشغيل انقطع من آخر نقطة استئناف: الصفحات المحفوظة لا يُعاد زحفها،
+    ويكمل الزحف من الروابط المتبقية بنفس إعدادات الموقع وحدود التشغيل الأصلية.
+
+    Returns:
+        عدد الصفحات الإجمالي للتشغيل بعد الإكمال
+    """
+    state = CrawlCheckpointer.load(run_id)
+    if state is None:
+        raise ValueError(f"No crawl checkpoint found for run {run_id}")
+
+    db = SessionLocal()
+    try:
+        run = db.query(AnalysisRun).filter(AnalysisRun.id == run_id).first()
+        if run is None:
+            raise ValueError(f"Analysis run {run_id} does not exist")
+        target_site = run.target_site
+        run.status = 'running'
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info(f"🔁 Resuming run {run_id}: {state['pages_done']}/{state['pages_to_scrape']} pages done, "
+                f"{len(state['frontier'])} URLs in frontier")
+
+    async def resume():
+        connector = aiohttp.TCPConnector(limit=global_concurrency, limit_per_host=state['concurrency'])
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await _crawl_and_finalize(
+                session, run_id, target_site, state['config'], state['start_url'], state['pages_to_scrape'],
+                state['concurrency'], executor, asyncio.Semaphore(global_concurrency), resume_state=state,
+            )
+
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    get_sentiment_analyzer()
+    with executor_cls(max_workers=cpu_workers or os.cpu_count() or 2) as executor:
+        try:
+            pages, _ = asyncio.run(resume())
+            return pages
+        except Exception as e:
+            _fail_run(run_id, str(e))
+            raise
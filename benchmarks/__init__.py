@@ -0,0 +1 @@
+# benchmarks - أدوات قياس الأداء (تُشغل من جذر المشروع: python -m benchmarks.<module>)
@@ -0,0 +1,40 @@
+# benchmarks/corpus.py - مولّد مراجعات اصطناعية واقعية (عربي/إنجليزي) لقياس الأداء
+
+import random
+
+ENGLISH_PHRASES = (
+    "The story was gripping and beautifully written, highly recommended.",
+    "Arrived late and the cover was damaged, very disappointing.",
+    "Decent book for the price, nothing special.",
+    "I wish there was a hardcover edition, the paperback feels cheap.",
+    "Customer service never answered my emails, terrible experience.",
+    "Great value, fast shipping and excellent packaging.",
+)
+ARABIC_PHRASES = (
+    "الكتاب رائع والترجمة ممتازة، أنصح به بشدة.",
+    "وصل الطلب متأخراً والتغليف سيئ جداً.",
+    "أتمنى لو كان هناك نسخة صوتية من هذا الكتاب.",
+    "محتوى متوسط لكن السعر مناسب.",
+    "المنتج يحتاج إلى تحسين في الجودة، لن أشتري مرة أخرى.",
+    "خدمة العملاء ممتازة والتوصيل سريع.",
+)
+
+def review_text(rng, arabic_ratio=0.5, min_phrases=1, max_phrases=3):
+    """نص مراجعة واحد من 1-3 جمل (عربية بنسبة arabic_ratio)."""
+    phrases = ARABIC_PHRASES if rng.random() < arabic_ratio else ENGLISH_PHRASES
+    return " ".join(rng.choice(phrases) for _ in range(rng.randint(min_phrases, max_phrases)))
+
+def text_of_length(length, seed=0, arabic_ratio=0.5):
+    """نص بطول length حرفاً تقريباً (لقياس التدرج مع حجم المدخل)."""
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < length:
+        part = review_text(rng, arabic_ratio)
+        parts.append(part)
+        size += len(part) + 1
+    return " ".join(parts)[:length]
+
+def make_reviews(n, seed=0, arabic_ratio=0.5):
+    """قائمة (review_text, title, rating) بحجم n."""
+    rng = random.Random(seed)
+    return [(review_text(rng, arabic_ratio), f"Book {i % 500}", str(rng.randint(1, 5))) for i in range(n)]
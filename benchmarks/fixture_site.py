@@ -0,0 +1,166 @@
+# benchmarks/fixture_site.py - موقع كتالوج محلي (aiohttp) بشكل books.toscrape.com لقياس الزاحف
+
+import asyncio
+import json
+import os
+import random
+import threading
+from html import escape
+
+from aiohttp import web
+
+from benchmarks.corpus import review_text
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+
+_RATINGS = ('One', 'Two', 'Three', 'Four', 'Five')
+
+def render_catalogue_page(page, pages, items_per_page, seed=42, page_bytes=0):
+    """
+    صفحة كتالوج بنفس بنية books.toscrape.com ومُحدّدات config.json
+    (article.product_pod, h3 a, p.text-muted, p.star-rating, li.next a).
+    page_bytes: حشو HTML حتى يصل حجم الصفحة إلى هذا الحد تقريباً.
+    """
+    rng = random.Random(seed * 100_003 + page)
+    items = []
+    for i in range(items_per_page):
+        title = f"Book {page}-{i}: {rng.choice(('A Light in the Attic', 'Sapiens', 'ألف ليلة وليلة', 'The Black Maria'))}"
+        items.append(
+            '<li class="col-xs-6 col-sm-4 col-md-3 col-lg-3"><article class="product_pod">'
+            f'<div class="image_container"><a href="book-{page}-{i}/index.html"><img src="cover.jpg" alt="{escape(title)}"></a></div>'
+            f'<p class="star-rating {rng.choice(_RATINGS)}"><i class="icon-star"></i></p>'
+            f'<h3><a href="book-{page}-{i}/index.html" title="{escape(title)}">{escape(title[:30])}...</a></h3>'
+            f'<div class="product_price"><p class="price_color">£{rng.uniform(10, 60):.2f}</p>'
+            '<p class="instock availability"><i class="icon-ok"></i> In stock</p></div>'
+            f'<p class="text-muted">{escape(review_text(rng))}</p>'
+            '</article></li>'
+        )
+    pager = f'<li class="current">Page {page} of {pages}</li>'
+    if page > 1:
+        pager += f'<li class="previous"><a href="page-{page - 1}.html">previous</a></li>'
+    if page < pages:
+        pager += f'<li class="next"><a href="page-{page + 1}.html">next</a></li>'
+    html = (
+        '<!DOCTYPE html><html lang="en-us"><head><title>All products | Books to Scrape - Sandbox</title>'
+        '<style>.product_pod{display:block}</style><script>var page = %d;</script></head><body>'
+        '<div class="page_inner"><section><ol class="row">%s</ol>'
+        '<div><ul class="pager">%s</ul></div></section></div></body></html>'
+    ) % (page, ''.join(items), pager)
+    if page_bytes > len(html):
+        html = html.replace('</body>', f'<div hidden>{"x" * (page_bytes - len(html))}</div></body>')
+    return html
+
+class FixtureSite:
+    """
+    خادم كتالوج محلي في خيط خلفي، مع زمن استجابة وأخطاء وحجم صفحات قابلة للضبط.
+
+    Args:
+        latency_ms / jitter_ms: زمن الاستجابة لكل صفحة (متوسط ± تذبذب منتظم)
+        error_rate: نسبة الطلبات التي ترجع HTTP 500
+        page_bytes: حجم الصفحة التقريبي (0 = بدون حشو)
+    """
+
+    def __init__(self, pages=50, items_per_page=20, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0,
+                 page_bytes=0, seed=42, host='127.0.0.1', port=0):
+        self.pages = pages
+        self.items_per_page = items_per_page
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.page_bytes = page_bytes
+        self.seed = seed
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def start_url(self):
+        return f"{self.base_url}/catalogue/page-1.html"
+
+    @property
+    def page_url_template(self):
+        return f"{self.base_url}/catalogue/page-{{page}}.html"
+
+    def params(self):
+        return {'pages': self.pages, 'items_per_page': self.items_per_page, 'latency_ms': self.latency_ms,
+                'jitter_ms': self.jitter_ms, 'error_rate': self.error_rate, 'page_bytes': self.page_bytes,
+                'seed': self.seed}
+
+    def site_config(self, use_page_template=True):
+        """إعدادات موقع (بنية config.json) موجهة إلى الخادم المحلي."""
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        config.update({'base_url': self.base_url, 'start_url': self.start_url,
+                       'target_site_name': 'Fixture Catalogue', 'alerts': {'enabled': False}})
+        if use_page_template:
+            config['page_url_template'] = self.page_url_template
+        else:
+            config.pop('page_url_template', None)
+        return config
+
+    async def _handle_page(self, request):
+        page = int(request.match_info['page'])
+        self.requests += 1
+        delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if page < 1 or page > self.pages:
+            raise web.HTTPNotFound()
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            raise web.HTTPInternalServerError()
+        return web.Response(text=render_catalogue_page(page, self.pages, self.items_per_page, self.seed,
+                                                       self.page_bytes), content_type='text/html')
+
+    def start(self):
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            app = web.Application()
+            app.router.add_get('/catalogue/page-{page:\\d+}.html', self._handle_page)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            self._loop.run_until_complete(site.start())
+            self.port = self._runner.addresses[0][1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name='fixture-site', daemon=True)
+        self._thread.start()
+        started.wait(10)
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    import time
+    with FixtureSite(pages=5, latency_ms=0) as site:
+        print(f"Serving {site.pages} pages at {site.start_url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,239 @@
+# benchmarks/micro_bench.py - قياس دوال المعالجة لكل مراجعة/صفحة مع حد تراجع قابل للضبط
+#
+# python -m benchmarks.micro_bench --save-baseline          # حفظ خط الأساس
+# python -m benchmarks.micro_bench --threshold 0.25         # يفشل (exit 1) إذا تباطأت أي حالة > 25%
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+
+from benchmarks.corpus import make_reviews, text_of_length
+from benchmarks.fixture_site import render_catalogue_page, CONFIG_PATH
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'results', 'micro_baseline.json')
+DEFAULT_THRESHOLD = float(os.getenv("MICROBENCH_THRESHOLD", "0.25"))  # تباطؤ مسموح (25%)
+
+TEXT_SIZES = (100, 1_000, 10_000)       # أطوال النصوص بالأحرف
+PAGE_SIZES = (20, 100)                  # عدد المنتجات في صفحة الكتالوج
+BATCH_SIZES = (100, 1_000, 10_000)      # عدد الصفوف في الإدراج المجمّع
+
+# ----------------- 1. ملفات HTML المحفوظة -----------------
+
+def fixture_path(items):
+    return os.path.join(FIXTURES_DIR, f"catalogue_{items}.html")
+
+def write_fixtures():
+    """إعادة توليد صفحات الكتالوج المحفوظة (حتمية: نفس البذرة ⇒ نفس المحتوى)."""
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for items in PAGE_SIZES:
+        with open(fixture_path(items), 'w', encoding='utf-8') as f:
+            f.write(render_catalogue_page(2, 50, items))
+
+def load_fixture(items):
+    with open(fixture_path(items), 'r', encoding='utf-8') as f:
+        return f.read()
+
+# ----------------- 2. الحالات -----------------
+# كل حالة: (الاسم، الأحجام، setup(size) -> دالة بلا معاملات تُقاس، أو (الدالة، reset) إذا كان
+# كل استدعاء يغيّر حالة يجب إرجاعها قبل الاستدعاء التالي؛ reset لا يدخل في الزمن المقاس)
+
+PAGE_URL = "http://books.toscrape.com/catalogue/page-2.html"
+
+def _extract_text(size):
+    from scraper_core import extract_text
+    html = load_fixture(size)
+    return lambda: extract_text(html)
+
+def _extract_reviews(size):
+    from scraper_core import extract_reviews
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+        selectors = json.load(f)['selectors']
+    html = load_fixture(size)
+    return lambda: extract_reviews(html, PAGE_URL, selectors)
+
+def _get_next_page_url(size):
+    from scraper_core import get_next_page_url
+    html = load_fixture(size)
+    return lambda: get_next_page_url(html, PAGE_URL)
+
+def _vader_sentiment(size):
+    from scraper_core import analyze_sentiment
+    text = text_of_length(size)
+    return lambda: analyze_sentiment(text)
+
+def _textblob_sentiment(size):
+    from analyzer import analyze_sentiment
+    text = text_of_length(size)
+    return lambda: analyze_sentiment(text)
+
+def _fingerprint(size):
+    from text_dedup import fingerprint
+    text = text_of_length(size)
+    return lambda: fingerprint(text)
+
+def _find_sales_intent(size):
+    from analyzer import find_sales_intent
+    text = text_of_length(size)
+    return lambda: find_sales_intent(text)
+
+def _bulk_insert(size):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    import models  # noqa: F401  تسجيل الجداول في Base.metadata
+    from review_batch import ReviewBatch
+
+    # قاعدة SQLite مؤقتة مستقلة عن DATABASE_URL (لا تُلمس بيانات حقيقية)، تُحذف مع الحالة
+    tmp_dir = tempfile.TemporaryDirectory(prefix='microbench_')
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir.name, 'bench.db')}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    batch = ReviewBatch(analysis_run_id=1)
+    for i, (text, title, rating) in enumerate(make_reviews(size)):
+        batch.append(text, title=title, rating=rating)
+        batch.set_scores(i, 'إيجابي' if i % 3 else 'سلبي', 0.4, 0.5, 'ar',
+                         'طلب ميزة/تحسين' if i % 20 == 0 else None)
+
+    def run():
+        db = Session()
+        try:
+            batch.bulk_insert(db)
+            db.commit()
+        finally:
+            db.close()
+
+    def reset():
+        # كل إدراج يبدأ من جداول فارغة (وإلا يُقاس الإدراج في جدول يكبر مع كل تكرار)
+        with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+        reset.tmp_dir = tmp_dir  # إبقاء المجلد المؤقت حياً ما دامت الحالة مستخدمة
+
+    reset()
+    return run, reset
+
+CASES = (
+    ('extract_text', PAGE_SIZES, _extract_text),
+    ('extract_reviews', PAGE_SIZES, _extract_reviews),
+    ('get_next_page_url', PAGE_SIZES, _get_next_page_url),
+    ('vader.analyze_sentiment', TEXT_SIZES, _vader_sentiment),
+    ('textblob.analyze_sentiment', TEXT_SIZES, _textblob_sentiment),
+    ('find_sales_intent', TEXT_SIZES, _find_sales_intent),
+    ('text_dedup.fingerprint', TEXT_SIZES, _fingerprint),
+    ('ReviewBatch.bulk_insert', BATCH_SIZES, _bulk_insert),
+)
+
+# ----------------- 3. القياس -----------------
+
+def time_per_call(fn, repeat=5, reset=None):
+    """أفضل زمن للاستدعاء الواحد (ثوانٍ) من repeat جولات، كل جولة ≥ 0.2 ثانية."""
+    if reset is None:
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()
+        return min(timer.repeat(repeat=repeat, number=number)) / number
+
+    # مع reset: يُقاس كل استدعاء وحده بعد إرجاع الحالة
+    best = math.inf
+    for _ in range(repeat):
+        elapsed, calls = 0.0, 0
+        while elapsed < 0.2:
+            reset()
+            started = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - started
+            calls += 1
+        best = min(best, elapsed / calls)
+    return best
+
+def scaling_exponent(points):
+    """ميل log(زمن)/log(حجم) بين أصغر وأكبر حجم: ~1 خطي، ~0 ثابت، >1 أسوأ من خطي."""
+    (s0, t0), (s1, t1) = points[0], points[-1]
+    return math.log(t1 / t0) / math.log(s1 / s0) if len(points) > 1 and t0 > 0 else None
+
+def run_cases(name_filter=None, repeat=5):
+    results = {}
+    for name, sizes, setup in CASES:
+        if name_filter and name_filter not in name:
+            continue
+        points = []
+        for size in sizes:
+            case = setup(size)
+            fn, reset = case if isinstance(case, tuple) else (case, None)
+            seconds = time_per_call(fn, repeat, reset)
+            results[f"{name}[{size}]"] = seconds
+            points.append((size, seconds))
+            print(f"{name:<28} size={size:<6} {seconds * 1e6:12.1f} µs/call {seconds / size * 1e9:10.0f} ns/item")
+        exponent = scaling_exponent(points)
+        if exponent is not None:
+            print(f"{'':<28} scaling ~ size^{exponent:.2f}")
+    return results
+
+def find_regressions(results, baseline, threshold):
+    """الحالات التي تجاوز فيها الزمن خط الأساس بأكثر من threshold: [(key, old, new, ratio)]"""
+    regressions = []
+    for key, seconds in results.items():
+        old = baseline.get(key)
+        if old and seconds / old > 1 + threshold:
+            regressions.append((key, old, seconds, seconds / old))
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the per-review/per-page hot functions.")
+    parser.add_argument('--filter', default=None, help="only run cases whose name contains this text")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed slowdown vs baseline before failing (default: {DEFAULT_THRESHOLD * 100:.0f}%%)")
+    parser.add_argument('--regenerate-fixtures', action='store_true')
+    args = parser.parse_args(argv)
+
+    # analyzer يستورد database: قاعدة في الذاكرة حتى لا تحتاج الحالات تعريف قاعدة الإنتاج ولا تلمسها
+    os.environ['DATABASE_URL'] = 'sqlite://'
+
+    if args.regenerate_fixtures or not all(os.path.exists(fixture_path(n)) for n in PAGE_SIZES):
+        write_fixtures()
+
+    results = run_cases(args.filter, args.repeat)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'commit': _git_commit(), 'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+                       'results': results}, f, indent=2)
+        print(f"\nSaved baseline {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline first.")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline['results'], args.threshold)
+    if not regressions:
+        print(f"\n✅ No regressions beyond {args.threshold:.0%} vs baseline {baseline['commit']}")
+        return 0
+    print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%} vs baseline {baseline['commit']}:")
+    for key, old, new, ratio in regressions:
+        print(f"  {key:<36} {old * 1e6:10.1f} -> {new * 1e6:10.1f} µs/call ({ratio:.2f}x)")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
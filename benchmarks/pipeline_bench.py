@@ -0,0 +1,199 @@
+# benchmarks/pipeline_bench.py - قياس الزاحف وخط التحليل من البداية للنهاية مقابل موقع محلي
+#
+# python -m benchmarks.pipeline_bench --pages 50 --latency-ms 50 --compare benchmarks/results/<old>.json
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+from benchmarks.fixture_site import FixtureSite
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SCENARIOS = ('crawler', 'analyzer')
+
+# ----------------- 1. القياس داخل عملية فرعية -----------------
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024  # macOS بالبايت، Linux بالكيلوبايت
+
+def _instrument_fetch(latencies):
+    """تسجيل زمن كل طلب صفحة من جهة العميل (scraper_core.fetch_page)."""
+    import scraper_core
+    fetch_page = scraper_core.fetch_page
+
+    async def timed_fetch_page(session, url):
+        started = time.perf_counter()
+        html_content = await fetch_page(session, url)
+        latencies.append(((time.perf_counter() - started) * 1000, html_content is not None))
+        return html_content
+
+    scraper_core.fetch_page = timed_fetch_page
+
+def _run_crawler(site_config, pages, concurrency, db_url):
+    import scraper_core
+    summary = scraper_core.run_scraper_and_analysis(db_url, site_config['start_url'], pages, concurrency)
+    return summary['reviews']
+
+def _run_analyzer(site_config, pages, concurrency, db_url):
+    from database import SessionLocal
+    from models import AnalysisRun
+    import analyzer
+
+    db = SessionLocal()
+    try:
+        run = AnalysisRun(target_site=site_config['target_site_name'], start_url=site_config['start_url'],
+                          status='pending', created_at=datetime.utcnow())
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+        db.expunge(run)
+    finally:
+        db.close()
+    analyzer.process_analysis_run(run, site_config, max_pages=pages, concurrency=concurrency)
+
+    db = SessionLocal()
+    try:
+        return db.query(AnalysisRun.total_reviews).filter(AnalysisRun.id == run.id).scalar() or 0
+    finally:
+        db.close()
+
+def run_scenario(name, site_config, pages, concurrency, db_url, config_path):
+    """
+    تشغيل سيناريو واحد في عملية نظيفة (تُستدعى عبر ProcessPoolExecutor حتى تكون ذروة RSS خاصة به).
+
+    Returns:
+        dict: elapsed_s, pages, pages_per_sec, reviews, reviews_per_sec, fetch_errors,
+        latency_p50_ms, latency_p95_ms, peak_rss_mb
+    """
+    os.environ['DATABASE_URL'] = db_url
+    os.environ['SCRAPER_CONFIG'] = config_path  # load_config() في الزاحف يقرأ إعدادات الموقع المحلي
+    os.environ['CRAWL_STATE_DIR'] = os.path.dirname(config_path)  # مخازن الروابط المزارة في المجلد المؤقت
+    from database import Base, engine
+    import models  # noqa: F401 - تسجيل الجداول
+    Base.metadata.create_all(engine)
+
+    latencies = []
+    _instrument_fetch(latencies)
+    runner = {'crawler': _run_crawler, 'analyzer': _run_analyzer}[name]
+
+    started = time.perf_counter()
+    reviews = runner(site_config, pages, concurrency, db_url)
+    elapsed = time.perf_counter() - started
+
+    fetched = sum(1 for _, ok in latencies if ok)
+    times = [ms for ms, _ in latencies]
+    return {
+        'elapsed_s': elapsed,
+        'pages': fetched,
+        'pages_per_sec': fetched / elapsed if elapsed else 0.0,
+        'reviews': reviews,
+        'reviews_per_sec': reviews / elapsed if reviews is not None and elapsed else None,
+        'fetch_errors': len(latencies) - fetched,
+        'latency_p50_ms': _percentile(times, 50),
+        'latency_p95_ms': _percentile(times, 95),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+# ----------------- 2. التقرير والمقارنة -----------------
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def _fmt(value, width):
+    return f"{'-':>{width}}" if value is None else f"{value:{width}.1f}"
+
+def print_report(results, baseline=None):
+    print(f"\ncommit {results['commit']}  fixture {results['fixture']}")
+    header = f"{'scenario':<10} {'pages/s':>9} {'reviews/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'errors':>7}"
+    print(header)
+    print('-' * len(header))
+    for name, m in results['scenarios'].items():
+        print(f"{name:<10} {_fmt(m['pages_per_sec'], 9)} {_fmt(m['reviews_per_sec'], 10)} "
+              f"{_fmt(m['latency_p50_ms'], 8)} {_fmt(m['latency_p95_ms'], 8)} "
+              f"{_fmt(m['peak_rss_mb'], 8)} {m['fetch_errors']:>7}")
+        old = (baseline or {}).get('scenarios', {}).get(name)
+        if old:
+            deltas = []
+            for key in ('pages_per_sec', 'reviews_per_sec', 'latency_p95_ms', 'peak_rss_mb'):
+                if m.get(key) and old.get(key):
+                    deltas.append(f"{key} {(m[key] - old[key]) / old[key] * 100:+.1f}%")
+            print(f"{'':<10} vs {baseline['commit']}: " + ', '.join(deltas))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end crawler/analyzer benchmark against a local fixture site.")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--items-per-page', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--page-bytes', type=int, default=0)
+    parser.add_argument('--no-page-template', action='store_true',
+                        help="follow next-page links instead of fetching page_url_template URLs concurrently")
+    parser.add_argument('--db-url', default=None,
+                        help="database for the run (default: a fresh temporary SQLite file per scenario)")
+    parser.add_argument('--output', default=None, help="results JSON path (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument('--compare', default=None, help="previous results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    site = FixtureSite(pages=args.pages, items_per_page=args.items_per_page, latency_ms=args.latency_ms,
+                       jitter_ms=args.jitter_ms, error_rate=args.error_rate, page_bytes=args.page_bytes)
+    results = {
+        'commit': _git_commit(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'fixture': site.params(),
+        'concurrency': args.concurrency,
+        'page_template': not args.no_page_template,
+        'scenarios': {},
+    }
+
+    with site, tempfile.TemporaryDirectory(prefix='bench_db_') as db_dir:
+        site_config = site.site_config(use_page_template=not args.no_page_template)
+        config_path = os.path.join(db_dir, 'config.json')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(site_config, f, ensure_ascii=False)
+        for name in args.scenarios:
+            # قاعدة مستقلة لكل سيناريو: وإلا يجد المحلل مراجعات الزاحف في فهرس إزالة التكرار ولا يحلل شيئاً
+            db_url = args.db_url or f"sqlite:///{os.path.join(db_dir, f'bench_{name}.db')}"
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                results['scenarios'][name] = pool.submit(
+                    run_scenario, name, site_config, args.pages, args.concurrency, db_url, config_path
+                ).result()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}-{datetime.utcnow():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"\nSaved {output}")
+    return results
+
+if __name__ == "__main__":
+    main()
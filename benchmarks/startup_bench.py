@@ -0,0 +1,165 @@
+# benchmarks/startup_bench.py - زمن الإقلاع البارد لأوامر main.py ولوحة Streamlit مع ميزانية للاستيراد
+#
+# python -m benchmarks.startup_bench                     # يفشل (exit 1) إذا تجاوز هدف ميزانيته أو استورد وحدة ثقيلة
+# python -m benchmarks.startup_bench --budget "main.py --help=400" --repeat 10
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# تشغيل app.py مرة واحدة كما يفعل Streamlit عند أول زيارة (بدون خادم أو متصفح)
+APP_FIRST_RUN = """
+import os, sys
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file('app.py', default_timeout=120).run()
+if at.exception:
+    print(at.exception[0].message, file=sys.stderr)
+sys.stdout.flush(); sys.stderr.flush()
+os._exit(1 if at.exception else 0)  # دون انتظار خيوط الخلفية (موزّع الإشعارات)
+"""
+
+# الوحدات التي لا يجب أن تُستورد عند الإقلاع (تُحمَّل عند أول استخدام فقط).
+# plotly ليست ضمنها للوحة: streamlit نفسه يستوردها عند توفرها (configure_streamlit_plotly_theme).
+LAZY_MODULES = ('nltk', 'textblob')
+CLI_LAZY_MODULES = LAZY_MODULES + ('aiohttp', 'bs4', 'sqlalchemy', 'pandas', 'plotly', 'streamlit')
+
+# (الاسم، معاملات python، الوحدات الممنوعة، الميزانية بالمللي ثانية للوسيط)
+TARGETS = (
+    ('python', ['-c', 'pass'], (), 100),
+    ('main.py --help', ['main.py', '--help'], CLI_LAZY_MODULES, 300),
+    ('import scraper_core', ['-c', 'import scraper_core'], LAZY_MODULES + ('pandas', 'plotly', 'streamlit'), 900),
+    ('import analyzer', ['-c', 'import analyzer'], LAZY_MODULES + ('pandas', 'plotly', 'streamlit'), 1200),
+    ('app (first run)', ['-c', APP_FIRST_RUN], LAZY_MODULES + ('aiohttp', 'bs4'), 4000),
+)
+
+# ----------------- 1. القياس -----------------
+
+def _run(args, env):
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, *args], cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    return time.perf_counter() - started, proc
+
+def parse_importtime(stderr):
+    """
+    مخرجات python -X importtime -> (الوحدات المستوردة، الزمن الذاتي لكل حزمة عليا بالثواني).
+    السطر: "import time: self [us] | cumulative | <مسافات حسب العمق>name"
+    """
+    modules, by_package = set(), Counter()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[0].split(':')[1].strip().isdigit():
+            continue  # سطر العناوين
+        name = parts[2].strip()
+        modules.add(name)
+        by_package[name.split('.')[0]] += int(parts[0].split(':')[1]) / 1e6
+    return modules, by_package
+
+def measure_target(args, env, repeat=5):
+    """
+    Returns:
+        dict: median_ms, min_ms, max_ms, returncode, error, modules (set), top_packages [(package, ms)]
+    """
+    times, proc = [], None
+    for _ in range(repeat):
+        elapsed, proc = _run(args, env)
+        times.append(elapsed * 1000)
+    _, traced = _run(['-X', 'importtime', *args], env)
+    modules, by_package = parse_importtime(traced.stderr)
+    error = None
+    if proc.returncode != 0:
+        lines = [line for line in proc.stderr.strip().splitlines() if line.strip()]
+        error = lines[-1] if lines else f"exit code {proc.returncode}"
+    return {
+        'median_ms': statistics.median(times),
+        'min_ms': min(times),
+        'max_ms': max(times),
+        'returncode': proc.returncode,
+        'error': error,
+        'modules': modules,
+        'top_packages': [(package, seconds * 1000) for package, seconds in by_package.most_common(8)],
+    }
+
+def eager_imports(modules, lazy_modules):
+    """الوحدات الممنوعة التي استُوردت فعلاً (الحزمة أو أي وحدة داخلها)."""
+    return sorted({m.split('.')[0] for m in modules if m.split('.')[0] in lazy_modules})
+
+# ----------------- 2. الميزانية والتقرير -----------------
+
+def check_budget(name, result, budget_ms, lazy_modules):
+    """أسباب الفشل لهدف واحد (قائمة فارغة = ضمن الميزانية)."""
+    problems = []
+    if result['error']:
+        problems.append(f"failed: {result['error']}")
+    if budget_ms is not None and result['median_ms'] > budget_ms:
+        problems.append(f"median {result['median_ms']:.0f} ms > budget {budget_ms:.0f} ms")
+    eager = eager_imports(result['modules'], lazy_modules)
+    if eager:
+        problems.append(f"imports at startup: {', '.join(eager)}")
+    return problems
+
+def _parse_budgets(values):
+    budgets = {}
+    for value in values or ():
+        name, _, ms = value.rpartition('=')
+        if not name:
+            raise SystemExit(f"--budget expects NAME=MS, got {value!r}")
+        budgets[name] = float(ms)
+    return budgets
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start times for the CLI and the Streamlit app, with an import budget.")
+    parser.add_argument('--targets', nargs='+', default=None, help="only run these targets (names as printed)")
+    parser.add_argument('--repeat', type=int, default=5, help="cold runs per target (the median is compared)")
+    parser.add_argument('--budget', action='append', default=None, metavar='NAME=MS',
+                        help="override the budget of one target, e.g. --budget 'main.py --help=250'")
+    parser.add_argument('--db-url', default=None, help="database for the app run (default: a temporary SQLite file)")
+    parser.add_argument('--output', default=None, help="also write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    overrides = _parse_budgets(args.budget)
+    env = dict(os.environ)
+    env['DATABASE_URL'] = args.db_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='startup_db_'), 'bench.db')}"
+
+    results, failures = {}, 0
+    header = f"{'target':<22} {'median ms':>10} {'min ms':>8} {'budget':>8}  slowest packages (self time)"
+    print(header)
+    print('-' * len(header))
+    for name, target_args, lazy_modules, budget_ms in TARGETS:
+        if args.targets and name not in args.targets:
+            continue
+        budget_ms = overrides.get(name, budget_ms)
+        result = measure_target(target_args, env, args.repeat)
+        problems = check_budget(name, result, budget_ms, lazy_modules)
+        failures += bool(problems)
+        top = ', '.join(f"{package} {ms:.0f}" for package, ms in result['top_packages'][:5])
+        print(f"{name:<22} {result['median_ms']:10.0f} {result['min_ms']:8.0f} {budget_ms:8.0f}  {top}")
+        for problem in problems:
+            print(f"{'':<22} ❌ {problem}")
+        results[name] = {key: value for key, value in result.items() if key != 'modules'}
+        results[name].update(budget_ms=budget_ms, problems=problems, module_count=len(result['modules']))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.utcnow().isoformat(timespec='seconds'), 'targets': results}, f,
+                      indent=2, ensure_ascii=False)
+
+    if failures:
+        print(f"\n❌ {failures} target(s) over budget")
+        return 1
+    print("\n✅ All targets within budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,4 +13,43 @@ DEFAULT_DB_URL = os.getenv(
 # --- Scraper Settings ---
 DEFAULT_PAGES_TO_SCRAPE = 5
 DEFAULT_CONCURRENCY_LIMIT = 5
-DEFAULT_START_URL = os.getenv("START_URL", "http://example.com")
\ No newline at end of file
+DEFAULT_START_URL = os.getenv("START_URL", "http://example.com")
+DEFAULT_GLOBAL_CONCURRENCY = 20   # الحد الأقصى للطلبات المتزامنة عبر جميع المواقع (وضع الدفعات)
+
+# --- Site Config (config.json) ---
+# ملف إعدادات الموقع الافتراضي (المُحدّدات، base_url، التنبيهات...)
+CONFIG_PATH = os.getenv("SCRAPER_CONFIG", "config.json")
+LOG_FILENAME = "app_scraper.log"
+
+# --- Alert Settings ---
+# وضع الملخص: تجميع التنبيهات الحرجة لكل مستلم في رسالة واحدة كل N دقيقة (0 = إرسال فوري)
+ALERT_DIGEST_MINUTES = int(os.getenv("ALERT_DIGEST_MINUTES", 0))
+
+def get_alert_digest_window():
+    """نافذة وضع الملخص للتنبيهات الحرجة (timedelta)، أو None إذا كان الوضع معطلاً."""
+    from datetime import timedelta
+
+    return timedelta(minutes=ALERT_DIGEST_MINUTES) if ALERT_DIGEST_MINUTES > 0 else None
+
+# --- Export Settings ---
+EXPORT_FORMATS = ('parquet', 'csv')
+
+_config_cache = {}  # المسار -> (وقت التعديل، الإعدادات)
+
+def load_config(path=None):
+    """
+    قراءة ملف إعدادات الموقع (افتراضياً SCRAPER_CONFIG أو config.json).
+    يُقرأ الملف مرة واحدة ويُعاد تحميله فقط عند تغيّر وقت تعديله؛ تُرجع نسخة مستقلة
+    حتى لا يؤثر تعديل المستدعي على الاستدعاءات التالية.
+    """
+    import copy
+    import json
+
+    path = path or CONFIG_PATH
+    mtime = os.path.getmtime(path)
+    cached = _config_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = (mtime, json.load(f))
+        _config_cache[path] = cached
+    return copy.deepcopy(cached[1])
@@ -0,0 +1,221 @@
+# crawl_checkpoint.py - حفظ حالة الزحف دورياً (frontier + الروابط المزارة + النتائج) للاستئناف بعد الانقطاع
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from database import SessionLocal
+from models import AnalysisRun, CrawlCheckpoint
+from review_batch import ReviewBatch
+from text_dedup import Canonical, DuplicateIndex
+from url_filter import SeenURLSet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PAGES = 20       # حفظ نقطة استئناف كل N صفحة
+DEFAULT_CHECKPOINT_SECONDS = 30     # أو كل N ثانية، أيهما أسبق
+MAX_TEXT_CHARS = 10000
+# مخازن تأكيد الروابط المزارة: يجب أن تبقى بعد إعادة التشغيل ليُستأنف منها الزحف (لا مجلد مؤقت)
+CRAWL_STATE_DIR = os.getenv(
+    "CRAWL_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crawl_state')
+)
+
+# ----------------- 1. تسلسل مجموعة الروابط المزارة -----------------
+
+def seen_store_path(analysis_run_id):
+    """ملف المخزن الدقيق لروابط التشغيل (يبقى بعد الانقطاع ليُستخدم عند الاستئناف)."""
+    os.makedirs(CRAWL_STATE_DIR, exist_ok=True)
+    return os.path.join(CRAWL_STATE_DIR, f"crawl_seen_{analysis_run_id}.sqlite")
+
+def dump_seen(seen_bytes):
+    """ضغط لقطة مرشح Bloom (ناتج SeenURLSet.to_bytes())."""
+    return zlib.compress(seen_bytes)
+
+def load_seen(blob, store_path=None):
+    """استعادة SeenURLSet من نقطة الاستئناف (مع دعم الصيغة القديمة: قائمة JSON بالروابط)."""
+    if not blob:
+        return SeenURLSet(store_path=store_path)
+    data = zlib.decompress(blob)
+    if data[:1] == b'[':
+        seen = SeenURLSet(store_path=store_path)
+        seen.update(json.loads(data.decode('utf-8')))
+        return seen
+    return SeenURLSet.from_bytes(data, store_path=store_path)
+
+# ----------------- 2. مدير نقاط الاستئناف -----------------
+
+class CrawlCheckpointer:
+    """
+    يجمع مراجعات الصفحات المكتملة في الذاكرة ويكتبها مع حالة الزحف في معاملة واحدة:
+    الصفحة التي حُفظت مراجعاتها لا تبقى في frontier، لذلك لا يتكرر أي عمل مكتمل عند الاستئناف.
+    المراجعات المكررة (نفس فهرس text_dedup في analyzer) تُحفظ بلا نص وتشير إلى الأصلية.
+    """
+
+    def __init__(self, analysis_run_id, label_fn, every_pages=DEFAULT_CHECKPOINT_PAGES,
+                 every_seconds=DEFAULT_CHECKPOINT_SECONDS, dedup_index=None):
+        self.analysis_run_id = analysis_run_id
+        self.label_fn = label_fn  # score -> sentiment label
+        # يُهيأ عند أول حفظ بالمراجعات الأصلية لنفس الموقع (ومنها ما حُفظ قبل الانقطاع عند الاستئناف)
+        self.dedup_index = dedup_index
+        self.duplicates = 0
+        self.every_pages = every_pages
+        self.every_seconds = every_seconds
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_saved = time.monotonic()
+        self.results_flushed = 0
+        self.seen_store_path = seen_store_path(analysis_run_id)
+
+    @staticmethod
+    def create(analysis_run_id, config, start_url, pages_to_scrape, concurrency):
+        """تسجيل نقطة البداية لتشغيل جديد (تُستدعى قبل أول صفحة)."""
+        seen = SeenURLSet()
+        seen.add(start_url)
+        db = SessionLocal()
+        try:
+            db.add(CrawlCheckpoint(
+                analysis_run_id=analysis_run_id,
+                config_json=json.dumps(config, ensure_ascii=False),
+                start_url=start_url,
+                pages_to_scrape=pages_to_scrape,
+                concurrency=concurrency,
+                frontier=json.dumps([start_url]),
+                seen_state=dump_seen(seen.to_bytes()),
+                pages_done=0,
+                results_flushed=0,
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def load(analysis_run_id):
+        """
+        قراءة آخر نقطة استئناف.
+
+        Returns:
+            dict: config, start_url, pages_to_scrape, concurrency, frontier, seen, pages_done,
+            results_flushed — أو None إذا لم توجد
+        """
+        db = SessionLocal()
+        try:
+            row = db.query(CrawlCheckpoint).filter(CrawlCheckpoint.analysis_run_id == analysis_run_id).first()
+            if row is None:
+                return None
+            return {
+                'config': json.loads(row.config_json),
+                'start_url': row.start_url,
+                'pages_to_scrape': row.pages_to_scrape,
+                'concurrency': row.concurrency,
+                'frontier': json.loads(row.frontier or '[]'),
+                'seen': load_seen(row.seen_state, seen_store_path(analysis_run_id)),
+                'pages_done': row.pages_done or 0,
+                'results_flushed': row.results_flushed or 0,
+            }
+        finally:
+            db.close()
+
+    def record(self, page_results):
+        """إضافة مراجعات صفحة مكتملة (قائمة، قد تكون فارغة) إلى الدفعة التالية."""
+        with self._lock:
+            self._buffer.append(page_results)
+
+    def due(self):
+        return (len(self._buffer) >= self.every_pages
+                or (self._buffer and time.monotonic() - self._last_saved >= self.every_seconds))
+
+    def take(self):
+        """سحب الدفعة الحالية (يُستدعى مع أخذ لقطة frontier في نفس اللحظة)."""
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            return buffer
+
+    def _load_dedup_index(self, db):
+        target_site = db.query(AnalysisRun.target_site).filter(AnalysisRun.id == self.analysis_run_id).scalar()
+        self.dedup_index = DuplicateIndex()
+        if target_site is not None:
+            self.dedup_index.load_recent(db, target_site)
+
+    def _build_batch(self, buffer, now):
+        """
+        دفعة ReviewBatch من مراجعات الصفحات مع ربط المكررات بأصلياتها. الأصلية الجديدة تُسجَّل في
+        فهرس مؤقت للدفعة، وتُنقل إلى الفهرس المشترك بعد نجاح الحفظ فقط (حتى لا تشير مراجعة لاحقة
+        إلى أصلية لم تُحفظ إذا فشلت المعاملة).
+
+        Returns:
+            (batch, [(content_hash, signature, Canonical)] للأصليات الجديدة)
+        """
+        batch = ReviewBatch(analysis_run_id=self.analysis_run_id, created_at=now)
+        staged_index, staged = DuplicateIndex(threshold=self.dedup_index.threshold), []
+        for page_results in buffer:
+            for result in page_results:
+                i = batch.append(result['review_text'][:MAX_TEXT_CHARS], title=result['title'] or result['url'],
+                                 rating=result['rating'])
+                text_hash, signature = result['content_hash'], result['minhash']
+                batch.set_fingerprint(i, text_hash, signature)
+                canonical = self.dedup_index.find(text_hash, signature) or staged_index.find(text_hash, signature)
+                if canonical is not None:
+                    batch.mark_duplicate(i, canonical)
+                    batch.set_scores(i, canonical.label, canonical.score, canonical.subjectivity, canonical.language)
+                    continue
+                label, score = self.label_fn(result['sentiment_score']), result['sentiment_score']
+                batch.set_scores(i, label, score, math.nan, 'unknown')  # الزاحف لا يقيس الذاتية
+                canonical = Canonical(label=label, score=score, subjectivity=math.nan)
+                if staged_index.add(text_hash, signature, canonical):
+                    batch.mark_canonical(i, canonical)
+                    staged.append((text_hash, signature, canonical))
+        return batch, staged
+
+    def save(self, buffer, frontier, seen_bytes, pages_done):
+        """
+        كتابة مراجعات الدفعة (صف لكل مراجعة، المكررة مرتبطة بالأصلية) + تحديث frontier والروابط
+        المزارة والعلامة المائية في معاملة واحدة. frontier و seen_bytes يجب أن تكونا لقطات
+        (تُستدعى من خيط منفصل).
+        """
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            if self.dedup_index is None:
+                self._load_dedup_index(db)
+            batch, staged = self._build_batch(buffer, now)
+            if len(batch):
+                batch.bulk_insert(db)
+            db.query(CrawlCheckpoint).filter(CrawlCheckpoint.analysis_run_id == self.analysis_run_id).update({
+                'frontier': json.dumps(list(frontier)),
+                'seen_state': dump_seen(seen_bytes),
+                'pages_done': pages_done,
+                'results_flushed': CrawlCheckpoint.results_flushed + len(batch),
+                'updated_at': now,
+            }, synchronize_session=False)
+            db.commit()
+            for text_hash, signature, canonical in staged:
+                self.dedup_index.add(text_hash, signature, canonical)
+            self.results_flushed += len(batch)
+            self.duplicates += len(batch.duplicates)
+            self._last_saved = time.monotonic()
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self._buffer = buffer + self._buffer  # إعادة المحاولة في نقطة الحفظ التالية
+            logger.error(f"Failed to checkpoint run {self.analysis_run_id}: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def delete(analysis_run_id):
+        """حذف نقطة الاستئناف ومخزن الروابط المزارة بعد اكتمال التشغيل."""
+        db = SessionLocal()
+        try:
+            db.query(CrawlCheckpoint).filter(CrawlCheckpoint.analysis_run_id == analysis_run_id).delete()
+            db.commit()
+        finally:
+            db.close()
+        store_path = seen_store_path(analysis_run_id)
+        for path in (store_path, store_path + '-wal', store_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
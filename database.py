@@ -9,11 +9,14 @@ import os
 SQLALCHEMY_DATABASE_URL = config.DEFAULT_DB_URL
 
 # ----------------- إنشاء المحرك (Engine) -----------------
-# check_same_thread=False مطلوب لـ SQLite فقط
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
-)
+def _create_engine(url):
+    # check_same_thread=False مطلوب لـ SQLite فقط
+    return create_engine(
+        url, 
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {}
+    )
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
 
 # ----------------- إنشاء مصنع الجلسات (SessionLocal) -----------------
 SessionLocal = sessionmaker(
@@ -22,6 +25,19 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+def use_database(url):
+    """
+    ربط SessionLocal بقاعدة بيانات أخرى غير DATABASE_URL (main.py --db_url). كل الوحدات تستخدم
+    نفس SessionLocal فتنتقل معها؛ تُستدعى قبل فتح أي جلسة.
+    """
+    global engine, SQLALCHEMY_DATABASE_URL
+    if url == SQLALCHEMY_DATABASE_URL:
+        return engine
+    engine = _create_engine(url)
+    SessionLocal.configure(bind=engine)
+    SQLALCHEMY_DATABASE_URL = url
+    return engine
+
 # ----------------- إنشاء الفئة الأساسية للنماذج (Base) -----------------
 Base = declarative_base()
 
@@ -34,3 +50,73 @@ def create_db_and_tables():
     # يجب استدعاء Base.metadata.create_all بعد استيراد النماذج
     Base.metadata.create_all(bind=engine)
     print("✅ تم إنشاء/التحقق من جميع الجداول بنجاح.")
+
+# ----------------- ترقية الجداول الموجودة -----------------
+# create_all ينشئ الجداول الناقصة فقط ولا يعدّل جدولاً موجوداً؛ الأعمدة المضافة بعد إنشاء
+# قاعدة الإنتاج تُضاف هنا (كلها nullable فلا تحتاج قيمة افتراضية للصفوف القديمة)
+ADDED_COLUMNS = {
+    'reviews': ('content_hash', 'minhash', 'duplicate_of_id'),
+    'email_notifications': ('error_message',),
+}
+
+def upgrade_schema():
+    """
+    إضافة الأعمدة الناقصة (ADDED_COLUMNS) وفهارسها، وإلغاء NOT NULL عن reviews.review_text
+    (المكررات تُحفظ بلا نص). آمنة للتكرار: لا تفعل شيئاً على قاعدة محدّثة.
+
+    Returns:
+        قائمة بالتغييرات المنفذة
+    """
+    from sqlalchemy import inspect, text
+    from sqlalchemy.schema import CreateTable
+
+    changes = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table_name, column_names in ADDED_COLUMNS.items():
+            if not inspector.has_table(table_name):
+                continue  # create_all أنشأه كاملاً
+            table = Base.metadata.tables[table_name]
+            existing = {column['name'] for column in inspector.get_columns(table_name)}
+            for name in column_names:
+                if name not in existing:
+                    column_type = table.c[name].type.compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}"))
+                    changes.append(f"{table_name}.{name}")
+
+        review_text = next((column for column in inspector.get_columns('reviews')
+                            if column['name'] == 'review_text'), None)
+        if review_text is not None and not review_text['nullable']:
+            if conn.dialect.name == 'sqlite':
+                # SQLite لا يدعم ALTER COLUMN: إعادة بناء الجدول بنفس المعرفات (review_search يعتمد عليها)
+                reviews = Base.metadata.tables['reviews']
+                columns = ', '.join(column.name for column in reviews.columns)
+                ddl = str(CreateTable(reviews).compile(dialect=conn.dialect))
+                conn.execute(text(ddl.replace('CREATE TABLE reviews', 'CREATE TABLE reviews_new', 1)))
+                conn.execute(text(f"INSERT INTO reviews_new ({columns}) SELECT {columns} FROM reviews"))
+                conn.execute(text("DROP TABLE reviews"))
+                conn.execute(text("ALTER TABLE reviews_new RENAME TO reviews"))
+            else:
+                conn.execute(text("ALTER TABLE reviews ALTER COLUMN review_text DROP NOT NULL"))
+            changes.append("reviews.review_text NULL")
+
+        for table_name in ADDED_COLUMNS:
+            for index in Base.metadata.tables[table_name].indexes:
+                index.create(conn, checkfirst=True)
+    return changes
+
+def init_db():
+    """
+    تهيئة قاعدة البيانات: إنشاء الجداول الناقصة، ثم بناء التجميع اليومي من التشغيلات
+    المحفوظة إذا كان جدوله فارغاً (قاعدة موجودة قبل إضافة جدول التجميع).
+    """
+    import models  # noqa: F401 - تسجيل النماذج في Base قبل create_all
+    from rollups import ensure_rollups
+
+    create_db_and_tables()
+    upgraded = upgrade_schema()
+    if upgraded:
+        print(f"✅ تمت ترقية الجداول الموجودة: {', '.join(upgraded)}")
+    rebuilt = ensure_rollups()
+    if rebuilt:
+        print(f"✅ تم بناء {rebuilt} صف في جدول التجميع اليومي من التشغيلات السابقة.")
@@ -81,3 +81,181 @@ def update_analysis_run(db: Session, run_id: int, updates: dict) -> Optional[Ana
     except SQLAlchemyError as e:
         print(f"❌ حدث خطأ في قاعدة البيانات أثناء التحديث: {e}")
         return None
+
+# ----------------- 5. دوال لوحة التحكم (تبويب التحليلات السابقة) -----------------
+# تقرأ من قاعدة البيانات الفعلية (database.SessionLocal)؛ الكائنات المُرجعة منفصلة عن الجلسة
+# وحقولها محمّلة مسبقاً، فتُقرأ بعد إغلاقها دون استعلامات إضافية.
+
+def get_all_analysis_runs(limit=50):
+    """آخر التشغيلات (الأحدث أولاً)."""
+    from database import SessionLocal
+    import models
+
+    db = SessionLocal()
+    try:
+        return (db.query(models.AnalysisRun)
+                .order_by(models.AnalysisRun.created_at.desc(), models.AnalysisRun.id.desc())
+                .limit(limit).all())
+    finally:
+        db.close()
+
+def get_analysis_run_by_id(run_id):
+    from database import SessionLocal
+    import models
+
+    db = SessionLocal()
+    try:
+        return db.get(models.AnalysisRun, run_id)
+    finally:
+        db.close()
+
+def get_reviews_by_analysis_run(run_id):
+    """
+    مراجعات التشغيل بالترتيب؛ المراجعة المكررة (review_text = NULL) تأخذ نص أصليتها
+    للعرض فقط (الكائن منفصل عن الجلسة فلا يُحفظ التعديل).
+    """
+    from sqlalchemy.orm import aliased
+    from database import SessionLocal
+    import models
+
+    canonical = aliased(models.Review)
+    db = SessionLocal()
+    try:
+        rows = (db.query(models.Review, canonical.review_text)
+                .outerjoin(canonical, canonical.id == models.Review.duplicate_of_id)
+                .filter(models.Review.analysis_run_id == run_id)
+                .order_by(models.Review.id)
+                .all())
+        db.expunge_all()
+    finally:
+        db.close()
+    reviews = []
+    for review, canonical_text in rows:
+        if review.review_text is None:
+            review.review_text = canonical_text
+        reviews.append(review)
+    return reviews
+
+def get_sales_opportunities_by_analysis_run(run_id):
+    from database import SessionLocal
+    import models
+
+    db = SessionLocal()
+    try:
+        return (db.query(models.SalesOpportunity)
+                .filter(models.SalesOpportunity.analysis_run_id == run_id)
+                .order_by(models.SalesOpportunity.id)
+                .all())
+    finally:
+        db.close()
+
+def reviews_to_dataframe(reviews):
+    """المراجعات -> DataFrame بأعمدة لوحة التحكم (نفس أسماء أعمدة التحليل المباشر)."""
+    import pandas as pd
+
+    return pd.DataFrame({
+        'رقم المراجعة': [r.id for r in reviews],
+        'العنوان/المنتج': [r.title for r in reviews],
+        'نص التعليق': [r.review_text or '' for r in reviews],
+        'التقييم': [r.rating for r in reviews],
+        'تصنيف المشاعر': [r.sentiment_label for r in reviews],
+        'شدة السلبية/الإيجابية': [r.compound_score or 0.0 for r in reviews],
+        'الموضوعية (0-1)': [r.subjectivity if r.subjectivity is not None else 0.5 for r in reviews],
+        'فرصة مبيعات محتملة': [bool(r.has_sales_intent) for r in reviews],
+        'اللغة': [r.language or 'unknown' for r in reviews],
+    })
+
+def sales_opportunities_to_dataframe(opportunities):
+    import pandas as pd
+
+    return pd.DataFrame({
+        'المنتج': [o.product_title for o in opportunities],
+        'نص التعليق': [o.review_text for o in opportunities],
+        'شدة السلبية/الإيجابية': [o.compound_score for o in opportunities],
+        'القيمة التقديرية ($)': [o.estimated_value for o in opportunities],
+        'الحالة': [o.status for o in opportunities],
+        'التاريخ': [o.created_at for o in opportunities],
+    })
+
+def get_sentiment_summary_from_reviews(reviews):
+    """DataFrame: تصنيف المشاعر، العدد، النسبة المئوية (%)."""
+    from collections import Counter
+    import pandas as pd
+
+    counts = Counter(r.sentiment_label or 'محايد' for r in reviews)
+    total = sum(counts.values()) or 1
+    return pd.DataFrame(
+        [(label, count, count / total * 100) for label, count in counts.most_common()],
+        columns=['تصنيف المشاعر', 'العدد', 'النسبة المئوية (%)'],
+    )
+
+def get_analysis_summary_stats():
+    """إحصائيات عامة: total_runs, total_reviews, total_sales_opportunities, recent_runs_7_days."""
+    from datetime import timedelta
+    from sqlalchemy import func
+    from database import SessionLocal
+    import models
+
+    db = SessionLocal()
+    try:
+        total_runs, total_reviews = db.query(
+            func.count(models.AnalysisRun.id), func.coalesce(func.sum(models.AnalysisRun.total_reviews), 0)
+        ).one()
+        return {
+            'total_runs': total_runs,
+            'total_reviews': total_reviews,
+            'total_sales_opportunities': db.query(func.count(models.SalesOpportunity.id)).scalar(),
+            'recent_runs_7_days': db.query(func.count(models.AnalysisRun.id)).filter(
+                models.AnalysisRun.created_at >= datetime.utcnow() - timedelta(days=7)
+            ).scalar(),
+        }
+    finally:
+        db.close()
+
+def delete_analysis_run(run_id) -> bool:
+    """
+    حذف تشغيل ومراجعاته وفرصه ونقطة استئنافه في معاملة واحدة. المكررات في تشغيلات أخرى
+    التي تشير إلى مراجعات هذا التشغيل تأخذ نص أصليتها وتصبح مستقلة قبل الحذف،
+    ثم يُعاد بناء التجميع اليومي حتى لا يبقى التشغيل في الاتجاه.
+    """
+    from sqlalchemy import select, update
+    from sqlalchemy.orm import aliased
+    from database import SessionLocal
+    from rollups import rebuild_rollups
+    import models
+
+    Review = models.Review
+    run_review_ids = select(Review.id).where(Review.analysis_run_id == run_id)
+    canonical = aliased(Review)
+    db = SessionLocal()
+    try:
+        if db.get(models.AnalysisRun, run_id) is None:
+            return False
+        db.execute(
+            update(Review)
+            .where(Review.duplicate_of_id.in_(run_review_ids), Review.analysis_run_id != run_id)
+            .values(
+                review_text=select(canonical.review_text).where(canonical.id == Review.duplicate_of_id)
+                .scalar_subquery(),
+                duplicate_of_id=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        for model in (models.ReviewEnrichment, models.CrawlCheckpoint, models.SalesOpportunity):
+            db.query(model).filter(model.analysis_run_id == run_id).delete(synchronize_session=False)
+        db.query(models.NotificationOutbox).filter(models.NotificationOutbox.review_id.in_(run_review_ids)).update(
+            {'review_id': None}, synchronize_session=False)
+        for model in (models.NotificationOutbox, models.EmailNotification, models.RunProfile):
+            db.query(model).filter(model.analysis_run_id == run_id).update(
+                {'analysis_run_id': None}, synchronize_session=False)
+        db.query(Review).filter(Review.analysis_run_id == run_id).delete(synchronize_session=False)
+        db.query(models.AnalysisRun).filter(models.AnalysisRun.id == run_id).delete(synchronize_session=False)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"❌ حدث خطأ في قاعدة البيانات أثناء حذف التحليل {run_id}: {e}")
+        return False
+    finally:
+        db.close()
+    rebuild_rollups()
+    return True
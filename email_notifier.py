@@ -1,12 +1,12 @@
 # email_notifier.py - نظام الإشعارات عبر البريد الإلكتروني
 
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime
 import logging
+from config import get_alert_digest_window
 from database import SessionLocal
 from models import EmailNotification
+from mail_delivery import get_delivery_service
+from email_templates import render_negative_review_alert, render_analysis_summary
+from outbox import enqueue_critical_alerts, dispatch_pending, review_dedup_key, KIND_CRITICAL_ALERT
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +18,10 @@ class EmailNotifier:
         self.password = email_config.get('password')
         self.smtp_server = email_config.get('smtp_server', 'smtp.gmail.com')
         self.smtp_port = email_config.get('smtp_port', 587)
+        self.use_tls = email_config.get('smtp_use_tls', True)
+        self.delivery = get_delivery_service(
+            self.smtp_server, self.smtp_port, self.sender, self.password, self.sender, self.use_tls
+        )
     
     def send_email(self, recipient, subject, body, analysis_run_id=None, is_html=False):
         """
@@ -38,34 +42,22 @@ class EmailNotifier:
             self._save_notification_log(recipient, subject, body, analysis_run_id, 'failed', 'Email credentials not configured')
             return False
         
-        try:
-            # إنشاء الرسالة
-            message = MIMEMultipart('alternative')
-            message['From'] = self.sender
-            message['To'] = recipient
-            message['Subject'] = subject
-            
-            # إضافة المحتوى
-            if is_html:
-                message.attach(MIMEText(body, 'html', 'utf-8'))
-            else:
-                message.attach(MIMEText(body, 'plain', 'utf-8'))
-            
-            # الاتصال بالخادم وإرسال الرسالة
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender, self.password)
-                server.send_message(message)
-            
-            logger.info(f"✅ Email sent successfully to {recipient}")
-            self._save_notification_log(recipient, subject, body, analysis_run_id, 'sent', None)
-            return True
-            
-        except Exception as e:
-            error_msg = f"Failed to send email: {str(e)}"
-            logger.error(f"❌ {error_msg}")
-            self._save_notification_log(recipient, subject, body, analysis_run_id, 'failed', error_msg)
-            return False
+        # الإرسال عبر اتصال SMTP مشترك (بدون STARTTLS وتسجيل دخول لكل رسالة)
+        return self.delivery.send(recipient, subject, body, analysis_run_id, is_html=is_html)
+    
+    def send_many(self, messages):
+        """
+        إرسال عدة رسائل عبر نفس الاتصال مع حفظ سجلاتها دفعة واحدة.
+        
+        Args:
+            messages: قائمة من (recipient, subject, body, analysis_run_id, is_html)
+        
+        Returns:
+            dict بإحصائيات الإرسال (sent, failed, elapsed, messages_per_sec)
+        """
+        for recipient, subject, body, analysis_run_id, is_html in messages:
+            self.delivery.enqueue(recipient, subject, body, analysis_run_id, is_html)
+        return self.delivery.flush()
     
     def _save_notification_log(self, recipient, subject, body, analysis_run_id, status, error_message):
         """حفظ سجل الإشعار في قاعدة البيانات."""
@@ -76,7 +68,7 @@ class EmailNotifier:
                 recipient=recipient,
                 subject=subject,
                 body=body[:5000],  # حد أقصى 5000 حرف
-                status=status,
+                sent_status=status,
                 error_message=error_message
             )
             db.add(notification)
@@ -101,57 +93,12 @@ class EmailNotifier:
             return False
         
         subject = f"⚠️ تنبيه: تعليقات سلبية حرجة - {site_name}"
-        
-        # إنشاء محتوى HTML
-        html_body = f"""
-        <html dir="rtl">
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; direction: rtl; }}
-                .header {{ background-color: #dc3545; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .review {{ 
-                    background-color: #f8f9fa; 
-                    padding: 15px; 
-                    margin: 10px 0; 
-                    border-right: 4px solid #dc3545;
-                }}
-                .score {{ font-weight: bold; color: #dc3545; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>⚠️ تنبيه: تعليقات سلبية تحتاج إلى تدخل فوري</h1>
-            </div>
-            <div class="content">
-                <p><strong>الموقع:</strong> {site_name}</p>
-                <p><strong>التاريخ:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>
-                <p><strong>عدد التعليقات السلبية الحرجة:</strong> {len(negative_reviews_df)}</p>
-                <hr>
-                <h2>التعليقات السلبية الأكثر حرجة:</h2>
-        """
-        
-        # إضافة أول 5 تعليقات سلبية
-        for idx, row in negative_reviews_df.head(5).iterrows():
-            title = row.get('العنوان/المنتج', 'N/A')
-            review = row.get('نص التعليق', '')
-            score = row.get('شدة السلبية/الإيجابية', 0)
-            
-            html_body += f"""
-                <div class="review">
-                    <p><strong>المنتج:</strong> {title}</p>
-                    <p class="score">درجة السلبية: {score:.2f}</p>
-                    <p><strong>التعليق:</strong> {review}</p>
-                </div>
-            """
-        
-        html_body += """
-                <hr>
-                <p><strong>يُنصح باتخاذ إجراء فوري للرد على هذه التعليقات.</strong></p>
-            </div>
-        </body>
-        </html>
-        """
+        html_body = render_negative_review_alert(
+            site_name,
+            negative_reviews_df['العنوان/المنتج'].to_numpy() if 'العنوان/المنتج' in negative_reviews_df else ['N/A'] * len(negative_reviews_df),
+            negative_reviews_df['نص التعليق'].to_numpy(),
+            negative_reviews_df['شدة السلبية/الإيجابية'].to_numpy(),
+        )
         
         return self.send_email(recipient, subject, html_body, analysis_run_id, is_html=True)
     
@@ -166,59 +113,45 @@ class EmailNotifier:
             analysis_run_id: معرف التحليل
         """
         subject = f"✅ اكتمل التحليل - {analysis_run.target_site}"
-        
-        html_body = f"""
-        <html dir="rtl">
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; direction: rtl; }}
-                .header {{ background-color: #28a745; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .metric {{ 
-                    display: inline-block; 
-                    background-color: #f8f9fa; 
-                    padding: 15px; 
-                    margin: 10px; 
-                    border-radius: 5px;
-                    min-width: 150px;
-                    text-align: center;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>✅ اكتمل التحليل</h1>
-            </div>
-            <div class="content">
-                <p><strong>الموقع:</strong> {analysis_run.target_site}</p>
-                <p><strong>التاريخ:</strong> {analysis_run.created_at.strftime('%Y-%m-%d %H:%M')}</p>
-                <hr>
-                <h2>الملخص:</h2>
-                <div class="metric">
-                    <h3>{analysis_run.total_reviews}</h3>
-                    <p>إجمالي التعليقات</p>
-                </div>
-                <div class="metric">
-                    <h3>{analysis_run.positive_percentage:.1f}%</h3>
-                    <p>النسبة الإيجابية</p>
-                </div>
-                <div class="metric">
-                    <h3>{analysis_run.positive_count}</h3>
-                    <p>إيجابي</p>
-                </div>
-                <div class="metric">
-                    <h3>{analysis_run.negative_count}</h3>
-                    <p>سلبي</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_body = render_analysis_summary(analysis_run)
         
         return self.send_email(recipient, subject, html_body, analysis_run_id, is_html=True)
 
 
-def send_critical_alerts(negative_reviews_df, email_config, site_name, threshold=-0.5, analysis_run_id=None):
+def dataframe_to_alert_reviews(reviews_df):
+    """تحويل DataFrame التعليقات (بأعمدة لوحة التحكم) إلى قائمة dict لبناء التنبيه."""
+    id_column = next((c for c in ('review_id', 'رقم المراجعة') if c in reviews_df.columns), None)
+    review_ids = reviews_df[id_column].tolist() if id_column else [None] * len(reviews_df)
+    return [
+        {'review_id': review_id, 'title': title, 'review_text': review, 'score': score}
+        for review_id, title, review, score in zip(
+            review_ids,
+            reviews_df.get('العنوان/المنتج', ['N/A'] * len(reviews_df)),
+            reviews_df.get('نص التعليق', [''] * len(reviews_df)),
+            reviews_df.get('شدة السلبية/الإيجابية', [0] * len(reviews_df)),
+        )
+    ]
+
+
+def build_negative_review_alert_body(site_name, reviews, max_reviews=5):
+    """
+    بناء محتوى HTML لتنبيه التعليقات السلبية الحرجة من القالب المترجم مسبقاً.
+    
+    Args:
+        site_name: اسم الموقع
+        reviews: قائمة dict بالمفاتيح title, review_text, score
+        max_reviews: عدد التعليقات المعروضة في الرسالة
+    """
+    return render_negative_review_alert(
+        site_name,
+        [r.get('title') for r in reviews],
+        [r.get('review_text') for r in reviews],
+        [r.get('score') for r in reviews],
+        max_reviews,
+    )
+
+def send_critical_alerts(negative_reviews_df, email_config, site_name, threshold=-0.5, analysis_run_id=None,
+                         alert_scope=None):
     """
     إرسال تنبيهات للتعليقات السلبية الحرجة.
     
@@ -228,9 +161,10 @@ def send_critical_alerts(negative_reviews_df, email_config, site_name, threshold
         site_name: اسم الموقع
         threshold: عتبة السلبية (افتراضي -0.5)
         analysis_run_id: معرف التحليل
+        alert_scope: نطاق منع التكرار لتحليل غير محفوظ (مثل مفتاح تحليل الجلسة) عند غياب analysis_run_id
     
     Returns:
-        True إذا تم الإرسال بنجاح
+        True إذا تم إرسال تنبيهات جديدة (التعليقات التي سبق التنبيه عنها لا تُرسل مرة أخرى)
     """
     # فلترة التعليقات الحرجة
     critical_reviews = negative_reviews_df[
@@ -248,4 +182,30 @@ def send_critical_alerts(negative_reviews_df, email_config, site_name, threshold
         logger.warning("No email recipient configured")
         return False
     
-    return notifier.send_negative_review_alert(recipient, critical_reviews, site_name, analysis_run_id)
+    # إضافة التنبيهات إلى صندوق الإشعارات مع منع التكرار لكل (تشغيل، مراجعة)
+    alert_reviews = dataframe_to_alert_reviews(critical_reviews)
+    db = SessionLocal()
+    try:
+        added = enqueue_critical_alerts(db, analysis_run_id, recipient, site_name, alert_reviews, scope=alert_scope)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to enqueue critical alerts: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+    
+    if not added:
+        logger.info("All critical reviews were already alerted")
+        return False
+    
+    # في وضع الملخص يتولى الموزّع الخلفي إرسال رسالة واحدة لكل نافذة زمنية
+    digest_window = get_alert_digest_window()
+    if digest_window is not None:
+        logger.info(f"Queued {added} critical alerts for the next digest")
+        return True
+    
+    # إرسال تنبيهات هذا التحليل فقط: باقي الصندوق (تشغيلات ومستلمون آخرون) يتولاه الموزّع الخلفي
+    dedup_keys = {review_dedup_key(analysis_run_id, r['review_id'], r['review_text'], alert_scope) for r in alert_reviews}
+    stats = dispatch_pending(notifier.delivery, limit=None, kinds=(KIND_CRITICAL_ALERT,), dedup_keys=dedup_keys)
+    return stats['sent'] > 0
@@ -0,0 +1,233 @@
+# email_templates.py - قوالب البريد الإلكتروني (تُترجم مرة واحدة وتُعرض من مصفوفات الأعمدة)
+
+import html
+from datetime import datetime
+from string import Formatter
+
+# ----------------- 1. محرك القوالب -----------------
+
+class Markup(str):
+    """نص HTML جاهز (مثل جزء مُعرض مسبقاً) لا يتم تهريبه عند إدراجه في قالب."""
+
+
+class CompiledTemplate:
+    """
+    قالب يُحلل مرة واحدة إلى أجزاء ثابتة وحقول (بصيغة str.format)،
+    ثم يُعرض بتجميع الأجزاء دون إعادة التحليل. القيم النصية تُهرّب تلقائياً.
+    """
+
+    def __init__(self, source):
+        self._parts = [
+            (literal, field, spec or '')
+            for literal, field, spec, _ in Formatter().parse(source)
+        ]
+
+    @staticmethod
+    def _format(value, spec):
+        if value is None:
+            value = 'N/A'
+        if isinstance(value, Markup):
+            return value
+        if isinstance(value, str):
+            return html.escape(value, quote=False)
+        return format(value, spec)
+
+    def render(self, **values):
+        out = []
+        for literal, field, spec in self._parts:
+            out.append(literal)
+            if field is not None:
+                out.append(self._format(values[field], spec))
+        return Markup(''.join(out))
+
+    def render_rows(self, **columns):
+        """
+        عرض القالب لكل صف من مصفوفات أعمدة متساوية الطول (بدلاً من iterrows)
+        وإرجاع الأجزاء مدمجة بعملية join واحدة.
+        """
+        names = list(columns)
+        return Markup(''.join(
+            self.render(**dict(zip(names, row)))
+            for row in zip(*(columns[name] for name in names))
+        ))
+
+# ----------------- 2. القوالب (تُترجم عند استيراد الوحدة) -----------------
+
+# تخطيط موحد لجميع الرسائل (أنماط مضمنة لتوافق برامج البريد)
+LAYOUT = CompiledTemplate("""
+<html dir="rtl">
+    <body style="font-family: Arial, sans-serif; direction: rtl; text-align: right; background-color: #f4f4f4; padding: 20px;">
+        <div style="max-width: 600px; margin: auto; background: white; border-radius: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.05);">
+            <div style="background-color: {accent}; color: white; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
+                <h1 style="margin: 0; font-size: 22px;">{title}</h1>
+            </div>
+            <div style="padding: 20px;">
+                {content}
+            </div>
+        </div>
+    </body>
+</html>
+""")
+
+ALERT_CONTENT = CompiledTemplate("""
+<p><strong>الموقع:</strong> {site_name}</p>
+<p><strong>التاريخ:</strong> {date}</p>
+<p><strong>عدد التعليقات السلبية الحرجة:</strong> {count}</p>
+<hr>
+<h2>التعليقات السلبية الأكثر حرجة:</h2>
+{reviews}
+<hr>
+<p><strong>يُنصح باتخاذ إجراء فوري للرد على هذه التعليقات.</strong></p>
+""")
+
+REVIEW_ROW = CompiledTemplate("""
+<div style="background-color: #f8f9fa; padding: 15px; margin: 10px 0; border-right: 4px solid #dc3545;">
+    <p><strong>المنتج:</strong> {title}</p>
+    <p style="font-weight: bold; color: #dc3545;">درجة السلبية: {score:.2f}</p>
+    <p><strong>التعليق:</strong> {review_text}</p>
+</div>
+""")
+
+DIGEST_CONTENT = CompiledTemplate("""
+<p><strong>الفترة:</strong> {window_start} → {window_end}</p>
+<p><strong>إجمالي التعليقات السلبية الحرجة:</strong> {count} (في {sections_count} تحليل)</p>
+<hr>
+{sections}
+<p><strong>يُنصح باتخاذ إجراء فوري للرد على هذه التعليقات.</strong></p>
+""")
+
+DIGEST_SECTION = CompiledTemplate("""
+<h2>{site_name} <span style="font-size: 14px; color: #777;">(تحليل #{run_id} - {count} تعليق)</span></h2>
+{reviews}
+{more}
+""")
+
+SUMMARY_CONTENT = CompiledTemplate("""
+<p><strong>الموقع:</strong> {site_name}</p>
+<p><strong>التاريخ:</strong> {date}</p>
+<hr>
+<h2>الملخص:</h2>
+<table style="width: 100%; text-align: center;"><tr>
+    <td style="background-color: #f8f9fa; padding: 15px;"><h3>{total_reviews}</h3><p>إجمالي التعليقات</p></td>
+    <td style="background-color: #f8f9fa; padding: 15px;"><h3>{positive_percentage:.1f}%</h3><p>النسبة الإيجابية</p></td>
+    <td style="background-color: #f8f9fa; padding: 15px;"><h3>{positive_count}</h3><p>إيجابي</p></td>
+    <td style="background-color: #f8f9fa; padding: 15px;"><h3>{negative_count}</h3><p>سلبي</p></td>
+</tr></table>
+""")
+
+REPORT_CONTENT = CompiledTemplate("""
+<p><strong>معرّف التشغيل (ID):</strong> {run_id}</p>
+<p><strong>الموقع المستهدف:</strong> {site_name}</p>
+<p><strong>حالة التشغيل:</strong> <span style="color: green; font-weight: bold;">مكتملة</span></p>
+<hr style="border: 0; border-top: 1px solid #eee;">
+<h3>الإحصائيات الرئيسية:</h3>
+<ul style="list-style: none; padding: 0;">
+    <li style="padding: 5px 0;"><strong>إجمالي المراجعات:</strong> {total_reviews}</li>
+    <li style="padding: 5px 0;"><strong>متوسط التقييم (من 5):</strong> {avg_rating:.2f}</li>
+    <li style="padding: 5px 0;"><strong>النسبة الإيجابية:</strong> {positive_percentage:.2f}% ({positive_count} مراجعة)</li>
+    <li style="padding: 5px 0;"><strong>المشاعر السلبية:</strong> {negative_count} مراجعة</li>
+</ul>
+<p style="margin-top: 20px;">تم إكمال التحليل في: {completed_at}</p>
+<p style="font-size: 12px; color: #777;">يرجى مراجعة لوحة التحكم للتفاصيل الكاملة.</p>
+""")
+
+FAILURE_CONTENT = CompiledTemplate("""
+<p><strong>معرّف التشغيل (ID):</strong> {run_id}</p>
+<p><strong>الموقع المستهدف:</strong> {site_name}</p>
+<p><strong>حالة التشغيل:</strong> <span style="color: red; font-weight: bold;">فشل</span></p>
+<hr style="border: 0; border-top: 1px solid #eee;">
+<h3>رسالة الخطأ:</h3>
+<p style="background-color: #ffebee; border-right: 5px solid #D32F2F; padding: 10px;">{error_message}</p>
+<p style="margin-top: 20px;">تم بدء التحليل في: {started_at}</p>
+<p style="font-size: 12px; color: #777;">تم إرسال هذا الإشعار إلى فريق الإدارة للمراجعة.</p>
+""")
+
+COLOR_DANGER = '#dc3545'
+COLOR_SUCCESS = '#28a745'
+
+# ----------------- 3. دوال العرض -----------------
+
+def _fmt_dt(value, fmt='%Y-%m-%d %H:%M'):
+    return value.strftime(fmt) if value else 'N/A'
+
+def render_negative_review_alert(site_name, titles, review_texts, scores, max_reviews=5):
+    """تنبيه التعليقات السلبية الحرجة من مصفوفات الأعمدة (العنوان، النص، الدرجة)."""
+    content = ALERT_CONTENT.render(
+        site_name=site_name,
+        date=_fmt_dt(datetime.now()),
+        count=len(review_texts),
+        reviews=REVIEW_ROW.render_rows(
+            title=list(titles[:max_reviews]),
+            review_text=list(review_texts[:max_reviews]),
+            score=[float(s or 0) for s in scores[:max_reviews]],
+        ),
+    )
+    return LAYOUT.render(accent=COLOR_DANGER, title="⚠️ تنبيه: تعليقات سلبية تحتاج إلى تدخل فوري", content=content)
+
+def render_alert_digest(groups, window_start, window_end, max_reviews_per_group=5):
+    """
+    رسالة ملخص (Digest) واحدة لجميع التنبيهات الحرجة في نافذة زمنية.
+
+    Args:
+        groups: قائمة dict بالمفاتيح site_name, run_id, titles, review_texts, scores
+    """
+    sections = Markup(''.join(
+        DIGEST_SECTION.render(
+            site_name=group['site_name'],
+            run_id=group['run_id'] if group['run_id'] is not None else '-',
+            count=len(group['review_texts']),
+            reviews=REVIEW_ROW.render_rows(
+                title=list(group['titles'][:max_reviews_per_group]),
+                review_text=list(group['review_texts'][:max_reviews_per_group]),
+                score=[float(s or 0) for s in group['scores'][:max_reviews_per_group]],
+            ),
+            more=(f"و {len(group['review_texts']) - max_reviews_per_group} تعليق آخر..."
+                  if len(group['review_texts']) > max_reviews_per_group else ''),
+        )
+        for group in groups
+    ))
+    content = DIGEST_CONTENT.render(
+        window_start=_fmt_dt(window_start),
+        window_end=_fmt_dt(window_end),
+        count=sum(len(group['review_texts']) for group in groups),
+        sections_count=len(groups),
+        sections=sections,
+    )
+    return LAYOUT.render(accent=COLOR_DANGER, title="⚠️ ملخص التعليقات السلبية الحرجة", content=content)
+
+def render_analysis_summary(run):
+    """ملخص تحليل مكتمل (لوحة المقاييس)."""
+    content = SUMMARY_CONTENT.render(
+        site_name=run.target_site,
+        date=_fmt_dt(run.created_at),
+        total_reviews=run.total_reviews,
+        positive_percentage=run.positive_percentage or 0.0,
+        positive_count=run.positive_count,
+        negative_count=run.negative_count,
+    )
+    return LAYOUT.render(accent=COLOR_SUCCESS, title="✅ اكتمل التحليل", content=content)
+
+def render_run_report(run, stats):
+    """تقرير اكتمال التشغيل المرسل للمدير."""
+    content = REPORT_CONTENT.render(
+        run_id=run.id,
+        site_name=run.target_site,
+        total_reviews=run.total_reviews,
+        avg_rating=stats.get('avg_rating') or 0.0,
+        positive_percentage=run.positive_percentage or 0.0,
+        positive_count=run.positive_count,
+        negative_count=run.negative_count,
+        completed_at=_fmt_dt(run.completed_at, '%Y-%m-%d %H:%M:%S'),
+    )
+    return LAYOUT.render(accent=COLOR_SUCCESS, title="✅ اكتمال تحليل مراجعات الموقع - تقرير موجز", content=content)
+
+def render_run_failure(run, error_message):
+    """إشعار فشل التشغيل المرسل للمدير."""
+    started_at = getattr(run, 'started_at', None) or getattr(run, 'created_at', None)
+    content = FAILURE_CONTENT.render(
+        run_id=run.id,
+        site_name=run.target_site,
+        error_message=error_message,
+        started_at=_fmt_dt(started_at, '%Y-%m-%d %H:%M:%S'),
+    )
+    return LAYOUT.render(accent=COLOR_DANGER, title="❌ فشل تشغيل التحليل", content=content)
@@ -0,0 +1,258 @@
+# enrichment.py - إثراء المراجعات بالنموذج اللغوي على دفعات (المواضيع ونوع النية)
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+
+from database import SessionLocal
+from models import Review, ReviewEnrichment
+from llm_cache import model_identity
+
+logger = logging.getLogger(__name__)
+
+# ----------------- الإعدادات -----------------
+
+ENRICHMENT_ENABLED = os.getenv("LLM_ENRICHMENT_ENABLED", "0") == "1"
+DEFAULT_BATCH_SIZE = 25            # عدد المراجعات في كل طلب للنموذج
+DEFAULT_MAX_CONCURRENCY = 4        # عدد الطلبات المتزامنة
+DEFAULT_REQUESTS_PER_MINUTE = 60   # حد المعدل المسموح من مزود النموذج
+DEFAULT_MAX_RETRIES = 4
+MAX_REVIEW_CHARS = 600
+
+INTENT_LABELS = ('purchase', 'feature_request', 'complaint', 'praise', 'question', 'other')
+
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+# ----------------- 1. بناء الطلب وقراءة الرد -----------------
+
+def build_batch_prompt(batch):
+    """طلب واحد لعدة مراجعات: كل مراجعة بمعرفها، والرد مصفوفة JSON بنفس المعرفات."""
+    lines = [
+        "For each customer review below, extract up to 3 short themes (2-4 words, in the review's language) "
+        f"and one intent label from: {', '.join(INTENT_LABELS)}.",
+        'Reply with a JSON array only: [{"id": <id>, "themes": ["..."], "intent": "..."}]',
+        "",
+    ]
+    for review_id, text in batch:
+        clean = re.sub(r'\s+', ' ', text or '').strip()[:MAX_REVIEW_CHARS]
+        lines.append(f"[{review_id}] {clean}")
+    return "\n".join(lines)
+
+def parse_batch_response(text, batch_ids):
+    """
+    استخراج نتائج المصفوفة من رد النموذج (مع تجاهل أي نص أو أسوار ``` حولها).
+    المعرفات غير الموجودة في الدفعة تُهمل، والنية غير المعروفة تصبح 'other'.
+    """
+    match = _JSON_ARRAY_RE.search(text or '')
+    if not match:
+        raise ValueError("model response contains no JSON array")
+    items = json.loads(match.group(0))
+
+    results = {}
+    for item in items:
+        try:
+            review_id = int(item.get('id'))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if review_id not in batch_ids:
+            continue
+        intent = str(item.get('intent') or 'other').strip().lower()
+        themes = [str(t).strip() for t in (item.get('themes') or []) if str(t).strip()][:3]
+        results[review_id] = (themes, intent if intent in INTENT_LABELS else 'other')
+    return results
+
+# ----------------- 2. جدولة الطلبات -----------------
+
+class RateLimiter:
+    """
+    جدولة طلبات بحد أقصى requests_per_minute (فترة ثابتة بين الطلبات)،
+    مع تأجيل جميع الطلبات عند تلقي خطأ حد المعدل من المزود.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def back_off(self, seconds):
+        """تأخير الجدول كله (بعد ResourceExhausted / HTTP 429)."""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+def _is_rate_limit_error(error):
+    name = type(error).__name__
+    return name in ('ResourceExhausted', 'TooManyRequests') or '429' in str(error)
+
+# ----------------- 3. خط الإثراء -----------------
+
+def _pending_reviews(analysis_run_id):
+    """المراجعات الأصلية التي لم تُثرَ بعد (الاستئناف يتخطى ما حُفظ سابقاً، والمكررات بلا نص)."""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Review.id, Review.review_text)
+            .outerjoin(ReviewEnrichment, ReviewEnrichment.review_id == Review.id)
+            .filter(Review.analysis_run_id == analysis_run_id, ReviewEnrichment.id.is_(None),
+                    Review.duplicate_of_id.is_(None))
+            .order_by(Review.id)
+            .all()
+        )
+        return [(review_id, text) for review_id, text in rows]
+    finally:
+        db.close()
+
+def _save_batch(analysis_run_id, results, model_name):
+    """حفظ نتائج دفعة واحدة في معاملة مستقلة (نقطة الاستئناف)."""
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(ReviewEnrichment, [
+            {
+                'review_id': review_id,
+                'analysis_run_id': analysis_run_id,
+                'themes': json.dumps(themes, ensure_ascii=False),
+                'intent': intent,
+                'model_name': model_name,
+            }
+            for review_id, (themes, intent) in results.items()
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def enrich_reviews_async(analysis_run_id, reviews, model, batch_size=DEFAULT_BATCH_SIZE,
+                               max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                               requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                               max_retries=DEFAULT_MAX_RETRIES, save=_save_batch):
+    """
+    إثراء قائمة (review_id, review_text) بطلبات مجمّعة متزامنة.
+    model: أي كائن يملك generate_content(prompt).text (Gemini أو نموذج محلي للاختبار).
+
+    Returns:
+        dict: reviews, enriched, failed_batches, requests, elapsed, reviews_per_sec
+    """
+    batches = [reviews[i:i + batch_size] for i in range(0, len(reviews), batch_size)]
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = RateLimiter(requests_per_minute)
+    model_name = model_identity(model)
+    stats = {'reviews': len(reviews), 'enriched': 0, 'failed_batches': 0, 'requests': 0}
+
+    async def process(batch):
+        batch_ids = {review_id for review_id, _ in batch}
+        prompt = build_batch_prompt(batch)
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                await limiter.acquire()
+                stats['requests'] += 1
+                try:
+                    response = await asyncio.to_thread(model.generate_content, prompt)
+                    results = parse_batch_response(response.text, batch_ids)
+                    break
+                except Exception as e:
+                    if attempt == max_retries:
+                        logger.error(f"Enrichment batch failed after {attempt + 1} attempts: {e}")
+                        stats['failed_batches'] += 1
+                        return
+                    delay = min(2 ** attempt, 30)
+                    if _is_rate_limit_error(e):
+                        limiter.back_off(delay)  # الطلب التالي (لأي دفعة) ينتظر في acquire()
+                    else:
+                        await asyncio.sleep(delay)
+        await asyncio.to_thread(save, analysis_run_id, results, model_name)
+        stats['enriched'] += len(results)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(process(batch) for batch in batches))
+    stats['elapsed'] = time.perf_counter() - started
+    stats['reviews_per_sec'] = stats['enriched'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+    return stats
+
+def enrich_analysis_run(analysis_run_id, model, **kwargs):
+    """
+    إثراء جميع مراجعات تشغيل مكتمل. آمنة لإعادة التشغيل: كل دفعة تُحفظ فور اكتمالها
+    والمراجعات المثراة مسبقاً لا تُرسل مرة أخرى.
+    """
+    reviews = _pending_reviews(analysis_run_id)
+    if not reviews:
+        logger.info(f"No reviews left to enrich for run {analysis_run_id}")
+        return {'reviews': 0, 'enriched': 0, 'failed_batches': 0, 'requests': 0,
+                'elapsed': 0.0, 'reviews_per_sec': 0.0}
+    stats = asyncio.run(enrich_reviews_async(analysis_run_id, reviews, model, **kwargs))
+    logger.info(f"✅ Enriched {stats['enriched']}/{stats['reviews']} reviews of run {analysis_run_id} "
+                f"({stats['reviews_per_sec']:.1f} reviews/s, {stats['requests']} requests)")
+    return stats
+
+def maybe_enrich_run(analysis_run_id):
+    """مرحلة اختيارية بعد process_analysis_run (LLM_ENRICHMENT_ENABLED=1 و GEMINI_API_KEY)."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not ENRICHMENT_ENABLED or not api_key:
+        return None
+    from llm_cache import get_gemini_model
+    try:
+        return enrich_analysis_run(analysis_run_id, get_gemini_model(api_key))
+    except Exception as e:
+        logger.error(f"LLM enrichment failed for run {analysis_run_id}: {e}")
+        return None
+
+# ----------------- قياس الإنتاجية مقابل خادم نموذج محلي -----------------
+
+if __name__ == "__main__":
+    # خادم HTTP محلي (aiohttp) يحاكي زمن استجابة النموذج ويرد بمصفوفة JSON
+    import sys
+    import threading
+    import requests
+    from aiohttp import web
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    async def handle(request):
+        prompt = await request.text()
+        await asyncio.sleep(latency)
+        ids = re.findall(r'^\[(\d+)\]', prompt, re.MULTILINE)
+        return web.json_response([{'id': int(i), 'themes': ['shipping'], 'intent': 'complaint'} for i in ids])
+
+    def serve(loop):
+        asyncio.set_event_loop(loop)
+        app = web.Application()
+        app.router.add_post('/generate', handle)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', 8765).start())
+        loop.run_forever()
+
+    threading.Thread(target=serve, args=(asyncio.new_event_loop(),), daemon=True).start()
+    time.sleep(0.5)
+
+    class StubServerModel:
+        model_name = 'stub-server'
+
+        def __init__(self):
+            self.session = requests.Session()
+
+        def generate_content(self, prompt):
+            response = self.session.post('http://127.0.0.1:8765/generate', data=prompt.encode('utf-8'))
+            response.raise_for_status()
+            return type('Response', (), {'text': response.text})()
+
+    reviews = [(i, f"review {i}: delivery was late") for i in range(1, total + 1)]
+    for batch_size, concurrency in ((1, 1), (25, 1), (25, 4)):
+        stats = asyncio.run(enrich_reviews_async(
+            0, reviews if batch_size > 1 else reviews[:50], StubServerModel(),
+            batch_size=batch_size, max_concurrency=concurrency, requests_per_minute=0,
+            save=lambda *args: None,
+        ))
+        print(f"batch={batch_size:>2} concurrency={concurrency}: {stats['enriched']} reviews, "
+              f"{stats['requests']} requests, {stats['reviews_per_sec']:.1f} reviews/s")
@@ -0,0 +1,231 @@
+# exporter.py - تصدير نتائج التحليل (Parquet / CSV) بشكل متدفق من قاعدة البيانات
+
+import csv
+import logging
+import os
+import re
+from itertools import islice
+
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from config import EXPORT_FORMATS, load_config
+from database import SessionLocal
+from models import Review, SalesOpportunity
+
+logger = logging.getLogger(__name__)
+
+# ----------------- إعدادات التصدير -----------------
+
+DEFAULT_CHUNK_SIZE = 50_000          # عدد الصفوف في كل دفعة (يحدد سقف الذاكرة)
+DEFAULT_PARQUET_COMPRESSION = 'zstd'
+EXPORT_KINDS = ('reviews', 'opportunities')
+
+# الأعمدة المصدّرة لكل نوع (بالترتيب)
+REVIEW_COLUMNS = [
+    'id', 'analysis_run_id', 'title', 'review_text', 'rating', 'sentiment_label',
+    'compound_score', 'subjectivity', 'language', 'has_sales_intent', 'scraped_at', 'duplicate_of_id',
+]
+OPPORTUNITY_COLUMNS = [
+    'id', 'analysis_run_id', 'product_title', 'review_text', 'compound_score',
+    'estimated_value', 'status', 'created_at',
+]
+
+_RATING_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_RATING_WORDS = {'one': 1.0, 'two': 2.0, 'three': 3.0, 'four': 4.0, 'five': 5.0}
+
+# ----------------- 1. دوال مساعدة -----------------
+
+def get_default_export_basename(config_path=None):
+    """قراءة المفتاح output_filename من ملف الإعدادات (مع قيمة افتراضية)."""
+    try:
+        return load_config(config_path).get('output_filename') or 'review_analysis_report'
+    except (OSError, ValueError):
+        return 'review_analysis_report'
+
+def parse_rating(rating):
+    """
+    تحويل التقييم المخزن كنص ("4" أو "4/5" أو "Three") إلى رقم عشري.
+    يُرجع None إذا تعذر التحويل.
+    """
+    if rating is None:
+        return None
+    match = _RATING_NUMBER_RE.search(rating)
+    if match:
+        return float(match.group(0))
+    for word in rating.lower().split():
+        if word in _RATING_WORDS:
+            return _RATING_WORDS[word]
+    return None
+
+def is_parquet_available():
+    """التحقق من توفر pyarrow (اعتمادية اختيارية لتصدير Parquet)."""
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _iter_chunks(rows, chunk_size):
+    """تقسيم مُكرِّر الصفوف إلى دفعات بحجم ثابت دون تحميلها كلها في الذاكرة."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _query_for(db, kind, run_id, chunk_size):
+    """بناء استعلام متدفق (yield_per) لأعمدة النوع المطلوب فقط."""
+    if kind == 'reviews':
+        model, columns = Review, REVIEW_COLUMNS
+    elif kind == 'opportunities':
+        model, columns = SalesOpportunity, OPPORTUNITY_COLUMNS
+    else:
+        raise ValueError(f"نوع تصدير غير معروف: {kind}")
+
+    selected = [getattr(model, c) for c in columns]
+    canonical = aliased(Review) if model is Review else None
+    if canonical is not None:
+        # المكررة محفوظة بلا نص: يُصدَّر نص المراجعة الأصلية التي تشير إليها
+        selected[columns.index('review_text')] = \
+            func.coalesce(Review.review_text, canonical.review_text).label('review_text')
+    query = db.query(*selected)
+    if canonical is not None:
+        query = query.outerjoin(canonical, canonical.id == Review.duplicate_of_id)
+    query = (
+        query
+        .filter(model.analysis_run_id == run_id)
+        .order_by(model.id)
+        .yield_per(chunk_size)
+    )
+    return query, columns
+
+def _parquet_schema(kind):
+    """
+    مخطط Arrow بأنواع صريحة للأعمدة الرقمية والزمنية.
+    (الأعمدة النصية المتكررة مثل sentiment_label يضغطها Parquet بترميز القاموس تلقائياً)
+    """
+    import pyarrow as pa
+
+    if kind == 'reviews':
+        return pa.schema([
+            ('id', pa.int64()),
+            ('analysis_run_id', pa.int64()),
+            ('title', pa.string()),
+            ('review_text', pa.string()),
+            ('rating', pa.float32()),
+            ('sentiment_label', pa.string()),
+            ('compound_score', pa.float32()),
+            ('subjectivity', pa.float32()),
+            ('language', pa.string()),
+            ('has_sales_intent', pa.bool_()),
+            ('scraped_at', pa.timestamp('us')),
+            ('duplicate_of_id', pa.int64()),
+        ])
+    return pa.schema([
+        ('id', pa.int64()),
+        ('analysis_run_id', pa.int64()),
+        ('product_title', pa.string()),
+        ('review_text', pa.string()),
+        ('compound_score', pa.float32()),
+        ('estimated_value', pa.float64()),
+        ('status', pa.string()),
+        ('created_at', pa.timestamp('us')),
+    ])
+
+# ----------------- 2. كتّاب الصيغ -----------------
+
+def _write_parquet(rows, kind, columns, output_path, chunk_size, compression):
+    """كتابة الدفعات كمجموعات صفوف (row groups) متتالية في ملف Parquet."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("تصدير Parquet يتطلب مكتبة pyarrow (pip install pyarrow).") from e
+
+    schema = _parquet_schema(kind)
+    rating_idx = columns.index('rating') if 'rating' in columns else None
+    total = 0
+
+    with pq.ParquetWriter(output_path, schema, compression=compression) as writer:
+        for chunk in _iter_chunks(rows, chunk_size):
+            # تحويل الصفوف إلى أعمدة (column arrays) مرة واحدة لكل دفعة
+            column_values = [list(col) for col in zip(*chunk)]
+            if rating_idx is not None:
+                column_values[rating_idx] = [parse_rating(r) for r in column_values[rating_idx]]
+            arrays = [pa.array(values, type=field.type) for values, field in zip(column_values, schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            total += len(chunk)
+
+    return total
+
+def _write_csv(rows, columns, output_path, chunk_size):
+    """كتابة الصفوف إلى CSV على دفعات مع تفريغ المخزن المؤقت بعد كل دفعة."""
+    total = 0
+    # utf-8-sig ليفتح Excel النصوص العربية بشكل صحيح (كما في تصدير فرص المبيعات)
+    with open(output_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in _iter_chunks(rows, chunk_size):
+            writer.writerows(chunk)
+            f.flush()
+            total += len(chunk)
+    return total
+
+# ----------------- 3. واجهة التصدير العامة -----------------
+
+def export_run(run_id, output_path, kind='reviews', fmt='parquet',
+               chunk_size=DEFAULT_CHUNK_SIZE, compression=DEFAULT_PARQUET_COMPRESSION):
+    """
+    تصدير مراجعات أو فرص مبيعات تشغيل واحد إلى ملف بشكل متدفق.
+
+    Args:
+        run_id: معرف التحليل (AnalysisRun.id)
+        output_path: مسار الملف الناتج
+        kind: 'reviews' أو 'opportunities'
+        fmt: 'parquet' أو 'csv'
+        chunk_size: عدد الصفوف المقروءة من قاعدة البيانات في كل دفعة
+        compression: خوارزمية ضغط Parquet (zstd, snappy, gzip...)
+
+    Returns:
+        عدد الصفوف المصدّرة
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"صيغة تصدير غير مدعومة: {fmt}")
+
+    db = SessionLocal()
+    try:
+        rows, columns = _query_for(db, kind, run_id, chunk_size)
+        if fmt == 'parquet':
+            total = _write_parquet(rows, kind, columns, output_path, chunk_size, compression)
+        else:
+            total = _write_csv(rows, columns, output_path, chunk_size)
+    finally:
+        db.close()
+
+    logger.info(f"✅ Exported {total} {kind} rows of run {run_id} to {output_path}")
+    return total
+
+def export_run_results(run_id, output_dir='.', fmt='parquet', basename=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    تصدير المراجعات وفرص المبيعات معاً لتشغيل واحد.
+    اسم الملفات مبني على output_filename من config.json.
+    إذا طُلبت صيغة Parquet ولم تكن pyarrow مثبتة، يتم التصدير إلى CSV بدلاً منها.
+
+    Returns:
+        dict: {kind: (output_path, row_count)}
+    """
+    basename = basename or get_default_export_basename()
+    if fmt == 'parquet' and not is_parquet_available():
+        logger.warning("⚠️ pyarrow is not installed, falling back to streaming CSV export")
+        fmt = 'csv'
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    for kind in EXPORT_KINDS:
+        output_path = os.path.join(output_dir, f"{basename}_run{run_id}_{kind}.{fmt}")
+        results[kind] = (output_path, export_run(run_id, output_path, kind, fmt, chunk_size))
+    return results
@@ -0,0 +1,154 @@
+# kpi_engine.py - محرك مؤشرات الأداء والعائد على الاستثمار (حسابات متجهة باستخدام NumPy)
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ----------------- إعدادات المحرك -----------------
+
+POSITIVE_LABELS = ('إيجابي', 'Positive')
+NEGATIVE_LABELS = ('سلبي', 'Negative')
+
+# السيناريوهات المعروضة في تبويب التسويق (مضاعف الميزانية)
+DEFAULT_SCENARIOS = OrderedDict([
+    ('المحافظ', 0.7),
+    ('المتوازن', 1.0),
+    ('العدواني', 1.5),
+])
+
+_KPI_CACHE_SIZE = 32
+_kpi_cache = OrderedDict()
+
+# ----------------- 1. مؤشرات الأداء الرئيسية -----------------
+
+def compute_kpis(labels, compound_scores=None, subjectivity=None, sales_intent=None):
+    """
+    حساب جميع مؤشرات الأداء في تمريرة متجهة واحدة على مصفوفات المشاعر.
+
+    Args:
+        labels: مصفوفة تصنيفات المشاعر (إيجابي/سلبي/محايد أو Positive/Negative/Neutral)
+        compound_scores: مصفوفة الدرجات المركبة (اختياري)
+        subjectivity: مصفوفة الموضوعية 0-1 (اختياري)
+        sales_intent: مصفوفة منطقية لفرص المبيعات (اختياري)
+
+    Returns:
+        dict يحتوي على المؤشرات (total_reviews, positive_pct, health_score, conversion_rate, ...)
+    """
+    labels = np.asarray(labels, dtype=object)
+    total = int(labels.size)
+
+    positive_count = int(np.count_nonzero(np.isin(labels, POSITIVE_LABELS)))
+    negative_count = int(np.count_nonzero(np.isin(labels, NEGATIVE_LABELS)))
+    opportunities = int(np.count_nonzero(np.asarray(sales_intent, dtype=bool))) if sales_intent is not None else 0
+
+    if total > 0:
+        positive_pct = positive_count / total * 100
+        negative_pct = negative_count / total * 100
+        health_score = float(np.clip(positive_pct - negative_pct * 2, 0, 100))
+        satisfaction_index = (positive_pct + 50 - negative_pct) / 1.5
+        recommendation_score = opportunities / total * 100
+    else:
+        positive_pct = negative_pct = health_score = recommendation_score = 0.0
+        satisfaction_index = 50.0
+
+    return {
+        'total_reviews': total,
+        'positive_count': positive_count,
+        'negative_count': negative_count,
+        'neutral_count': total - positive_count - negative_count,
+        'sales_opportunities': opportunities,
+        'positive_pct': positive_pct,
+        'negative_pct': negative_pct,
+        'health_score': health_score,
+        # معدل التحويل المتوقع = نسبة التعليقات الإيجابية
+        'conversion_rate': positive_pct,
+        'satisfaction_index': satisfaction_index,
+        'recommendation_score': recommendation_score,
+        'avg_compound': float(np.nanmean(compound_scores)) if compound_scores is not None and len(compound_scores) else 0.0,
+        'avg_subjectivity': float(np.nanmean(subjectivity)) if subjectivity is not None and len(subjectivity) else 0.0,
+    }
+
+def get_run_kpis(run_key, labels, compound_scores=None, subjectivity=None, sales_intent=None):
+    """
+    نسخة مخزنة مؤقتاً من compute_kpis لكل تشغيل (run_key مثل معرف التحليل).
+    تُعاد النتيجة من الذاكرة عند إعادة رسم الواجهة لنفس التشغيل.
+    إذا كان run_key يساوي None يتم الحساب دون تخزين.
+    """
+    if run_key is None:
+        return compute_kpis(labels, compound_scores, subjectivity, sales_intent)
+    if run_key in _kpi_cache:
+        _kpi_cache.move_to_end(run_key)
+        return _kpi_cache[run_key]
+
+    kpis = compute_kpis(labels, compound_scores, subjectivity, sales_intent)
+    _kpi_cache[run_key] = kpis
+    if len(_kpi_cache) > _KPI_CACHE_SIZE:
+        _kpi_cache.popitem(last=False)
+    return kpis
+
+def clear_kpi_cache():
+    """مسح ذاكرة المؤشرات المخزنة (مثلاً بعد حذف تحليل)."""
+    _kpi_cache.clear()
+
+# ----------------- 2. حاسبة الميزانية والعائد (ROI) -----------------
+
+def evaluate_scenario_grid(conversion_rate, budgets, costs_per_click, avg_order_values):
+    """
+    تقييم شبكة كاملة من السيناريوهات (ميزانية × CPC × متوسط قيمة الطلب) دفعة واحدة
+    باستخدام البث (broadcasting) في NumPy.
+
+    Returns:
+        dict من مصفوفات بشكل (len(budgets), len(costs_per_click), len(avg_order_values)):
+        clicks, conversions, revenue, roi
+    """
+    budget = np.asarray(budgets, dtype=float)[:, None, None]
+    cpc = np.asarray(costs_per_click, dtype=float)[None, :, None]
+    aov = np.asarray(avg_order_values, dtype=float)[None, None, :]
+
+    clicks = np.floor(np.divide(budget, cpc, out=np.zeros(np.broadcast_shapes(budget.shape, cpc.shape)), where=cpc > 0))
+    conversions = np.floor(clicks * (conversion_rate / 100))
+    revenue = conversions * aov
+    roi = np.divide(revenue - budget, budget, out=np.zeros(revenue.shape), where=budget > 0) * 100
+
+    shape = revenue.shape
+    return {
+        'clicks': np.broadcast_to(clicks, shape).astype(np.int64),
+        'conversions': np.broadcast_to(conversions, shape).astype(np.int64),
+        'revenue': revenue,
+        'roi': roi,
+    }
+
+def scenario_grid_to_dataframe(budgets, costs_per_click, avg_order_values, grid):
+    """تحويل نتيجة evaluate_scenario_grid إلى جدول طويل (صف لكل تركيبة)."""
+    b, c, a = np.meshgrid(budgets, costs_per_click, avg_order_values, indexing='ij')
+    return pd.DataFrame({
+        'الميزانية ($)': b.ravel(),
+        'تكلفة النقرة ($)': c.ravel(),
+        'متوسط قيمة الطلب ($)': a.ravel(),
+        'النقرات المتوقعة': grid['clicks'].ravel(),
+        'التحويلات المتوقعة': grid['conversions'].ravel(),
+        'الإيرادات المتوقعة ($)': grid['revenue'].ravel(),
+        'ROI المتوقع (%)': grid['roi'].ravel(),
+    })
+
+def build_scenarios_table(conversion_rate, budget, cost_per_click, avg_order_value, scenarios=DEFAULT_SCENARIOS):
+    """جدول مقارنة السيناريوهات المسماة (المحافظ/المتوازن/العدواني) محسوباً فعلياً لكل ميزانية."""
+    budgets = np.array(list(scenarios.values())) * budget
+    grid = evaluate_scenario_grid(conversion_rate, budgets, [cost_per_click], [avg_order_value])
+    return pd.DataFrame({
+        'السيناريو': list(scenarios.keys()),
+        'الميزانية ($)': budgets,
+        'التحويلات المتوقعة': grid['conversions'][:, 0, 0],
+        'الإيرادات المتوقعة ($)': grid['revenue'][:, 0, 0],
+        'ROI المتوقع (%)': grid['roi'][:, 0, 0],
+    })
+
+def build_sensitivity_table(conversion_rate, budgets, costs_per_click, avg_order_value):
+    """جدول حساسية ROI (صفوف = الميزانية، أعمدة = تكلفة النقرة) لمتوسط قيمة طلب ثابت."""
+    grid = evaluate_scenario_grid(conversion_rate, budgets, costs_per_click, [avg_order_value])
+    return pd.DataFrame(
+        grid['roi'][:, :, 0],
+        index=pd.Index(budgets, name='الميزانية ($)'),
+        columns=pd.Index([f"CPC ${c:.2f}" for c in costs_per_click], name='تكلفة النقرة'),
+    )
@@ -0,0 +1,252 @@
+# lexicons.py - موارد NLP محلية: معاجم مشاعر مُجمّعة مسبقاً بصيغة ثنائية تُقرأ عبر mmap
+#
+# لا تنزيل من الشبكة أثناء التشغيل: المعاجم تُشحن مع المستودع في resources/ (أو NLP_RESOURCES_DIR)
+# وتُفتح بـ mmap للقراءة فقط، فتتشارك صفحاتها كل عمليات ProcessPoolExecutor على نفس الجهاز.
+#
+# python lexicons.py build vader path/to/vader_lexicon.txt     # إعادة تجميع معجم VADER
+# python lexicons.py build arabic path/to/arabic_lexicon.tsv   # معجم عربي اختياري (نفس صيغة VADER)
+# python lexicons.py info
+
+import functools
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from collections import ChainMap
+from collections.abc import Mapping
+
+RESOURCES_DIR = os.getenv(
+    "NLP_RESOURCES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+)
+
+# اسم المعجم -> ملفه داخل RESOURCES_DIR
+LEXICONS = {
+    'vader': 'vader_lexicon.bin',    # vaderSentiment 3.3.2 (MIT، انظر resources/LICENSE-vader.txt)
+    'arabic': 'arabic_lexicon.bin',  # اختياري: يُضاف إلى VADER عند وجوده
+}
+
+class ResourceMissingError(RuntimeError):
+    """مورد NLP غير موجود محلياً (لا نحاول التنزيل من الشبكة)."""
+
+# ----------------- 1. الصيغة الثنائية -----------------
+#
+# ترويسة: magic, عدد الكلمات, حجم جدول التجزئة (قوة 2), حجم كتلة الكلمات
+# ثم: القيم float64[count] | جدول التجزئة uint32[table] (رقم الكلمة + 1، 0 = فارغ)
+#     | بدايات الكلمات uint32[count + 1] | الكلمات UTF-8 متتالية
+# كل الأعداد little-endian؛ القيم أولاً حتى تبقى محاذاة 8 بايت.
+
+MAGIC = b'LEX1'
+_HEADER = struct.Struct('<4sIII')
+
+def parse_lexicon_text(text):
+    """أسطر "كلمة<TAB>قيمة[<TAB>...]" (صيغة vader_lexicon.txt) -> [(word, valence)]؛ يتجاهل الفارغ و#."""
+    entries = []
+    for line in text.splitlines():
+        if not line.strip() or line.startswith('#'):
+            continue
+        word, measure = line.rstrip('\n').split('\t')[0:2]
+        entries.append((word, float(measure)))
+    return entries
+
+def compile_lexicon(entries, path):
+    """كتابة المعجم بالصيغة الثنائية (كتابة ذرية: ملف مؤقت ثم إعادة تسمية)."""
+    words = dict(entries)  # آخر قيمة للكلمة المكررة، كما في make_lex_dict
+    encoded = [word.encode('utf-8') for word in words]
+    table_size = 1
+    while table_size < max(len(encoded) * 2, 8):
+        table_size *= 2
+    mask = table_size - 1
+
+    table = array('I', bytes(4 * table_size))
+    offsets = array('I', [0])
+    for index, key in enumerate(encoded):
+        slot = zlib.crc32(key) & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = index + 1
+        offsets.append(offsets[-1] + len(key))
+    values = array('d', words.values())
+    if sys.byteorder == 'big':
+        for arr in (table, offsets, values):
+            arr.byteswap()
+
+    keys = b''.join(encoded)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(encoded), table_size, len(keys)))
+        f.write(values.tobytes())
+        f.write(table.tobytes())
+        f.write(offsets.tobytes())
+        f.write(keys)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+    return len(encoded)
+
+# ----------------- 2. القراءة عبر mmap -----------------
+
+_MISSING = object()
+
+class MappedLexicon(Mapping):
+    """
+    معجم للقراءة فقط فوق ملف mmap: الفتح لا يقرأ الملف (ميلي ثوانٍ)، والبحث تجزئة crc32
+    مع فحص خطي. الكلمات المطلوبة تُحفظ في ذاكرة صغيرة لكل عملية (_hot) لأن VADER يسأل
+    عن نفس الكلمات مرتين (in ثم []) وتتكرر الكلمات بين المراجعات.
+    """
+
+    def __init__(self, path, hot_limit=50_000):
+        self.path = path
+        self.hot_limit = hot_limit
+        self._hot = {}
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, table_size, keys_size = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a compiled lexicon (bad magic {magic!r})")
+        self._count = count
+        self._mask = table_size - 1
+
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+        sections = []
+        for typecode, length in (('d', count), ('I', table_size), ('I', count + 1)):
+            size = array(typecode).itemsize * length
+            section = view[pos:pos + size].cast(typecode)
+            if sys.byteorder == 'big':  # الملف little-endian: نسخة مقلوبة بدلاً من mmap
+                section = array(typecode, section.tobytes())
+                section.byteswap()
+            sections.append(section)
+            pos += size
+        self._values, self._table, self._offsets = sections
+        self._keys_start = pos
+        self.nbytes = len(self._mm)
+
+    def _find(self, key):
+        try:
+            encoded = key.encode('utf-8')
+        except AttributeError:
+            return -1
+        mm, table, offsets, start, mask = self._mm, self._table, self._offsets, self._keys_start, self._mask
+        slot = zlib.crc32(encoded) & mask
+        while True:
+            index = table[slot]
+            if not index:
+                return -1
+            index -= 1
+            if mm[start + offsets[index]:start + offsets[index + 1]] == encoded:
+                return index
+            slot = (slot + 1) & mask
+
+    def get(self, key, default=None):
+        value = self._hot.get(key, _MISSING)
+        if value is _MISSING:
+            index = self._find(key)
+            value = self._values[index] if index >= 0 else None
+            if len(self._hot) < self.hot_limit:
+                self._hot[key] = value
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        mm, offsets, start = self._mm, self._offsets, self._keys_start
+        for index in range(self._count):
+            yield mm[start + offsets[index]:start + offsets[index + 1]].decode('utf-8')
+
+    def close(self):
+        self._values = self._table = self._offsets = None
+        self._mm.close()
+
+# ----------------- 3. مدير الموارد -----------------
+
+def lexicon_path(name):
+    return os.path.join(RESOURCES_DIR, LEXICONS.get(name, f"{name}_lexicon.bin"))
+
+@functools.lru_cache(maxsize=None)
+def get_lexicon(name, required=True):
+    """
+    المعجم المُجمّع (مرة واحدة لكل عملية). معجم مطلوب غير موجود -> ResourceMissingError
+    مع طريقة تجميعه؛ معجم اختياري غير موجود -> None.
+    """
+    path = lexicon_path(name)
+    if not os.path.exists(path):
+        if not required:
+            return None
+        raise ResourceMissingError(
+            f"NLP resource '{name}' not found at {path}. Resources are never downloaded at runtime: "
+            f"compile it with `python lexicons.py build {name} <lexicon.txt>` or set NLP_RESOURCES_DIR "
+            f"to a directory that contains {os.path.basename(path)}."
+        )
+    return MappedLexicon(path)
+
+def sentiment_lexicon():
+    """معجم VADER، مع المعجم العربي أولاً إن وُجد."""
+    vader = get_lexicon('vader')
+    arabic = get_lexicon('arabic', required=False)
+    return ChainMap(arabic, vader) if arabic is not None else vader
+
+def load_vader_analyzer():
+    """
+    SentimentIntensityAnalyzer من nltk بنفس الخوارزمية لكن بمعجم mmap: بدون nltk.data
+    أو nltk.download أو تحليل ملف النص عند كل إقلاع.
+    """
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+
+    analyzer = SentimentIntensityAnalyzer.__new__(SentimentIntensityAnalyzer)
+    analyzer.lexicon = sentiment_lexicon()
+    analyzer.constants = VaderConstants()
+    return analyzer
+
+# ----------------- 4. سطر الأوامر -----------------
+
+def _main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Compile and inspect the bundled NLP lexicons.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="compile a word<TAB>valence text lexicon into resources/")
+    build.add_argument('name', help=f"lexicon name ({', '.join(LEXICONS)})")
+    build.add_argument('source', help="text lexicon (vader_lexicon.txt format)")
+    build.add_argument('--output', default=None)
+    sub.add_parser('info', help="list the bundled lexicons and their load time")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        with open(args.source, 'r', encoding='utf-8') as f:
+            entries = parse_lexicon_text(f.read())
+        output = args.output or lexicon_path(args.name)
+        count = compile_lexicon(entries, output)
+        print(f"✅ {count} entries -> {output} ({os.path.getsize(output) / 1024:.0f} KiB)")
+        return 0
+
+    for name in LEXICONS:
+        path = lexicon_path(name)
+        if not os.path.exists(path):
+            print(f"{name:<8} missing  {path}")
+            continue
+        started = time.perf_counter()
+        lexicon = MappedLexicon(path)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<8} {len(lexicon):>6} entries  {lexicon.nbytes / 1024:6.0f} KiB  "
+              f"open {elapsed * 1000:.2f} ms  {path}")
+        lexicon.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,224 @@
+"""
+llm_cache.py - Shared Gemini client, persistent response cache and request coalescing.
+
+Responses are keyed by (model, prompt hash, data snapshot version) and kept in an
+in-process LRU backed by the ai_response_cache table, both with TTL eviction.
+Identical requests that arrive while a call is in flight wait for that call
+instead of issuing their own.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = 'gemini-pro'
+DEFAULT_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", 6 * 3600))
+DEFAULT_MEMORY_ENTRIES = 256
+
+_models = {}
+_models_lock = threading.Lock()
+_default_cache = None
+
+# ----------------- Client singleton -----------------
+
+def get_gemini_model(api_key, model_name=DEFAULT_MODEL_NAME):
+    """
+    Return a shared GenerativeModel for (api_key, model_name).
+    genai.configure() and model construction happen once per key instead of on every use.
+    """
+    key = (hashlib.sha256(api_key.encode('utf-8')).hexdigest(), model_name)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(model_name)
+            _models[key] = model
+        return model
+
+
+def model_identity(model):
+    """Stable name for a model object (GenerativeModel.model_name, or the class name for fakes)."""
+    return getattr(model, 'model_name', None) or type(model).__name__
+
+# ----------------- Keys -----------------
+
+def hash_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def data_snapshot_version(*frames):
+    """
+    Version string for the data a prompt was built from: changes whenever rows are
+    added, removed or edited. Uses pandas' vectorized row hashing.
+    """
+    import pandas as pd
+
+    digest = hashlib.sha256()
+    for frame in frames:
+        if frame is None or frame.empty:
+            digest.update(b'-')
+            continue
+        digest.update(f"{frame.shape}|{','.join(map(str, frame.columns))}".encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+
+def make_cache_key(model_name, prompt_hash, data_version=None):
+    return hash_text(f"{model_name}|{prompt_hash}|{data_version or ''}")
+
+# ----------------- Cache -----------------
+
+class ResponseCache:
+    """
+    Two-level TTL cache: an in-process LRU in front of the ai_response_cache table
+    (persistent=False keeps it memory-only, e.g. for offline runs with a fake model).
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 persistent=True):
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.persistent = persistent
+        self._memory = OrderedDict()  # cache_key -> (expires_monotonic, text)
+        self._inflight = {}           # cache_key -> Future
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'db_hits': 0, 'misses': 0, 'coalesced': 0}
+
+    def get_or_generate(self, model_name, prompt, generate, data_version=None):
+        """
+        Return the cached response for this (model, prompt, data_version), or call
+        generate() once (concurrent identical requests share the same call).
+        Exceptions from generate() propagate to every waiter and nothing is cached.
+        """
+        key = make_cache_key(model_name, hash_text(prompt), data_version)
+
+        with self._lock:
+            text = self._memory_get(key)
+            if text is not None:
+                self.stats['hits'] += 1
+                return text
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats['coalesced'] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            text = self._db_get(key)
+            if text is not None:
+                self.stats['db_hits'] += 1
+            else:
+                self.stats['misses'] += 1
+                text = generate()
+                self._db_put(key, model_name, hash_text(prompt), data_version, text)
+            with self._lock:
+                self._memory_put(key, text)
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    # --- in-process LRU ---
+
+    def _memory_get(self, key):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry[1]
+
+    def _memory_put(self, key, text):
+        self._memory[key] = (time.monotonic() + self.ttl_seconds, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    # --- persistent table ---
+
+    def _db_get(self, key):
+        if not self.persistent:
+            return None
+        from database import SessionLocal
+        from models import AIResponseCache
+
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(AIResponseCache)
+                .filter(AIResponseCache.cache_key == key, AIResponseCache.expires_at > datetime.utcnow())
+                .first()
+            )
+            if row is None:
+                return None
+            row.hit_count = (row.hit_count or 0) + 1
+            db.commit()
+            return row.response_text
+        except Exception as e:
+            logger.warning(f"AI response cache lookup failed: {e}")
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def _db_put(self, key, model_name, prompt_hash, data_version, text):
+        if not self.persistent:
+            return
+        from database import SessionLocal
+        from models import AIResponseCache
+
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.query(AIResponseCache).filter(
+                (AIResponseCache.cache_key == key) | (AIResponseCache.expires_at <= now)
+            ).delete(synchronize_session=False)
+            db.add(AIResponseCache(
+                cache_key=key,
+                model_name=model_name,
+                prompt_hash=prompt_hash,
+                data_version=data_version,
+                response_text=text,
+                hit_count=0,
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+            ))
+            db.commit()
+        except Exception as e:
+            logger.warning(f"AI response cache write failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+def get_response_cache():
+    """Process-wide ResponseCache shared by all dashboard sessions."""
+    global _default_cache
+    with _models_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
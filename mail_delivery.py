@@ -0,0 +1,324 @@
+# mail_delivery.py - خدمة إرسال البريد عبر اتصال SMTP دائم مع طابور وتسجيل مجمّع
+
+import atexit
+import logging
+import smtplib
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from database import SessionLocal
+from models import EmailNotification
+
+logger = logging.getLogger(__name__)
+
+# ----------------- إعدادات الخدمة -----------------
+
+DEFAULT_IDLE_TIMEOUT = 60      # ثوانٍ: بعدها نتحقق من الاتصال بأمر NOOP قبل الإرسال
+DEFAULT_MAX_RETRIES = 2        # محاولات إعادة الاتصال لكل رسالة
+DEFAULT_LOG_BATCH_SIZE = 100   # عدد سجلات EmailNotification المحفوظة في كل عملية إدراج
+DEFAULT_LOG_FLUSH_SECONDS = 5  # أقصى مدة يبقى فيها سجل إرسال في الذاكرة قبل حفظه
+
+_services = {}
+_services_lock = threading.Lock()
+
+# ----------------- 1. بناء الرسائل -----------------
+
+def build_message(sender, recipient, subject, body, is_html=False):
+    """إنشاء رسالة MIME جاهزة للإرسال."""
+    message = MIMEMultipart('alternative')
+    message['From'] = sender
+    message['To'] = recipient
+    message['Subject'] = subject
+    message.attach(MIMEText(body, 'html' if is_html else 'plain', 'utf-8'))
+    return message
+
+# ----------------- 2. خدمة الإرسال -----------------
+
+class SMTPDeliveryService:
+    """
+    تحافظ على اتصال SMTP مصادق عليه وتعيد استخدامه لكل الرسائل،
+    مع إعادة الاتصال تلقائياً عند انقطاعه وحفظ سجلات الإرسال على دفعات.
+    """
+
+    def __init__(self, smtp_server, smtp_port, username=None, password=None, sender=None,
+                 use_tls=True, timeout=30, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, log_batch_size=DEFAULT_LOG_BATCH_SIZE,
+                 log_flush_seconds=DEFAULT_LOG_FLUSH_SECONDS, log_to_db=True):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.log_batch_size = log_batch_size
+        self.log_flush_seconds = log_flush_seconds
+        self.log_to_db = log_to_db
+
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.RLock()
+        self._queue = deque()
+        self._pending_logs = []
+        self._log_timer = None  # حفظ السجلات المتراكمة بعد log_flush_seconds إذا لم يكتمل حجم الدفعة
+        self.stats = {'sent': 0, 'failed': 0, 'reconnects': 0, 'elapsed': 0.0}
+
+    @classmethod
+    def from_email_config(cls, email_config, **kwargs):
+        """إنشاء الخدمة من قسم email في config.json."""
+        return cls(
+            smtp_server=email_config.get('smtp_server', 'smtp.gmail.com'),
+            smtp_port=email_config.get('smtp_port', 587),
+            username=email_config.get('sender'),
+            password=email_config.get('password'),
+            sender=email_config.get('sender'),
+            use_tls=email_config.get('smtp_use_tls', True),
+            **kwargs
+        )
+
+    # --- إدارة الاتصال ---
+
+    def _connect(self):
+        """فتح اتصال جديد (STARTTLS + تسجيل الدخول مرة واحدة فقط)."""
+        self._close_quietly()
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self._server = server
+        logger.info(f"📡 SMTP connection opened to {self.smtp_server}:{self.smtp_port}")
+
+    def _close_quietly(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _ensure_connection(self):
+        """التأكد من أن الاتصال حي؛ بعد فترة خمول يتم فحصه بأمر NOOP."""
+        if self._server is None:
+            self._connect()
+        elif time.monotonic() - self._last_used > self.idle_timeout:
+            try:
+                status, _ = self._server.noop()
+                if status != 250:
+                    raise smtplib.SMTPServerDisconnected(f"NOOP returned {status}")
+            except (smtplib.SMTPException, OSError):
+                self.stats['reconnects'] += 1
+                self._connect()
+
+    def close(self):
+        """إرسال ما تبقى في الطابور وحفظ السجلات ثم إغلاق الاتصال."""
+        with self._lock:
+            self.flush()
+            self._close_quietly()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- الإرسال ---
+
+    def _send_message(self, message, recipient):
+        """إرسال رسالة واحدة عبر الاتصال الحالي مع إعادة الاتصال عند الفشل."""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._ensure_connection()
+                self._server.send_message(message, from_addr=self.sender, to_addrs=[recipient])
+                self._last_used = time.monotonic()
+                return None
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                # رفض الرسالة نفسها (مستلم غير صالح...) لا يستدعي إعادة المحاولة؛ الاتصال يبقى صالحاً
+                # (يجب أن يسبق OSError: كل استثناءات smtplib مشتقة منه)
+                self._last_used = time.monotonic()
+                return str(e)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError,
+                    socket.timeout) as e:
+                # الاتصال انقطع: نغلقه ونعيد فتحه ونحاول مجدداً
+                last_error = e
+                self.stats['reconnects'] += 1
+                self._close_quietly()
+            except OSError as e:
+                # باقي أخطاء smtplib والشبكة (مصادقة، عنوان خادم غير صالح...) لا تحلها إعادة المحاولة
+                return str(e)
+        return str(last_error)
+
+    def send(self, recipient, subject, body, analysis_run_id=None, is_html=False):
+        """
+        إرسال رسالة فوراً عبر الاتصال المشترك.
+
+        Returns:
+            True إذا تم الإرسال بنجاح، False خلاف ذلك
+        """
+        with self._lock:
+            started = time.perf_counter()
+            message = build_message(self.sender, recipient, subject, body, is_html)
+            error = self._send_message(message, recipient)
+            self.stats['elapsed'] += time.perf_counter() - started
+            self._record(recipient, subject, body, analysis_run_id, error)
+            if len(self._pending_logs) >= self.log_batch_size:
+                self.flush_logs()
+            elif self._pending_logs:
+                self._schedule_log_flush()
+            return error is None
+
+    def enqueue(self, recipient, subject, body, analysis_run_id=None, is_html=False):
+        """إضافة رسالة إلى الطابور لإرسالها لاحقاً مع flush()."""
+        self._queue.append((recipient, subject, body, analysis_run_id, is_html))
+
+    def flush(self):
+        """
+        إرسال جميع الرسائل في الطابور عبر اتصال واحد ثم حفظ السجلات دفعة واحدة.
+
+        Returns:
+            dict: إحصائيات هذه الدفعة (sent, failed, elapsed, messages_per_sec)
+        """
+        with self._lock:
+            sent = failed = 0
+            started = time.perf_counter()
+            while self._queue:
+                recipient, subject, body, analysis_run_id, is_html = self._queue.popleft()
+                message = build_message(self.sender, recipient, subject, body, is_html)
+                error = self._send_message(message, recipient)
+                self._record(recipient, subject, body, analysis_run_id, error)
+                if error is None:
+                    sent += 1
+                else:
+                    failed += 1
+                if len(self._pending_logs) >= self.log_batch_size:
+                    self.flush_logs()
+            elapsed = time.perf_counter() - started
+            self.stats['elapsed'] += elapsed
+            self.flush_logs()
+
+        batch_stats = {
+            'sent': sent,
+            'failed': failed,
+            'elapsed': elapsed,
+            'messages_per_sec': (sent + failed) / elapsed if elapsed > 0 else 0.0,
+        }
+        if sent or failed:
+            logger.info(f"✅ SMTP batch delivered: {sent} sent, {failed} failed, "
+                        f"{batch_stats['messages_per_sec']:.1f} msg/s")
+        return batch_stats
+
+    @property
+    def messages_per_sec(self):
+        """معدل الإرسال التراكمي منذ إنشاء الخدمة."""
+        total = self.stats['sent'] + self.stats['failed']
+        return total / self.stats['elapsed'] if self.stats['elapsed'] > 0 else 0.0
+
+    # --- سجل الإشعارات ---
+
+    def _record(self, recipient, subject, body, analysis_run_id, error):
+        if error is None:
+            self.stats['sent'] += 1
+            logger.info(f"✅ Email sent successfully to {recipient}")
+        else:
+            self.stats['failed'] += 1
+            logger.error(f"❌ Failed to send email to {recipient}: {error}")
+        if self.log_to_db:
+            self._pending_logs.append({
+                'analysis_run_id': analysis_run_id,
+                'recipient': recipient,
+                'subject': subject[:500],
+                'body': body[:5000],  # حد أقصى 5000 حرف
+                'sent_status': 'Sent' if error is None else 'Failed',
+                'error_message': error,
+                'sent_at': datetime.utcnow(),
+            })
+
+    def _schedule_log_flush(self):
+        if self._log_timer is None:
+            self._log_timer = threading.Timer(self.log_flush_seconds, self._flush_logs_on_timer)
+            self._log_timer.daemon = True
+            self._log_timer.start()
+
+    def _flush_logs_on_timer(self):
+        with self._lock:
+            self._log_timer = None
+            self.flush_logs()
+
+    def flush_logs(self):
+        """حفظ سجلات EmailNotification المتراكمة بإدراج مجمّع واحد."""
+        with self._lock:
+            if self._log_timer is not None:
+                self._log_timer.cancel()
+                self._log_timer = None
+            if not self._pending_logs:
+                return 0
+            logs, self._pending_logs = self._pending_logs, []
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(EmailNotification, logs)
+            db.commit()
+            return len(logs)
+        except Exception as e:
+            logger.error(f"Failed to save email notification logs: {e}")
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+
+# ----------------- 3. سجل الخدمات المشتركة -----------------
+
+def get_delivery_service(smtp_server, smtp_port, username=None, password=None, sender=None, use_tls=True):
+    """
+    إرجاع خدمة إرسال مشتركة لكل (خادم، منفذ، مستخدم) حتى تعيد جميع أجزاء
+    التطبيق استخدام نفس الاتصال بدلاً من فتح اتصال لكل رسالة.
+    """
+    key = (smtp_server, smtp_port, username, sender, use_tls)
+    with _services_lock:
+        service = _services.get(key)
+        if service is not None and service.password != password:
+            # كلمة مرور جديدة: إغلاق الاتصال القديم (وحفظ سجلاته) قبل استبداله
+            service.close()
+            service = None
+        if service is None:
+            service = SMTPDeliveryService(smtp_server, smtp_port, username, password, sender, use_tls)
+            _services[key] = service
+        return service
+
+def close_all_services():
+    """إغلاق جميع الاتصالات المشتركة (عند إيقاف التطبيق)."""
+    with _services_lock:
+        for service in _services.values():
+            service.close()
+        _services.clear()
+
+atexit.register(close_all_services)  # حفظ سجلات الإرسال المتبقية في الذاكرة عند الخروج
+
+# ----------------- اختبار محلي باستخدام aiosmtpd -----------------
+
+if __name__ == "__main__":
+    # تشغيل خادم SMTP محلي (pip install aiosmtpd) وقياس معدل الإرسال
+    import sys
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.handlers import Sink
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    controller = Controller(Sink(), hostname='127.0.0.1', port=8025)
+    controller.start()
+    try:
+        with SMTPDeliveryService('127.0.0.1', 8025, sender='bench@localhost',
+                                 use_tls=False, log_to_db=False) as service:
+            for i in range(count):
+                service.enqueue('sink@localhost', f"رسالة اختبار {i}", f"<p>المحتوى {i}</p>", is_html=True)
+            stats = service.flush()
+        print(f"أُرسلت {stats['sent']} رسالة ({stats['failed']} فشل) في {stats['elapsed']:.2f} ثانية "
+              f"-> {stats['messages_per_sec']:.1f} رسالة/ثانية")
+    finally:
+        controller.stop()
@@ -1,19 +1,36 @@
 # main.py
 
 import asyncio
-from scraper_core import run_scraper_and_analysis
+from profiling import PROFILE_MODES
 from config import (
     DEFAULT_DB_URL,
     DEFAULT_START_URL,
     DEFAULT_PAGES_TO_SCRAPE,
-    DEFAULT_CONCURRENCY_LIMIT
+    DEFAULT_CONCURRENCY_LIMIT,
+    DEFAULT_GLOBAL_CONCURRENCY,
+    EXPORT_FORMATS
 )
 import argparse
+import os
+# وحدات الزحف/التصدير (aiohttp, SQLAlchemy, bs4...) تُستورد داخل الفرع المطلوب فقط،
+# حتى لا يدفع --help أو أمر التصدير ثمن استيراد كل شيء.
+
+def dispatch_notifications():
+    """لا يعمل موزّع خلفي في سطر الأوامر: إرسال إشعارات التشغيل المستحقة مرة واحدة قبل الخروج."""
+    from config import get_alert_digest_window
+    from notifier import get_notifier_delivery_service
+    from outbox import dispatch_all_pending
+
+    stats = dispatch_all_pending(get_notifier_delivery_service(), digest_window=get_alert_digest_window())
+    if any(stats.values()):
+        print(f"📬 Notifications: {stats['sent']} sent, {stats['retry']} queued for retry, {stats['dead']} failed")
 
 def parse_args():
     """Parses command-line arguments."""
     parser = argparse.ArgumentParser(
-        description="Run a concurrent web scraper and sentiment analyzer."
+        description="Run a concurrent web scraper and sentiment analyzer.",
+        epilog="Crawl runs queue their notifications in the outbox and send what is due once before exiting. "
+               "Retries and alert digests (ALERT_DIGEST_MINUTES) need the dispatcher worker: python outbox.py"
     )
     parser.add_argument(
         '--url',
@@ -37,12 +54,99 @@ def parse_args():
         '--db_url',
         type=str,
         default=DEFAULT_DB_URL,
-        help="The PostgreSQL database connection URL."
+        help="Database connection URL for every mode (default: DATABASE_URL)."
+    )
+    parser.add_argument(
+        '--export_run',
+        type=int,
+        default=None,
+        help="Export the reviews and sales opportunities of an existing analysis run ID instead of scraping."
+    )
+    parser.add_argument(
+        '--export_format',
+        type=str,
+        choices=EXPORT_FORMATS,
+        default='parquet',
+        help="Export file format (default: parquet, falls back to csv if pyarrow is missing)"
+    )
+    parser.add_argument(
+        '--output_dir',
+        type=str,
+        default='.',
+        help="Directory for exported files (default: current directory)"
+    )
+    parser.add_argument(
+        '--configs',
+        type=str,
+        nargs='+',
+        default=None,
+        help="Batch mode: crawl several sites concurrently, one config*.json per site (each gets its own analysis run)."
     )
-    return parser.parse_args()
+    parser.add_argument(
+        '--global_concurrency',
+        type=int,
+        default=DEFAULT_GLOBAL_CONCURRENCY,
+        help=f"Batch mode: maximum concurrent requests across all sites (default: {DEFAULT_GLOBAL_CONCURRENCY}); "
+             "--concurrency is the per-site limit."
+    )
+    parser.add_argument(
+        '--resume',
+        type=int,
+        default=None,
+        metavar='RUN_ID',
+        help="Resume an interrupted crawl from its last checkpoint (--url and --configs runs are both checkpointed)."
+    )
+    parser.add_argument(
+        '--enrich_run',
+        type=int,
+        default=None,
+        help="Extract themes and intent labels for the reviews of an existing analysis run ID with Gemini (resumable)."
+    )
+    parser.add_argument(
+        '--rebuild_rollups',
+        action='store_true',
+        help="Rebuild the daily sentiment rollups (trend chart) from all completed analysis runs and exit."
+    )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        nargs='?',
+        const='sampling',
+        choices=PROFILE_MODES,
+        default=None,
+        help="Profile the run (default mode: sampling; or cprofile). The report is stored in run_profiles "
+             "and shown in the dashboard log tab."
+    )
+    args = parser.parse_args()
+    if args.enrich_run is not None and not os.getenv("GEMINI_API_KEY"):
+        parser.error("GEMINI_API_KEY is required for --enrich_run")
+    return args
 
 if __name__ == "__main__":
     args = parse_args()
+
+    # كل الأوامر (التصدير، الاستئناف، الزحف المتعدد...) تعمل على القاعدة المحددة بـ --db_url
+    import database
+    database.use_database(args.db_url)
+
+    if args.export_run is not None:
+        from exporter import export_run_results
+        results = export_run_results(args.export_run, args.output_dir, args.export_format)
+        for kind, (path, count) in results.items():
+            print(f"✅ Exported {count} {kind} rows to {path}")
+        raise SystemExit(0)
+
+    if args.rebuild_rollups:
+        from rollups import rebuild_rollups
+        print(f"✅ Rebuilt {rebuild_rollups()} daily rollup rows")
+        raise SystemExit(0)
+
+    if args.enrich_run is not None:
+        from enrichment import enrich_analysis_run
+        from llm_cache import get_gemini_model
+        stats = enrich_analysis_run(args.enrich_run, get_gemini_model(os.getenv("GEMINI_API_KEY")))
+        print(f"✅ Enriched {stats['enriched']}/{stats['reviews']} reviews ({stats['reviews_per_sec']:.1f} reviews/s)")
+        raise SystemExit(0)
     
     # Check if a loop is already running (e.g., in Jupyter/Colab)
     try:
@@ -55,9 +159,36 @@ if __name__ == "__main__":
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
 
+    if args.resume is not None:
+        from batch_crawl import resume_crawl
+        total_pages = resume_crawl(args.resume, global_concurrency=args.global_concurrency)
+        print(f"✅ Run {args.resume} completed with {total_pages} pages")
+        dispatch_notifications()
+        raise SystemExit(0)
+
+    if args.configs:
+        from batch_crawl import run_batch_crawl
+        summaries, elapsed = run_batch_crawl(
+            args.configs,
+            pages_to_scrape=args.pages,
+            global_concurrency=args.global_concurrency,
+            site_concurrency=args.concurrency,
+            profile=args.profile
+        )
+        for summary in summaries:
+            status = '✅' if summary['status'] == 'completed' else f"❌ {summary['error']}"
+            print(f"{status} {summary['target_site'] or summary['config_path']} (run {summary['run_id']}): "
+                  f"{summary['pages']} pages, {summary['reviews']} reviews in {summary['elapsed']:.1f}s")
+        print(f"⏱️ Total wall-clock time: {elapsed:.1f}s")
+        dispatch_notifications()
+        raise SystemExit(0)
+
+    from scraper_core import run_scraper_and_analysis
     run_scraper_and_analysis(
         db_url=args.db_url,
         start_url=args.url,
         pages_to_scrape=args.pages,
-        concurrency=args.concurrency
-    )
\ No newline at end of file
+        concurrency=args.concurrency,
+        profile=args.profile
+    )
+    dispatch_notifications()
\ No newline at end of file
@@ -1,6 +1,6 @@
 # models.py - نماذج قاعدة البيانات
 
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Boolean, Date, DateTime, Text, LargeBinary, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -36,7 +36,7 @@ class Review(Base):
     analysis_run_id = Column(Integer, ForeignKey('analysis_runs.id'), nullable=False)
     
     title = Column(String(1000), nullable=True)
-    review_text = Column(Text, nullable=False)
+    review_text = Column(Text, nullable=True) # NULL للمكررات: النص في المراجعة الأصلية
     rating = Column(String(50), nullable=True) # يمكن أن يكون string مثل "4/5"
     sentiment_label = Column(String(50), nullable=True) # إيجابي، سلبي، محايد
     compound_score = Column(Float, nullable=True) # درجة المشاعر المركبة
@@ -44,6 +44,11 @@ class Review(Base):
     language = Column(String(10), default='unknown')
     has_sales_intent = Column(Boolean, default=False)
     scraped_at = Column(DateTime, default=datetime.utcnow)
+
+    # إزالة التكرار (text_dedup): بصمة النص المطبّع وتوقيع MinHash، والمكررة تشير إلى الأصلية
+    content_hash = Column(BigInteger, nullable=True, index=True)
+    minhash = Column(LargeBinary, nullable=True)
+    duplicate_of_id = Column(Integer, ForeignKey('reviews.id'), nullable=True, index=True)
     
     # العلاقة
     analysis_run = relationship("AnalysisRun", back_populates="reviews")
@@ -75,7 +80,125 @@ class EmailNotification(Base):
     subject = Column(String(500), nullable=False)
     body = Column(Text, nullable=False)
     sent_status = Column(String(50), default='Pending') # Sent, Failed, Pending
+    error_message = Column(Text, nullable=True)
     sent_at = Column(DateTime, default=datetime.utcnow)
     
     # العلاقة
-    analysis_run_id_fk = relationship("AnalysisRun")
\ No newline at end of file
+    analysis_run_id_fk = relationship("AnalysisRun")
+
+class DailySentimentRollup(Base):
+    """جدول تجميعي (موقع × يوم) يُحدَّث تدريجياً عند اكتمال كل عملية تحليل."""
+    __tablename__ = 'daily_sentiment_rollups'
+    __table_args__ = (
+        # فهرس مركب يجعل استعلام الاتجاه لسنة كاملة مسحاً واحداً للفهرس
+        UniqueConstraint('target_site', 'day', name='uq_rollup_site_day'),
+        Index('ix_rollup_day_site', 'day', 'target_site'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    target_site = Column(String(500), nullable=False)
+    day = Column(Date, nullable=False)
+    runs_count = Column(Integer, default=0)
+    total_reviews = Column(Integer, default=0)
+    positive_count = Column(Integer, default=0)
+    negative_count = Column(Integer, default=0)
+    neutral_count = Column(Integer, default=0)
+    compound_sum = Column(Float, default=0.0)  # مجموع الدرجات المركبة (لحساب المتوسط تدريجياً)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class NotificationOutbox(Base):
+    """
+    صندوق الإشعارات الصادرة (Outbox): تُكتب الإشعارات هنا في نفس معاملة نتائج التحليل،
+    ثم يرسلها موزّع في الخلفية مع إعادة المحاولة.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_run_id = Column(Integer, ForeignKey('analysis_runs.id'), nullable=True)
+    review_id = Column(Integer, ForeignKey('reviews.id'), nullable=True)
+    kind = Column(String(50), nullable=False)  # run_completed, run_failed, critical_alert
+    dedup_key = Column(String(255), nullable=False, unique=True)  # يمنع إرسال نفس الإشعار مرتين
+    recipient = Column(String(255), nullable=False)
+    subject = Column(String(500), nullable=True)
+    body = Column(Text, nullable=True)
+    payload = Column(Text, nullable=True)  # JSON لبيانات التنبيه (تُبنى الرسالة عند الإرسال)
+    status = Column(String(50), default='pending')  # pending, sending, sent, dead
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+class AIResponseCache(Base):
+    """
+    ذاكرة دائمة لردود المساعد الذكي، مفتاحها (النموذج، بصمة الطلب، إصدار البيانات)،
+    مع تاريخ انتهاء صلاحية لكل رد.
+    """
+    __tablename__ = 'ai_response_cache'
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), nullable=False, unique=True)  # sha256(model|prompt_hash|data_version)
+    model_name = Column(String(255), nullable=False)
+    prompt_hash = Column(String(64), nullable=False)
+    data_version = Column(String(64), nullable=True)
+    response_text = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class ReviewEnrichment(Base):
+    """
+    نتائج الإثراء بالنموذج اللغوي لكل مراجعة (المواضيع ونوع النية).
+    وجود الصف يعني أن المراجعة عولجت، لذلك يُستخدم الجدول أيضاً كنقطة استئناف.
+    """
+    __tablename__ = 'review_enrichments'
+    __table_args__ = (
+        Index('ix_enrichment_run_intent', 'analysis_run_id', 'intent'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    review_id = Column(Integer, ForeignKey('reviews.id'), nullable=False, unique=True)
+    analysis_run_id = Column(Integer, ForeignKey('analysis_runs.id'), nullable=False)
+    themes = Column(Text, nullable=True)  # JSON: قائمة المواضيع
+    intent = Column(String(50), nullable=True)  # purchase, feature_request, complaint, praise, question, other
+    model_name = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CrawlCheckpoint(Base):
+    """
+    نقطة استئناف الزحف لكل تشغيل: الروابط المتبقية (frontier)، مجموعة الروابط المزارة،
+    وعدد الصفحات التي حُفظت نتائجها في جدول reviews (watermark).
+    """
+    __tablename__ = 'crawl_checkpoints'
+
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_run_id = Column(Integer, ForeignKey('analysis_runs.id'), nullable=False, unique=True)
+    config_json = Column(Text, nullable=False)  # إعدادات الموقع وقت بدء التشغيل
+    start_url = Column(String(1000), nullable=False)
+    pages_to_scrape = Column(Integer, nullable=False)
+    concurrency = Column(Integer, nullable=False)
+    frontier = Column(Text, nullable=True)  # JSON: الروابط المكتشفة التي لم تكتمل
+    seen_state = Column(LargeBinary, nullable=True)  # مجموعة الروابط المزارة (مضغوطة)
+    pages_done = Column(Integer, default=0)
+    results_flushed = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RunProfile(Base):
+    """
+    تقرير أداء (profiling) لتشغيل تحليل: ملخص أكثر الدوال استهلاكاً وتوقيت مهام asyncio،
+    مع الملفات الخام (pstats أو مكدسات مطوية جاهزة لـ flamegraph) مضغوطة.
+    """
+    __tablename__ = 'run_profiles'
+
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_run_id = Column(Integer, ForeignKey('analysis_runs.id'), nullable=True, index=True)
+    label = Column(String(1000), nullable=True)  # وصف التشغيل (للتشغيلات بدون سجل AnalysisRun)
+    mode = Column(String(20), nullable=False)  # sampling, cprofile
+    duration_seconds = Column(Float, nullable=True)
+    summary_json = Column(Text, nullable=True)  # JSON: top_functions, asyncio_tasks
+    folded_stacks = Column(LargeBinary, nullable=True)  # zlib: "stack;frames count" لكل سطر
+    pstats_data = Column(LargeBinary, nullable=True)  # zlib(marshal) بصيغة ملف .prof
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,12 +1,32 @@
 # nltk_setup.py
-import nltk
 import logging
-logging.getLogger('nltk').setLevel(logging.WARNING)
-print("--- جاري التحقق من موارد NLTK المطلوبة... ---")
 
-# تحميل الموارد الضرورية لتحليل المشاعر
-nltk.download('vader_lexicon', quiet=True)
-nltk.download('wordnet', quiet=True)
-nltk.download('punkt', quiet=True)
+# اسم المورد -> مساره داخل nltk_data (للتحقق قبل التنزيل).
+# معجم VADER لا يُنزَّل: نسخة مُجمّعة منه تُشحن في resources/ (انظر lexicons.py).
+NLTK_RESOURCES = {
+    'wordnet': 'corpora/wordnet',
+    'punkt': 'tokenizers/punkt',
+}
 
-print("NLTK: اكتمل تحميل موارد NLTK بنجاح.")
+def ensure_nltk_resources(names=tuple(NLTK_RESOURCES)):
+    """
+    تنزيل موارد NLTK الناقصة فقط (التحقق المحلي سريع، والتنزيل يحدث مرة واحدة لكل جهاز).
+    أداة إعداد يدوية تحتاج الشبكة؛ مسار التحليل نفسه لا يستدعيها.
+    """
+    import nltk
+    logging.getLogger('nltk').setLevel(logging.WARNING)
+
+    downloaded = []
+    for name in names:
+        try:
+            nltk.data.find(NLTK_RESOURCES.get(name, name))
+        except LookupError:
+            nltk.download(name, quiet=True)
+            downloaded.append(name)
+    return downloaded
+
+if __name__ == "__main__":
+    print("--- جاري التحقق من موارد NLTK المطلوبة... ---")
+    # تحميل الموارد الضرورية لتحليل المشاعر
+    missing = ensure_nltk_resources()
+    print(f"NLTK: اكتمل تحميل موارد NLTK بنجاح ({', '.join(missing) or 'كلها موجودة مسبقاً'}).")
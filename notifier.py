@@ -1,17 +1,14 @@
 # notifier.py - خدمة الإشعارات التلقائية وإرسال التقارير
 
-import smtplib
-from email.mime.text import MIMEText
-from datetime import datetime
 import os
 from typing import Optional
 
-# افتراض أنك تعمل ضمن بيئة مشروع بايثون
-# من الضروري توفر الملفات والوحدات التالية:
-# - db_helpers: يحتوي على دوال التفاعل مع قاعدة البيانات مثل get_review_stats
-# - models: يحتوي على تعريف الكلاس AnalysisRun
-from db_helpers import get_db, create_email_notification, get_review_stats, get_analysis_run
-from models import AnalysisRun 
+from database import SessionLocal
+from exporter import parse_rating
+from models import AnalysisRun, Review
+from mail_delivery import get_delivery_service
+from email_templates import render_run_report, render_run_failure
+from outbox import enqueue_notification, KIND_RUN_COMPLETED, KIND_RUN_FAILED
 
 # ----------------- إعدادات الإرسال (يجب تخصيصها) -----------------
 # التوصية: استخدم os.getenv() لقراءة متغيرات البيئة بدلاً من الثوابت المباشرة
@@ -19,6 +16,7 @@ SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_USERNAME = os.getenv("SMTP_USERNAME", "notifications@yourdomain.com") 
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "YOUR_APP_PASSWORD") 
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() != "false"
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", "system@analysisapp.com")
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@yourcompany.com")
 
@@ -26,66 +24,18 @@ ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@yourcompany.com")
 
 def build_report_body(run: AnalysisRun, stats: dict) -> str:
     """ بناء محتوى رسالة البريد الإلكتروني على هيئة HTML لتقرير مكتمل. """
-    
-    # تأمين القيمة في حالة كانت None
-    completed_at_str = run.completed_at.strftime('%Y-%m-%d %H:%M:%S') if run.completed_at else 'N/A'
-    
-    html_body = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; direction: rtl; text-align: right; background-color: #f4f4f4; padding: 20px;">
-            <div style="max-width: 600px; margin: auto; background: white; padding: 20px; border-radius: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.05);">
-                <h2 style="color: #4CAF50;">✅ اكتمال تحليل مراجعات الموقع - تقرير موجز</h2>
-                <p><strong>معرّف التشغيل (ID):</strong> {run.id}</p>
-                <p><strong>الموقع المستهدف:</strong> {run.target_site}</p>
-                <p><strong>حالة التشغيل:</strong> <span style="color: green; font-weight: bold;">مكتملة</span></p>
-                <hr style="border: 0; border-top: 1px solid #eee;">
-                
-                <h3>الإحصائيات الرئيسية:</h3>
-                <ul style="list-style: none; padding: 0;">
-                    <li style="padding: 5px 0;"><strong>إجمالي المراجعات:</strong> {run.total_reviews}</li>
-                    <li style="padding: 5px 0;"><strong>متوسط التقييم (من 5):</strong> {stats.get('avg_rating', 'N/A'):.2f}</li>
-                    <li style="padding: 5px 0;"><strong>النسبة الإيجابية:</strong> {run.positive_percentage:.2f}% ({run.positive_count} مراجعة)</li>
-                    <li style="padding: 5px 0;"><strong>المشاعر السلبية:</strong> {run.negative_count} مراجعة</li>
-                </ul>
-                
-                <p style="margin-top: 20px;">تم إكمال التحليل في: {completed_at_str}</p>
-                <p style="font-size: 12px; color: #777;">يرجى مراجعة لوحة التحكم للتفاصيل الكاملة.</p>
-            </div>
-        </body>
-    </html>
-    """
-    return html_body
+    return render_run_report(run, stats)
 
 def build_failure_body(run: AnalysisRun, error_message: str) -> str:
     """ بناء محتوى رسالة البريد الإلكتروني على هيئة HTML لتقرير فشل التشغيل. """
-    
-    started_at_str = run.started_at.strftime('%Y-%m-%d %H:%M:%S') if run.started_at else 'N/A'
-    
-    html_body = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; direction: rtl; text-align: right; background-color: #f4f4f4; padding: 20px;">
-            <div style="max-width: 600px; margin: auto; background: white; padding: 20px; border-radius: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.05);">
-                <h2 style="color: #D32F2F;">❌ فشل تشغيل التحليل</h2>
-                <p><strong>معرّف التشغيل (ID):</strong> {run.id}</p>
-                <p><strong>الموقع المستهدف:</strong> {run.target_site}</p>
-                <p><strong>حالة التشغيل:</strong> <span style="color: red; font-weight: bold;">فشل</span></p>
-                <hr style="border: 0; border-top: 1px solid #eee;">
-                
-                <h3>رسالة الخطأ:</h3>
-                <p style="background-color: #ffebee; border-left: 5px solid #D32F2F; padding: 10px;">
-                    {error_message}
-                </p>
-                
-                <p style="margin-top: 20px;">تم بدء التحليل في: {started_at_str}</p>
-                <p style="font-size: 12px; color: #777;">تم إرسال هذا الإشعار إلى فريق الإدارة للمراجعة.</p>
-            </div>
-        </body>
-    </html>
-    """
-    return html_body
+    return render_run_failure(run, error_message)
 
 # ----------------- 2. دالة الإرسال الأساسية -----------------
 
+def get_notifier_delivery_service():
+    """ خدمة الإرسال المشتركة المبنية على إعدادات SMTP من متغيرات البيئة. """
+    return get_delivery_service(SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SENDER_EMAIL, SMTP_USE_TLS)
+
 def send_email(subject: str, body: str, recipient_email: str) -> bool:
     """ 
     تقوم بإرسال بريد إلكتروني باستخدام بروتوكول SMTP.
@@ -98,35 +48,31 @@ def send_email(subject: str, body: str, recipient_email: str) -> bool:
     الإرجاع:
         bool: True إذا تم الإرسال بنجاح، False في حال حدوث خطأ.
     """
-    try:
-        # إنشاء كائن الرسالة MIMEText
-        msg = MIMEText(body, 'html', 'utf-8')
-        msg['Subject'] = subject
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = recipient_email
-
-        # الاتصال بخادم SMTP والبدء في الإرسال
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls() # تفعيل التشفير
-            server.login(SMTP_USERNAME, SMTP_PASSWORD) # تسجيل الدخول
-            server.sendmail(SENDER_EMAIL, recipient_email, msg.as_string())
-        
-        # تسجيل الإشعار في قاعدة البيانات
-        # ملاحظة: يجب أن تكون لديك دالة get_db() جاهزة للاستخدام هنا
-        db = get_db() 
-        create_email_notification(db, recipient_email, subject, body, success=True)
+    # الإرسال عبر اتصال SMTP دائم ومشترك (يُفتح ويُصادق عليه مرة واحدة فقط)
+    # الخدمة تحفظ سجل EmailNotification بنفسها، فلا حاجة لجلسة جديدة لكل رسالة
+    service = get_notifier_delivery_service()
+    if service.send(recipient_email, subject, body, is_html=True):
         print(f"✅ تم إرسال البريد بنجاح إلى: {recipient_email} بعنوان: {subject}")
         return True
-        
-    except Exception as e:
-        # تسجيل الإشعار في حالة الفشل
-        db = get_db()
-        create_email_notification(db, recipient_email, subject, body, success=False, error_message=str(e))
-        print(f"❌ خطأ في إرسال البريد إلى {recipient_email}: {e}")
-        return False
+
+    print(f"❌ خطأ في إرسال البريد إلى {recipient_email}")
+    return False
 
 # ----------------- 3. دوال منطق الإشعارات -----------------
 
+def get_run_stats(db, run_id: int) -> dict:
+    """ إحصائيات التقرير من مراجعات التشغيل المحفوظة: متوسط التقييم (التقييمات نصية مثل "4/5") وعددها. """
+    ratings = [
+        value for (rating,) in db.query(Review.rating).filter(
+            Review.analysis_run_id == run_id, Review.rating.isnot(None)
+        ).yield_per(5000)
+        if (value := parse_rating(rating)) is not None
+    ]
+    return {
+        'avg_rating': sum(ratings) / len(ratings) if ratings else 0.0,
+        'rated_reviews': len(ratings),
+    }
+
 def notify_completion(run_id: int) -> Optional[bool]:
     """ 
     منطق الإشعار عند اكتمال عملية تحليل بنجاح.
@@ -137,17 +83,17 @@ def notify_completion(run_id: int) -> Optional[bool]:
     3. بناء محتوى البريد الإلكتروني.
     4. إرسال البريد الإلكتروني للمدير (ADMIN_EMAIL).
     """
+    db = SessionLocal()
     try:
-        # 1. جلب بيانات التشغيل (نحتاج get_analysis_run في db_helpers)
-        db = get_db()
-        run = get_analysis_run(db, run_id)
+        # 1. جلب بيانات التشغيل
+        run = db.get(AnalysisRun, run_id)
         
         if not run:
             print(f"⚠️ لم يتم العثور على تشغيل بالمعرّف {run_id}. الإشعار ألغي.")
             return None
 
-        # 2. جلب الإحصائيات (نفترض أن الدالة جاهزة)
-        stats = get_review_stats(db, run_id)
+        # 2. جلب الإحصائيات من المراجعات المحفوظة
+        stats = get_run_stats(db, run_id)
         
         # 3. بناء الرسالة
         subject = f"[تقرير مكتمل] تحليل الموقع {run.target_site} (#{run.id})"
@@ -159,15 +105,17 @@ def notify_completion(run_id: int) -> Optional[bool]:
     except Exception as e:
         print(f"❌ خطأ عام في عملية إشعار الاكتمال لـ {run_id}: {e}")
         return False
+    finally:
+        db.close()
 
 def notify_failure(run_id: int, error_message: str) -> Optional[bool]:
     """ 
     منطق الإشعار عند فشل عملية تحليل.
     يتم إرسال إشعار فشل بسيط إلى المسؤول.
     """
+    db = SessionLocal()
     try:
-        db = get_db()
-        run = get_analysis_run(db, run_id)
+        run = db.get(AnalysisRun, run_id)
         
         if not run:
             print(f"⚠️ لم يتم العثور على تشغيل بالمعرّف {run_id}. الإشعار ألغي.")
@@ -183,6 +131,29 @@ def notify_failure(run_id: int, error_message: str) -> Optional[bool]:
     except Exception as e:
         print(f"❌ خطأ عام في عملية إشعار الفشل لـ {run_id}: {e}")
         return False
+    finally:
+        db.close()
+
+def enqueue_run_notification(db, run: AnalysisRun, is_success: bool, error_message: str = None,
+                             stats: Optional[dict] = None) -> bool:
+    """ 
+    إضافة إشعار اكتمال/فشل التشغيل إلى صندوق الإشعارات (Outbox) ضمن جلسة المستدعي.
+    لا يتم الإرسال هنا: الموزّع الخلفي يرسل الإشعار بعد حفظ المعاملة،
+    فلا يبقى التحليل معلقاً بانتظار خادم البريد.
+    """
+    if is_success:
+        kind = KIND_RUN_COMPLETED
+        subject = f"[تقرير مكتمل] تحليل الموقع {run.target_site} (#{run.id})"
+        body = build_report_body(run, stats or {'avg_rating': 0.0})
+    else:
+        kind = KIND_RUN_FAILED
+        subject = f"[فشل] تحليل الموقع {run.target_site} - عاجل (#{run.id})"
+        body = build_failure_body(run, error_message)
+
+    return enqueue_notification(
+        db, kind, ADMIN_EMAIL, f"{kind}:{run.id}",
+        subject=subject, body=body, analysis_run_id=run.id
+    )
 
 # ----------------- مثال على كيفية التنفيذ -----------------
 
@@ -192,41 +163,12 @@ if __name__ == "__main__":
     
     # ⚠️ ملاحظة هامة: لتشغيل هذا الجزء بنجاح، يجب:
     # 1. تثبيت مكتبات مثل SQLAlchemy أو أي أداة اتصال بقاعدة البيانات التي تستخدمها.
-    # 2. التأكد من أن دوال get_db, get_analysis_run, get_review_stats و AnalysisRun كلها مُعرّفة وتعمل بشكل صحيح.
+    # 2. وجود تشغيلات محفوظة في قاعدة البيانات (DATABASE_URL) بالمعرّفات المستخدمة أدناه.
     # 3. تعديل ثوابت SMTP_USERNAME و SMTP_PASSWORD لقيم حقيقية.
     
-    # مثال على محاكاة كائن AnalysisRun لغرض الاختبار
-    class MockAnalysisRun:
-        def __init__(self, id, site, total, positive, negative):
-            self.id = id
-            self.target_site = site
-            self.total_reviews = total
-            self.positive_count = positive
-            self.negative_count = negative
-            self.positive_percentage = (positive / total) * 100 if total > 0 else 0
-            self.completed_at = datetime.now()
-            self.started_at = datetime.now()
+    # notify_completion/notify_failure تقرآن التشغيل وإحصائياته من قاعدة البيانات (DATABASE_URL)،
+    # فيكفي تشغيل تحليل واحد على الأقل قبل تفعيل الاختبارين أدناه.
     
-    # محاكاة لدوال قاعدة البيانات غير المتوفرة حالياً
-    def get_db(): return object()
-    def get_analysis_run(db, run_id): 
-        # محاكاة جلب تشغيل ناجح
-        if run_id == 101:
-            return MockAnalysisRun(101, "example.com", 500, 350, 100)
-        # محاكاة جلب تشغيل فاشل
-        if run_id == 202:
-            return MockAnalysisRun(202, "anothersite.org", 0, 0, 0)
-        return None
-        
-    def get_review_stats(db, run_id):
-        # محاكاة إحصائيات
-        if run_id == 101:
-            return {"avg_rating": 4.15, "most_common_topic": "Shipping"}
-        return {}
-
-    def create_email_notification(db, to, subject, body, success, error_message=None):
-        pass # لا تفعل شيئاً في المحاكاة
-        
     # **الاختبار الأول: إشعار اكتمال ناجح**
     # print("\n--- اختبار إشعار الاكتمال ---")
     # notify_completion(101) # قم بتعطيل هذا السطر حتى تعديل الإعدادات
@@ -0,0 +1,334 @@
+# outbox.py - صندوق الإشعارات الصادرة (Outbox) مع موزّع خلفي وإعادة محاولة ومنع التكرار
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from database import SessionLocal
+from email_templates import render_negative_review_alert, render_alert_digest
+from models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+# ----------------- إعدادات الموزّع -----------------
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_POLL_INTERVAL = 5          # ثوانٍ بين كل فحص للصندوق
+DEFAULT_MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30          # 30s, 60s, 120s, ... حتى الحد الأقصى
+BACKOFF_MAX_SECONDS = 3600
+SENDING_LEASE_SECONDS = 300        # الرسائل العالقة في 'sending' تُعاد إلى الطابور بعد هذه المدة
+
+KIND_RUN_COMPLETED = 'run_completed'
+KIND_RUN_FAILED = 'run_failed'
+KIND_CRITICAL_ALERT = 'critical_alert'
+
+# ----------------- 1. الإضافة إلى الصندوق (داخل معاملة المستدعي) -----------------
+
+def review_dedup_key(analysis_run_id, review_id=None, review_text=None, scope=None):
+    """
+    مفتاح منع التكرار لتنبيه مراجعة: (التشغيل، المراجعة)؛ يُستخدم بصمة النص عند غياب المعرف.
+    scope: معرّف بديل للتحليلات غير المحفوظة (مفتاح تحليل الجلسة في لوحة التحكم)؛ بدون تشغيل
+    أو نطاق لا يوجد مفتاح آمن، لأن نفس النص في أي تحليل لاحق كان سيُعتبر مكرراً إلى الأبد.
+    """
+    if analysis_run_id is not None:
+        owner = str(analysis_run_id)
+    elif scope:
+        owner = f"s{hashlib.sha1(str(scope).encode('utf-8')).hexdigest()[:16]}"
+    else:
+        raise ValueError("Critical alerts need an analysis_run_id or a scope for deduplication")
+    if review_id is not None:
+        review_ref = str(review_id)
+    else:
+        review_ref = hashlib.sha1((review_text or '').encode('utf-8')).hexdigest()[:16]
+    return f"{KIND_CRITICAL_ALERT}:{owner}:{review_ref}"
+
+def enqueue_notification(db, kind, recipient, dedup_key, subject=None, body=None, payload=None,
+                         analysis_run_id=None, review_id=None):
+    """
+    إضافة إشعار إلى الصندوق ضمن جلسة المستدعي (بدون commit) حتى يُحفظ
+    في نفس معاملة نتائج التحليل. يتم تجاهل الإشعار إذا كان مفتاحه موجوداً مسبقاً.
+
+    Returns:
+        True إذا أضيف إشعار جديد، False إذا كان مكرراً
+    """
+    exists = db.query(NotificationOutbox.id).filter(NotificationOutbox.dedup_key == dedup_key).first()
+    if exists:
+        return False
+
+    db.add(NotificationOutbox(
+        analysis_run_id=analysis_run_id,
+        review_id=review_id,
+        kind=kind,
+        dedup_key=dedup_key,
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        payload=json.dumps(payload, ensure_ascii=False, default=str) if payload is not None else None,
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    ))
+    return True
+
+def enqueue_critical_alerts(db, analysis_run_id, recipient, site_name, reviews, scope=None):
+    """
+    إضافة تنبيه لكل مراجعة حرجة مع منع التكرار لكل (تشغيل، مراجعة).
+
+    Args:
+        reviews: قائمة dict بالمفاتيح title, review_text, score واختيارياً review_id
+        scope: نطاق منع التكرار عندما لا يوجد analysis_run_id (انظر review_dedup_key)
+
+    Returns:
+        عدد التنبيهات الجديدة المضافة
+    """
+    added = 0
+    seen = set()
+    for review in reviews:
+        key = review_dedup_key(analysis_run_id, review.get('review_id'), review.get('review_text'), scope)
+        if key in seen:
+            continue
+        seen.add(key)
+        payload = {
+            'site_name': site_name,
+            'title': review.get('title'),
+            'review_text': review.get('review_text'),
+            'score': review.get('score'),
+        }
+        if enqueue_notification(db, KIND_CRITICAL_ALERT, recipient, key, payload=payload,
+                                analysis_run_id=analysis_run_id, review_id=review.get('review_id')):
+            added += 1
+    return added
+
+# ----------------- 2. الإرسال من الصندوق -----------------
+
+def _backoff_delay(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS))
+
+def _due_filter(now):
+    """الصفوف المستحقة: pending حان موعدها، أو sending عالقة تجاوزت مهلة الحجز."""
+    stale_before = now - timedelta(seconds=SENDING_LEASE_SECONDS)
+    return (
+        ((NotificationOutbox.status == 'pending') & (NotificationOutbox.next_attempt_at <= now))
+        | ((NotificationOutbox.status == 'sending') & (NotificationOutbox.next_attempt_at <= stale_before))
+    )
+
+def _lock_and_mark_sending(db, query, now, limit=None):
+    """حجز الصفوف (SKIP LOCKED يسمح بتشغيل عدة موزّعين على PostgreSQL) وتعليمها كـ 'sending'."""
+    query = query.order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+    if limit:
+        query = query.limit(limit)
+    rows = query.with_for_update(skip_locked=True).all()
+    for row in rows:
+        row.status = 'sending'
+        row.next_attempt_at = now
+    return rows
+
+def _claim_due(db, limit, kinds=None, digest_window=None, dedup_keys=None):
+    """
+    حجز دفعة من الإشعارات المستحقة (أو المستحقة منها ضمن dedup_keys فقط).
+    في وضع الملخص (digest_window) لا تُحجز تنبيهات المراجعات إلا عندما يمرّ على أقدم
+    تنبيه معلق لنفس المستلم طول النافذة، وعندها تُحجز جميع تنبيهاته دفعة واحدة.
+    """
+    now = datetime.utcnow()
+    query = db.query(NotificationOutbox).filter(_due_filter(now))
+    if kinds:
+        query = query.filter(NotificationOutbox.kind.in_(kinds))
+    if dedup_keys is not None:
+        query = query.filter(NotificationOutbox.dedup_key.in_(list(dedup_keys)))
+
+    if digest_window is None or (kinds and KIND_CRITICAL_ALERT not in kinds):
+        rows = _lock_and_mark_sending(db, query, now, limit)
+    else:
+        rows = _lock_and_mark_sending(db, query.filter(NotificationOutbox.kind != KIND_CRITICAL_ALERT), now, limit)
+        ready_recipients = (
+            db.query(NotificationOutbox.recipient)
+            .filter(_due_filter(now), NotificationOutbox.kind == KIND_CRITICAL_ALERT)
+            .group_by(NotificationOutbox.recipient)
+            .having(func.min(NotificationOutbox.created_at) <= now - digest_window)
+        )
+        rows += _lock_and_mark_sending(
+            db,
+            db.query(NotificationOutbox).filter(
+                _due_filter(now),
+                NotificationOutbox.kind == KIND_CRITICAL_ALERT,
+                NotificationOutbox.recipient.in_(ready_recipients.subquery().select()),
+            ),
+            now,
+        )
+    db.commit()
+    return rows
+
+def _render_alert_group(rows, digest_window=None):
+    """
+    دمج مجموعة تنبيهات في رسالة واحدة: تنبيه عادي لتشغيل واحد،
+    أو ملخص (Digest) مقسم حسب (الموقع، التشغيل) في وضع الملخص.
+    """
+    payloads = [json.loads(row.payload or '{}') for row in rows]
+
+    if digest_window is None:
+        site_name = payloads[0].get('site_name') or 'موقع غير معروف'
+        subject = f"⚠️ تنبيه: تعليقات سلبية حرجة - {site_name}"
+        body = render_negative_review_alert(
+            site_name,
+            [p.get('title') for p in payloads],
+            [p.get('review_text') for p in payloads],
+            [p.get('score') for p in payloads],
+        )
+        return subject, body
+
+    sections = OrderedDict()
+    for row, payload in zip(rows, payloads):
+        key = (payload.get('site_name') or 'موقع غير معروف', row.analysis_run_id)
+        section = sections.setdefault(key, {
+            'site_name': key[0], 'run_id': key[1], 'titles': [], 'review_texts': [], 'scores': [],
+        })
+        section['titles'].append(payload.get('title'))
+        section['review_texts'].append(payload.get('review_text'))
+        section['scores'].append(payload.get('score'))
+
+    window_start = min(row.created_at for row in rows)
+    subject = f"⚠️ ملخص التنبيهات: {len(rows)} تعليق سلبي حرج في {len(sections)} تحليل"
+    return subject, render_alert_digest(list(sections.values()), window_start, datetime.utcnow())
+
+def _group_rows(rows, digest_window=None):
+    """
+    الرسائل العادية تُرسل كما هي؛ تنبيهات المراجعات تُجمع حسب (المستلم، التشغيل)،
+    أو حسب المستلم فقط عبر جميع التشغيلات في وضع الملخص.
+    """
+    groups = OrderedDict()
+    for row in rows:
+        if row.kind != KIND_CRITICAL_ALERT:
+            key = ('single', row.id)
+        elif digest_window is None:
+            key = (KIND_CRITICAL_ALERT, row.recipient, row.analysis_run_id)
+        else:
+            key = (KIND_CRITICAL_ALERT, row.recipient)
+        groups.setdefault(key, []).append(row)
+    return groups.values()
+
+def dispatch_pending(delivery, limit=DEFAULT_BATCH_SIZE, kinds=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                     digest_window=None, dedup_keys=None):
+    """
+    إرسال دفعة واحدة من الإشعارات المستحقة عبر خدمة الإرسال (SMTPDeliveryService).
+    digest_window (timedelta): عند تحديده تُجمع تنبيهات المراجعات لكل مستلم في رسالة ملخص
+    واحدة لكل نافذة زمنية بدلاً من رسالة لكل تشغيل.
+    dedup_keys: إرسال هذه الإشعارات فقط (ما أضافه المستدعي للتو)، لا كل ما في الصندوق.
+
+    Returns:
+        dict: {'sent': عدد الصفوف المرسلة, 'retry': المؤجلة, 'dead': المتوقفة نهائياً}
+    """
+    stats = {'sent': 0, 'retry': 0, 'dead': 0}
+    db = SessionLocal()
+    try:
+        rows = _claim_due(db, limit, kinds, digest_window, dedup_keys)
+        for group in _group_rows(rows, digest_window):
+            first = group[0]
+            try:
+                if first.kind == KIND_CRITICAL_ALERT:
+                    subject, body = _render_alert_group(group, digest_window)
+                else:
+                    subject, body = first.subject, first.body
+                ok = delivery.send(first.recipient, subject, body, first.analysis_run_id, is_html=True)
+                error = None if ok else 'SMTP delivery failed'
+            except Exception as e:
+                ok, error = False, str(e)
+
+            now = datetime.utcnow()
+            for row in group:
+                row.attempts = (row.attempts or 0) + 1
+                if ok:
+                    row.status, row.sent_at, row.last_error = 'sent', now, None
+                    stats['sent'] += 1
+                elif row.attempts >= max_attempts:
+                    row.status, row.last_error = 'dead', error
+                    stats['dead'] += 1
+                else:
+                    row.status, row.last_error = 'pending', error
+                    row.next_attempt_at = now + _backoff_delay(row.attempts)
+                    stats['retry'] += 1
+            db.commit()
+    except Exception as e:
+        logger.error(f"Outbox dispatch failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+    if any(stats.values()):
+        logger.info(f"📬 Outbox dispatch: {stats}")
+    return stats
+
+def dispatch_all_pending(delivery, digest_window=None):
+    """
+    إرسال كل ما استحق الآن على دفعات (نهاية تشغيلات سطر الأوامر، حيث لا يعمل OutboxDispatcher).
+    المؤجل لإعادة المحاولة ونوافذ الملخص غير المكتملة تبقى في الصندوق للموزّع (python outbox.py).
+
+    Returns:
+        dict: مجموع إحصائيات الدفعات (sent, retry, dead)
+    """
+    totals = {'sent': 0, 'retry': 0, 'dead': 0}
+    while True:
+        stats = dispatch_pending(delivery, digest_window=digest_window)
+        if not any(stats.values()):
+            return totals
+        for key, value in stats.items():
+            totals[key] += value
+
+class OutboxDispatcher:
+    """موزّع يعمل في خيط خلفي ويفرغ صندوق الإشعارات دورياً."""
+
+    def __init__(self, delivery, poll_interval=DEFAULT_POLL_INTERVAL, batch_size=DEFAULT_BATCH_SIZE,
+                 kinds=None, digest_window=None):
+        self.delivery = delivery
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.kinds = kinds
+        self.digest_window = digest_window
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def notify(self):
+        """إيقاظ الموزّع فوراً (مثلاً بعد حفظ نتائج تشغيل جديد)."""
+        self._wakeup.set()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            stats = dispatch_pending(self.delivery, self.batch_size, self.kinds, digest_window=self.digest_window)
+            # إذا امتلأت الدفعة نكمل فوراً، وإلا ننتظر الفحص التالي
+            if sum(stats.values()) < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+        self.delivery.close()
+
+# ----------------- تشغيل الموزّع كعملية مستقلة -----------------
+
+if __name__ == "__main__":
+    from config import get_alert_digest_window
+    from notifier import get_notifier_delivery_service
+
+    logging.basicConfig(level=logging.INFO)
+    dispatcher = OutboxDispatcher(get_notifier_delivery_service(), digest_window=get_alert_digest_window()).start()
+    print("📬 موزّع الإشعارات يعمل... (Ctrl+C للإيقاف)")
+    try:
+        dispatcher._thread.join()
+    except KeyboardInterrupt:
+        dispatcher.stop()
@@ -0,0 +1,373 @@
+# profiling.py - وضع قياس الأداء الاختياري للتشغيلات: أخذ عينات المكدسات أو cProfile + توقيت مهام asyncio
+
+import asyncio
+import cProfile
+import json
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import weakref
+import zlib
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('sampling', 'cprofile')
+DEFAULT_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # ثوانٍ بين العينات
+TOP_N = 30
+
+_active = None  # المُقيِّس الفعّال حالياً (واحد لكل عملية)
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+# ----------------- 1. أخذ عينات المكدسات (كل الخيوط) -----------------
+
+class StackSampler:
+    """
+    يقرأ مكدسات جميع الخيوط كل interval ثانية (sys._current_frames) ويعدّها بصيغة
+    المكدسات المطوية "thread;outer;...;inner count" المقبولة في flamegraph.pl و speedscope.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, n=TOP_N):
+        """الدوال مرتبة حسب العينات الذاتية (الإطار الأخير) مع النسبة الشاملة."""
+        total = sum(self.stacks.values()) or 1
+        own, inclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]  # بدون اسم الخيط
+            if frames:
+                own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        return [
+            {'function': label, 'self_pct': own[label] / total * 100, 'total_pct': inclusive[label] / total * 100,
+             'self_samples': own[label], 'total_samples': inclusive[label]}
+            for label, _ in own.most_common(n)
+        ]
+
+# ----------------- 2. cProfile لكل الخيوط -----------------
+
+def _clear_profile_all_threads():
+    """
+    إزالة دالة القياس من كل الخيوط: cProfile.Profile.disable() يوقف خيط المستدعي فقط، فيبقى
+    مُقيِّس خيط المنفذ يجمع الاستدعاءات ما دام الخيط حياً.
+    """
+    if hasattr(threading, 'setprofile_all_threads'):  # Python 3.12+
+        threading.setprofile_all_threads(None)
+        return
+    # Python 3.11: نفس ما تفعله setprofile_all_threads عبر C API (مع الاحتفاظ بالـ GIL)
+    import ctypes
+    api = ctypes.pythonapi
+    api.PyInterpreterState_Get.restype = ctypes.c_void_p
+    api.PyInterpreterState_ThreadHead.argtypes = [ctypes.c_void_p]
+    api.PyInterpreterState_ThreadHead.restype = ctypes.c_void_p
+    api.PyThreadState_Next.argtypes = [ctypes.c_void_p]
+    api.PyThreadState_Next.restype = ctypes.c_void_p
+    api._PyEval_SetProfile.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+    api._PyEval_SetProfile.restype = ctypes.c_int
+    tstate = api.PyInterpreterState_ThreadHead(api.PyInterpreterState_Get())
+    while tstate:
+        api._PyEval_SetProfile(tstate, None, None)
+        tstate = api.PyThreadState_Next(tstate)
+
+class ThreadedCProfile:
+    """
+    cProfile للخيط الحالي ولكل خيط يبدأ بعد start() (منفذ التحليل، خيط الاستخلاص...)،
+    ثم دمج النتائج في pstats.Stats واحد.
+    """
+
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def _bootstrap(self, frame, event, arg):
+        sys.setprofile(None)
+        with self._lock:
+            if self._stopped:
+                return
+            profile = cProfile.Profile()
+            self.profiles.append(profile)
+            profile.enable()
+
+    def start(self):
+        main = cProfile.Profile()
+        self.profiles.append(main)
+        threading.setprofile(self._bootstrap)
+        main.enable()
+
+    def stop(self):
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        with self._lock:
+            self._stopped = True
+            if len(self.profiles) > 1:
+                # مُقيِّسات الخيوط الأخرى (تبقى خيوط ThreadPoolExecutor حية بعد التشغيل)
+                _clear_profile_all_threads()
+
+    def stats(self):
+        with self._lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            profile.create_stats()
+            if profile.stats:
+                stats.add(profile)
+        return stats
+
+    def top_functions(self, n=TOP_N):
+        """الدوال مرتبة حسب الزمن الذاتي (tottime) مع الزمن التراكمي."""
+        stats = self.stats()
+        total = stats.total_tt or 1
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:n]
+        return [
+            {'function': f"{func} ({os.path.basename(filename)}:{line})", 'calls': nc,
+             'self_s': tt, 'cumulative_s': ct, 'self_pct': tt / total * 100}
+            for (filename, line, func), (cc, nc, tt, ct, callers) in rows
+        ]
+
+    def pstats_bytes(self):
+        """نفس صيغة ملف .prof (pstats.dump_stats) لفتحه في snakeviz أو pstats."""
+        return marshal.dumps(self.stats().stats)
+
+# ----------------- 3. توقيت مهام asyncio -----------------
+
+class TaskTimer:
+    """زمن كل مهمة asyncio من الإنشاء حتى الانتهاء، مجمّعاً حسب اسم الـ coroutine."""
+
+    def __init__(self):
+        self.tasks = defaultdict(lambda: [0, 0.0, 0.0])  # count, total, max
+        self._loops = weakref.WeakSet()
+
+    def attach(self, loop):
+        if loop in self._loops:
+            return
+        self._loops.add(loop)
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+            name = getattr(coro, '__qualname__', type(coro).__name__)
+            started = time.perf_counter()
+            task.add_done_callback(lambda _: self._record(name, time.perf_counter() - started))
+            return task
+
+        loop.set_task_factory(factory)
+
+    def _record(self, name, elapsed):
+        entry = self.tasks[name]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    def summary(self):
+        return [
+            {'task': name, 'count': count, 'total_s': total, 'mean_ms': total / count * 1000, 'max_ms': longest * 1000}
+            for name, (count, total, longest) in sorted(self.tasks.items(), key=lambda item: item[1][1], reverse=True)
+        ]
+
+def instrument_loop():
+    """تُستدعى من داخل الكود غير المتزامن (crawl_site...) لتسجيل مهام الحلقة الحالية أثناء القياس."""
+    if _active is not None:
+        _active.tasks.attach(asyncio.get_running_loop())
+
+# ----------------- 4. مُقيِّس التشغيل -----------------
+
+class RunProfiler:
+    """
+    مدير سياق يقيس تشغيلاً كاملاً ويحفظ التقرير في جدول run_profiles.
+
+    Args:
+        mode: 'sampling' (كل الخيوط، مكدسات مطوية لـ flamegraph) أو 'cprofile' (عدد الاستدعاءات والأزمنة الدقيقة)
+        analysis_run_id / label: ربط التقرير بالتشغيل
+        persist: حفظ التقرير في قاعدة البيانات عند الخروج
+    """
+
+    def __init__(self, mode='sampling', analysis_run_id=None, label=None, interval=DEFAULT_SAMPLE_INTERVAL,
+                 persist=True):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; expected one of {PROFILE_MODES}")
+        self.mode = mode
+        self.analysis_run_id = analysis_run_id
+        self.label = label
+        self.persist = persist
+        self.backend = StackSampler(interval) if mode == 'sampling' else ThreadedCProfile()
+        self.tasks = TaskTimer()
+        self.duration = None
+        self.profile_id = None
+        self._started = None
+
+    def __enter__(self):
+        global _active
+        _active = self
+        self._started = time.perf_counter()
+        self.backend.start()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self.backend.stop()
+        self.duration = time.perf_counter() - self._started
+        _active = None
+        if self.persist:
+            try:
+                self.profile_id = save_profile(self)
+            except Exception as e:
+                logger.error(f"Failed to save profile for {self.label or self.analysis_run_id}: {e}")
+        top = self.top_functions(5)
+        logger.info(f"🔬 Profile ({self.mode}, {self.duration:.1f}s) top functions: "
+                    + ', '.join(f"{row['function']} {row['self_pct']:.0f}%" for row in top))
+        return False
+
+    def top_functions(self, n=TOP_N):
+        return self.backend.top_functions(n)
+
+    def summary(self):
+        return {
+            'mode': self.mode,
+            'duration_seconds': self.duration,
+            'samples': getattr(self.backend, 'samples', None),
+            'top_functions': self.top_functions(),
+            'asyncio_tasks': self.tasks.summary(),
+        }
+
+    def folded(self):
+        return self.backend.folded() if self.mode == 'sampling' else None
+
+    def pstats_bytes(self):
+        return self.backend.pstats_bytes() if self.mode == 'cprofile' else None
+
+def maybe_profile(mode, **kwargs):
+    """RunProfiler إذا طُلب وضع قياس ولم يكن هناك قياس فعّال (التشغيلات المتداخلة تُقاس مرة واحدة)."""
+    if not mode or _active is not None:
+        return nullcontext()
+    return RunProfiler(mode, **kwargs)
+
+# ----------------- 5. التخزين -----------------
+
+def save_profile(profiler):
+    from database import SessionLocal
+    from models import RunProfile
+
+    folded = profiler.folded()
+    pstats_data = profiler.pstats_bytes()
+    db = SessionLocal()
+    try:
+        row = RunProfile(
+            analysis_run_id=profiler.analysis_run_id,
+            label=profiler.label,
+            mode=profiler.mode,
+            duration_seconds=profiler.duration,
+            summary_json=json.dumps(profiler.summary(), ensure_ascii=False),
+            folded_stacks=zlib.compress(folded.encode('utf-8')) if folded else None,
+            pstats_data=zlib.compress(pstats_data) if pstats_data else None,
+        )
+        db.add(row)
+        db.commit()
+        return row.id
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def list_profiles(limit=20):
+    """آخر التقارير: [(id, analysis_run_id, label, mode, duration_seconds, created_at)]"""
+    from database import SessionLocal
+    from models import RunProfile
+
+    db = SessionLocal()
+    try:
+        return db.query(
+            RunProfile.id, RunProfile.analysis_run_id, RunProfile.label, RunProfile.mode,
+            RunProfile.duration_seconds, RunProfile.created_at,
+        ).order_by(RunProfile.id.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+def load_profile(profile_id):
+    """
+    Returns:
+        dict: summary, folded (نص أو None), pstats (بايتات .prof أو None) — أو None
+    """
+    from database import SessionLocal
+    from models import RunProfile
+
+    db = SessionLocal()
+    try:
+        row = db.query(RunProfile).filter(RunProfile.id == profile_id).first()
+        if row is None:
+            return None
+        return {
+            'summary': json.loads(row.summary_json or '{}'),
+            'folded': zlib.decompress(row.folded_stacks).decode('utf-8') if row.folded_stacks else None,
+            'pstats': zlib.decompress(row.pstats_data) if row.pstats_data else None,
+        }
+    finally:
+        db.close()
+
+# ----------------- مثال: قياس حمل مختلط (CPU في منفذ + مهام asyncio) -----------------
+
+if __name__ == "__main__":
+    import re
+
+    def parse(n):
+        return sum(len(re.findall(r'\w+', "lorem ipsum dolor sit amet " * 200)) for _ in range(n))
+
+    async def fetch(i):
+        await asyncio.sleep(0.05)
+        return await asyncio.get_running_loop().run_in_executor(None, parse, 20)
+
+    async def crawl():
+        instrument_loop()
+        await asyncio.gather(*(asyncio.create_task(fetch(i)) for i in range(40)))
+
+    for mode in PROFILE_MODES:
+        with RunProfiler(mode, label='demo', persist=False) as profiler:
+            asyncio.run(crawl())
+        print(f"\n[{mode}] {profiler.duration:.2f}s")
+        for row in profiler.top_functions(5):
+            print(f"  {row['self_pct']:5.1f}%  {row['function']}")
+        for row in profiler.tasks.summary()[:3]:
+            print(f"  task {row['task']}: {row['count']}x mean {row['mean_ms']:.1f} ms")
+        if mode == 'sampling':
+            print(f"  folded stacks: {len(profiler.folded().splitlines())} lines")
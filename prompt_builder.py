@@ -0,0 +1,212 @@
+"""
+prompt_builder.py - Token-budgeted prompt construction for the AI assistant.
+
+Instead of dumping whole DataFrames into the prompt, run history and reviews are
+reduced to compact aggregates (per-site trends, top negative themes, a few
+representative reviews) and sections are added in priority order until the
+token budget is reached.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+DEFAULT_TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4            # rough heuristic, used when no token counter is supplied
+MAX_REVIEW_CHARS = 280         # representative reviews are clipped to this length
+
+# Column names used by the dashboard (reviews_to_dataframe) and by the runs table
+REVIEW_TEXT_COL = 'نص التعليق'
+REVIEW_SCORE_COL = 'شدة السلبية/الإيجابية'
+REVIEW_LABEL_COL = 'تصنيف المشاعر'
+NEGATIVE_LABELS = ('سلبي', 'Negative')
+
+_WORD_RE = re.compile(r'\w{3,}', re.UNICODE)
+_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'this', 'that', 'was', 'are', 'but', 'not', 'have', 'you', 'very',
+    'من', 'في', 'على', 'إلى', 'عن', 'هذا', 'هذه', 'كان', 'لكن', 'التي', 'الذي', 'جدا', 'مع', 'لم', 'لا',
+}
+
+
+@dataclass
+class PromptBuild:
+    """Result of build_prompt: the prompt text plus size accounting."""
+    text: str
+    tokens: int
+    token_budget: int
+    sections: list = field(default_factory=list)   # names of the sections that fit
+    dropped: list = field(default_factory=list)    # names of the sections left out
+
+    @property
+    def truncated(self):
+        return bool(self.dropped)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+# ----------------- Aggregates -----------------
+
+def summarize_site_trends(runs_df, max_sites=10):
+    """
+    One line per site from the run history: runs, reviews, first/last positive % and avg compound.
+    Expects the analysis-runs columns (target_site, positive_percentage, ...); returns [] otherwise.
+    """
+    if runs_df is None or runs_df.empty or 'target_site' not in runs_df.columns:
+        return []
+
+    df = runs_df
+    time_col = next((c for c in ('completed_at', 'created_at') if c in df.columns), None)
+    if time_col:
+        df = df.sort_values(time_col)
+
+    agg = {'runs': ('target_site', 'size')}
+    if 'total_reviews' in df.columns:
+        agg['reviews'] = ('total_reviews', 'sum')
+    if 'positive_percentage' in df.columns:
+        agg['first_pos'] = ('positive_percentage', 'first')
+        agg['last_pos'] = ('positive_percentage', 'last')
+    if 'avg_compound_score' in df.columns:
+        agg['compound'] = ('avg_compound_score', 'mean')
+    grouped = df.groupby('target_site').agg(**agg).sort_values('runs', ascending=False).head(max_sites)
+
+    lines = []
+    for site, row in grouped.iterrows():
+        parts = [f"{site}: {int(row['runs'])} runs"]
+        if 'reviews' in row:
+            parts.append(f"{int(row['reviews'] or 0)} reviews")
+        if 'first_pos' in row:
+            parts.append(f"positive {row['first_pos'] or 0:.0f}% -> {row['last_pos'] or 0:.0f}%")
+        if 'compound' in row:
+            parts.append(f"avg compound {row['compound'] or 0:+.2f}")
+        lines.append("- " + ", ".join(parts))
+    return lines
+
+
+def top_negative_themes(reviews_df, top_n=10):
+    """Most frequent words in negative reviews, as '- word (count)' lines."""
+    if reviews_df is None or reviews_df.empty or REVIEW_TEXT_COL not in reviews_df.columns:
+        return []
+
+    if REVIEW_LABEL_COL in reviews_df.columns:
+        negative = reviews_df[reviews_df[REVIEW_LABEL_COL].isin(NEGATIVE_LABELS)]
+    elif REVIEW_SCORE_COL in reviews_df.columns:
+        negative = reviews_df[reviews_df[REVIEW_SCORE_COL] < 0]
+    else:
+        return []
+
+    counts = Counter(
+        word
+        for text in negative[REVIEW_TEXT_COL].dropna()
+        for word in _WORD_RE.findall(str(text).lower())
+        if word not in _STOPWORDS and not word.isdigit()
+    )
+    return [f"- {word} ({count})" for word, count in counts.most_common(top_n)]
+
+
+def sample_representative_reviews(reviews_df, per_label=2):
+    """
+    A few reviews per sentiment label: the ones closest to the label's median score
+    (typical), plus the single most negative review overall.
+    """
+    if reviews_df is None or reviews_df.empty or REVIEW_TEXT_COL not in reviews_df.columns:
+        return []
+    # Unscored reviews (NaN, e.g. from a failed analysis) can't be ranked; with none scored, take the first few
+    scores = (pd.to_numeric(reviews_df[REVIEW_SCORE_COL], errors='coerce').dropna()
+              if REVIEW_SCORE_COL in reviews_df.columns else pd.Series(dtype=float))
+    if scores.empty:
+        picked = reviews_df.head(per_label)
+    else:
+        scored = reviews_df.loc[scores.index]
+        groups = scored.groupby(REVIEW_LABEL_COL) if REVIEW_LABEL_COL in scored.columns else [(None, scored)]
+        indices = [scores.idxmin()]
+        for _, group in groups:
+            distance = (scores.loc[group.index] - scores.loc[group.index].median()).abs()
+            indices.extend(distance.nsmallest(per_label).index)
+        picked = reviews_df.loc[pd.Index(indices).unique()]
+
+    lines, seen = [], set()
+    for _, row in picked.iterrows():
+        text = re.sub(r'\s+', ' ', str(row[REVIEW_TEXT_COL])).strip()
+        if text in seen:
+            continue
+        seen.add(text)
+        if len(text) > MAX_REVIEW_CHARS:
+            text = text[:MAX_REVIEW_CHARS].rstrip() + '…'
+        label = row.get(REVIEW_LABEL_COL, '')
+        score = row.get(REVIEW_SCORE_COL)
+        prefix = f"[{label} {score:+.2f}] " if score is not None and not pd.isna(score) else f"[{label}] "
+        lines.append(f"- {prefix}{text}")
+    return lines
+
+
+# ----------------- Prompt assembly -----------------
+
+def _fit_section(title, lines, remaining, count_tokens):
+    """Render a section keeping as many leading lines as fit in `remaining` tokens."""
+    while lines:
+        text = f"\n\n{title}\n" + "\n".join(lines)
+        if count_tokens(text) <= remaining:
+            return text
+        lines = lines[:-1]
+    return None
+
+
+def build_prompt(user_query, historical_data=None, reviews_data=None,
+                 token_budget=DEFAULT_TOKEN_BUDGET, count_tokens=estimate_tokens):
+    """
+    Build the assistant prompt within `token_budget`.
+
+    The instructions and the user's question are always included; data sections are
+    added in priority order (site trends, negative themes, representative reviews) and
+    shortened line by line when they do not fit.
+
+    Args:
+        historical_data: DataFrame of analysis runs (target_site, positive_percentage, ...)
+        reviews_data: DataFrame of reviews with the dashboard's Arabic columns
+        count_tokens: callable(text) -> int, e.g. a wrapper around the model's tokenizer
+
+    Returns:
+        PromptBuild
+    """
+    header = "Analyze the following data and provide insights and actionable advice based on the user's question."
+    footer = (
+        f"\n\nUser's Question: {user_query}"
+        "\n\nProvide a concise summary and focus on actionable recommendations based on the available data "
+        "and the user's question. Ensure the response is formatted with clear paragraph breaks."
+    )
+
+    has_history = historical_data is not None and not historical_data.empty
+    has_reviews = reviews_data is not None and not reviews_data.empty
+    candidates = [
+        ('site_trends', "Per-site trends (from run history):", summarize_site_trends(historical_data) if has_history else []),
+        ('negative_themes', "Top negative themes (word, mentions):", top_negative_themes(reviews_data) if has_reviews else []),
+        ('representative_reviews', "Representative reviews:", sample_representative_reviews(reviews_data) if has_reviews else []),
+    ]
+
+    remaining = token_budget - count_tokens(header) - count_tokens(footer)
+    body, sections, dropped = [], [], []
+    for name, title, lines in candidates:
+        if not lines:
+            continue
+        text = _fit_section(title, lines, remaining, count_tokens)
+        if text is None:
+            dropped.append(name)
+            continue
+        body.append(text)
+        sections.append(name)
+        remaining -= count_tokens(text)
+
+    if not sections and (has_history or has_reviews):
+        body.append("\n\nHistorical data was available but did not fit in the prompt budget.")
+    elif historical_data is not None and not has_history and not has_reviews:
+        body.append("\n\nNo historical analysis data available.")
+
+    text = header + "".join(body) + footer
+    return PromptBuild(text=text, tokens=count_tokens(text), token_budget=token_budget,
+                       sections=sections, dropped=dropped)
@@ -0,0 +1,269 @@
+# review_batch.py - دفعة مراجعات مضغوطة (أعمدة array بدل قاموس لكل مراجعة) من الاستخلاص حتى الحفظ المجمّع
+
+import math
+from array import array
+from datetime import datetime
+
+# رموز التصنيف (عمود بايت واحد لكل مراجعة)
+LABELS = ('محايد', 'إيجابي', 'سلبي')
+LABEL_CODES = {label: code for code, label in enumerate(LABELS)}
+DEFAULT_CHUNK_SIZE = 1000  # عدد الصفوف في كل bulk_insert_mappings
+
+class _TextColumn:
+    """نصوص متتالية في bytearray واحد (UTF-8) مع إزاحات البداية/النهاية في array."""
+
+    __slots__ = ('_buffer', '_offsets')
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offsets = array('Q', [0])
+
+    def append(self, text):
+        self._buffer += (text or '').encode('utf-8')
+        self._offsets.append(len(self._buffer))
+
+    def __getitem__(self, i):
+        return self._buffer[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+
+    @property
+    def nbytes(self):
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets)
+
+class ReviewBatch:
+    """
+    مراجعات تشغيل واحد كأعمدة: النص والعنوان (إزاحات في مخزن واحد)، التقييم، الدرجة،
+    الذاتية، رمز التصنيف واللغة ونية الشراء. الاستخلاص يضيف الصفوف (append)، التحليل
+    يملأ الأعمدة (set_scores)، والحفظ يبني القواميس دفعة بدفعة فقط عند الإدراج.
+    """
+
+    __slots__ = ('analysis_run_id', 'created_at', 'texts', 'titles', 'ratings', 'scores',
+                 'subjectivities', 'label_codes', 'language_codes', 'languages', 'sales_intent',
+                 'opportunity_titles', 'content_hashes', 'signatures', 'duplicates', 'canonicals')
+
+    def __init__(self, analysis_run_id=None, created_at=None):
+        self.analysis_run_id = analysis_run_id
+        self.created_at = created_at or datetime.utcnow()  # طابع زمني واحد للدفعة
+        self.texts = _TextColumn()
+        self.titles = _TextColumn()
+        self.ratings = array('f')          # NaN = بلا تقييم
+        self.scores = array('d')
+        self.subjectivities = array('f')   # NaN = غير مقيسة
+        self.label_codes = array('b')
+        self.language_codes = array('b')
+        self.languages = ['unknown']       # جدول رموز اللغات (صغير)
+        self.sales_intent = array('b')
+        self.opportunity_titles = {}       # index -> عنوان الفرصة (متفرق)
+        self.content_hashes = array('q')   # بصمة النص المطبّع (text_dedup.content_hash)، 0 = بلا بصمة
+        self.signatures = {}               # index -> توقيع MinHash (النصوص القصيرة بلا توقيع)
+        self.duplicates = {}               # index -> Canonical: مكررة تُربط بالأصلية ولا تُحلَّل
+        self.canonicals = {}               # index -> Canonical: أصلية مسجلة في الفهرس (تنتظر معرّفها)
+
+    def __len__(self):
+        return len(self.scores)
+
+    # ----------------- 1. الاستخلاص -----------------
+
+    def append(self, review_text, title=None, rating=None):
+        """إضافة مراجعة مستخلصة (قبل التحليل). ترجع موقعها في الدفعة."""
+        self.texts.append(review_text)
+        self.titles.append(title)
+        self.ratings.append(float(rating) if rating not in (None, '') else math.nan)
+        self.scores.append(0.0)
+        self.subjectivities.append(0.5)
+        self.label_codes.append(0)
+        self.language_codes.append(0)
+        self.sales_intent.append(0)
+        self.content_hashes.append(0)
+        return len(self.scores) - 1
+
+    def text(self, i):
+        return self.texts[i]
+
+    def title(self, i):
+        return self.titles[i] or None
+
+    def rating(self, i):
+        value = self.ratings[i]
+        return None if math.isnan(value) else value
+
+    # ----------------- 2. إزالة التكرار -----------------
+
+    def set_fingerprint(self, i, text_hash, signature):
+        self.content_hashes[i] = text_hash
+        if signature is not None:
+            self.signatures[i] = signature
+
+    def mark_duplicate(self, i, canonical):
+        """المراجعة i تكرار لـ canonical: تُحفظ بلا نص وتأخذ نتيجته في set_scores."""
+        self.duplicates[i] = canonical
+
+    def mark_canonical(self, i, canonical):
+        """المراجعة i أصلية في الفهرس: تُملأ نتيجتها بعد التحليل ومعرّفها بعد الإدراج."""
+        self.canonicals[i] = canonical
+
+    # ----------------- 3. التحليل -----------------
+
+    def set_scores(self, i, label, score, subjectivity, language, opportunity_title=None):
+        """تسجيل نتيجة analyze_sentiment و find_sales_intent للمراجعة i."""
+        self.label_codes[i] = LABEL_CODES.get(label, 0)
+        self.scores[i] = score
+        self.subjectivities[i] = subjectivity
+        if language not in self.languages:
+            self.languages.append(language)
+        self.language_codes[i] = self.languages.index(language)
+        if opportunity_title:
+            self.sales_intent[i] = 1
+            self.opportunity_titles[i] = opportunity_title
+
+    def label(self, i):
+        return LABELS[self.label_codes[i]]
+
+    # ----------------- 4. الإحصائيات -----------------
+
+    def label_counts(self):
+        """(positive, negative, neutral)"""
+        codes = bytes(self.label_codes)
+        return codes.count(LABEL_CODES['إيجابي']), codes.count(LABEL_CODES['سلبي']), codes.count(0)
+
+    def avg_score(self):
+        return math.fsum(self.scores) / len(self) if len(self) else 0.0
+
+    def avg_rating(self):
+        ratings = [r for r in self.ratings if not math.isnan(r)]
+        return sum(ratings) / len(ratings) if ratings else 0.0
+
+    # ----------------- 5. الحفظ المجمّع -----------------
+
+    def review_mapping(self, i):
+        """قاموس Review للمراجعة i (المكررة بلا نص، مع معرّف الأصلية إن كان معروفاً)."""
+        canonical = self.duplicates.get(i)
+        return {
+            'analysis_run_id': self.analysis_run_id,
+            'title': self.title(i),
+            'review_text': None if canonical is not None else self.texts[i],
+            'rating': None if self.rating(i) is None else f"{self.ratings[i]:g}",
+            'sentiment_label': LABELS[self.label_codes[i]],
+            'compound_score': self.scores[i],
+            'subjectivity': None if math.isnan(self.subjectivities[i]) else self.subjectivities[i],
+            'language': self.languages[self.language_codes[i]],
+            'has_sales_intent': bool(self.sales_intent[i]),
+            'scraped_at': self.created_at,
+            'content_hash': self.content_hashes[i] or None,
+            'minhash': None if canonical is not None else self.signatures.get(i),
+            'duplicate_of_id': canonical.review_id if canonical is not None else None,
+        }
+
+    def iter_review_mappings(self, chunk_size=DEFAULT_CHUNK_SIZE, indices=None):
+        """قوائم قواميس Review بحجم chunk_size (لـ bulk_insert_mappings) دون بناء الكل في الذاكرة."""
+        indices = range(len(self)) if indices is None else indices
+        for start in range(0, len(indices), chunk_size):
+            yield [self.review_mapping(i) for i in indices[start:start + chunk_size]]
+
+    def opportunity_mappings(self, estimated_value=50.0):
+        """قواميس SalesOpportunity للمراجعات التي تحمل نية شراء/تحسين."""
+        return [
+            {
+                'analysis_run_id': self.analysis_run_id,
+                'product_title': op_title,
+                'review_text': self.texts[i],
+                'compound_score': self.scores[i],
+                'estimated_value': estimated_value,
+                'status': 'pending',
+                'created_at': self.created_at,
+            }
+            for i, op_title in sorted(self.opportunity_titles.items())
+        ]
+
+    def bulk_insert(self, db, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        إدراج المراجعات والفرص في الجلسة (الالتزام مسؤولية المستدعي). الأصلية أولاً:
+        المسجلة في الفهرس تُدرج مع return_defaults لمعرفة معرّفها، ثم المكررات التي تشير إليها.
+        """
+        from models import Review, SalesOpportunity
+        originals = [i for i in range(len(self)) if i not in self.duplicates] if self.duplicates else range(len(self))
+        for start in range(0, len(originals), chunk_size):
+            indices = originals[start:start + chunk_size]
+            chunk = [self.review_mapping(i) for i in indices]
+            db.bulk_insert_mappings(Review, chunk, return_defaults=bool(self.canonicals))
+            for i, mapping in zip(indices, chunk):
+                canonical = self.canonicals.get(i)
+                if canonical is not None:
+                    canonical.review_id = mapping['id']
+        for chunk in self.iter_review_mappings(chunk_size, sorted(self.duplicates)):
+            db.bulk_insert_mappings(Review, chunk)
+        opportunities = self.opportunity_mappings()
+        if opportunities:
+            db.bulk_insert_mappings(SalesOpportunity, opportunities)
+
+    @property
+    def nbytes(self):
+        columns = (self.ratings, self.scores, self.subjectivities, self.label_codes,
+                   self.language_codes, self.sales_intent, self.content_hashes)
+        return (self.texts.nbytes + self.titles.nbytes + sum(c.itemsize * len(c) for c in columns)
+                + sum(len(signature) for signature in self.signatures.values()))
+
+# ----------------- قياس الذاكرة: قواميس لكل مراجعة مقابل ReviewBatch -----------------
+
+if __name__ == "__main__":
+    import gc
+    import sys
+    import tracemalloc
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    def raw_reviews():
+        # مراجعات اصطناعية بطول واقعي (~110 حرفاً)؛ كل 20 مراجعة فيها طلب تحسين
+        for i in range(n):
+            text = f"المنتج رقم {i} وصل متأخراً والتغليف سيئ، أتمنى لو كان هناك خيار شحن أسرع" if i % 20 == 0 \
+                else f"تجربة رقم {i}: جودة المنتج ممتازة والسعر مناسب جداً مقارنة بالمتاجر الأخرى"
+            yield {'title': f"منتج {i % 500}", 'review_text': text, 'rating': str(i % 5 + 1)}
+
+    def score(i):
+        return ('إيجابي' if i % 3 else 'سلبي'), (0.6 if i % 3 else -0.4), 0.5, 'ar'
+
+    def measure(build):
+        gc.collect()
+        tracemalloc.start()
+        kept = build()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        gc.collect()
+        return current
+
+    def build_dicts():
+        # نفس بنية process_analysis_run السابقة: القواميس الخام + review_final_data + قواميس الفرص
+        raw = list(raw_reviews())
+        reviews_to_save, opportunities_to_save = [], []
+        for i, r_data in enumerate(raw):
+            label, s, subjectivity, lang = score(i)
+            is_opportunity = i % 20 == 0
+            reviews_to_save.append({
+                'analysis_run_id': 1, 'title': r_data.get('title'), 'review_text': r_data['review_text'],
+                'rating': r_data.get('rating'), 'sentiment_label': label, 'compound_score': s,
+                'subjectivity': subjectivity, 'language': lang, 'has_sales_intent': is_opportunity,
+                'scraped_at': datetime.utcnow(),
+            })
+            if is_opportunity:
+                opportunities_to_save.append({
+                    'analysis_run_id': 1, 'product_title': 'طلب ميزة/تحسين', 'review_text': r_data['review_text'],
+                    'compound_score': s, 'estimated_value': 50.0, 'status': 'pending',
+                    'created_at': datetime.utcnow(),
+                })
+        return raw, reviews_to_save, opportunities_to_save
+
+    def build_batch():
+        batch = ReviewBatch(analysis_run_id=1)
+        for r_data in raw_reviews():
+            batch.append(r_data['review_text'], r_data['title'], r_data['rating'])
+        for i in range(len(batch)):
+            label, s, subjectivity, lang = score(i)
+            batch.set_scores(i, label, s, subjectivity, lang, 'طلب ميزة/تحسين' if i % 20 == 0 else None)
+        return batch
+
+    before = measure(build_dicts)
+    after = measure(build_batch)
+    print(f"{n:,} reviews")
+    print(f"  dicts per review : {before / 2**20:8.1f} MiB  ({before / n:6.0f} bytes/review)")
+    print(f"  ReviewBatch      : {after / 2**20:8.1f} MiB  ({after / n:6.0f} bytes/review)")
+    print(f"  reduction        : {before / after:.1f}x")
@@ -0,0 +1,170 @@
+# rollups.py - تجميعات يومية للمشاعر (موقع × يوم) لتحليل الاتجاهات عبر التشغيلات
+
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal
+
+from database import SessionLocal
+from models import AnalysisRun, DailySentimentRollup
+
+logger = logging.getLogger(__name__)
+
+# ----------------- 1. التحديث التدريجي -----------------
+
+def apply_run_to_rollup(db, target_site, day, total_reviews, positive_count,
+                        negative_count, neutral_count, avg_compound_score):
+    """
+    إضافة نتائج تشغيل مكتمل إلى صف (الموقع، اليوم) في جدول التجميع.
+    تُستدعى داخل نفس الجلسة التي تحفظ نتائج التشغيل (بدون commit هنا)
+    حتى تبقى الأرقام متسقة مع جدول analysis_runs.
+    """
+    rollup = (
+        db.query(DailySentimentRollup)
+        .filter(DailySentimentRollup.target_site == target_site, DailySentimentRollup.day == day)
+        .with_for_update()
+        .first()
+    )
+    if rollup is None:
+        rollup = DailySentimentRollup(
+            target_site=target_site, day=day, runs_count=0, total_reviews=0,
+            positive_count=0, negative_count=0, neutral_count=0, compound_sum=0.0,
+        )
+        db.add(rollup)
+
+    rollup.runs_count += 1
+    rollup.total_reviews += total_reviews
+    rollup.positive_count += positive_count
+    rollup.negative_count += negative_count
+    rollup.neutral_count += neutral_count
+    rollup.compound_sum += (avg_compound_score or 0.0) * total_reviews
+    return rollup
+
+def rebuild_rollups():
+    """
+    إعادة بناء جدول التجميع بالكامل من التشغيلات المكتملة (للبيانات القديمة أو بعد الحذف).
+    يتم التجميع داخل قاعدة البيانات باستعلام GROUP BY واحد.
+    """
+    db = SessionLocal()
+    try:
+        day_expr = func.date(AnalysisRun.completed_at)
+        rows = (
+            db.query(
+                AnalysisRun.target_site,
+                day_expr,
+                func.count(AnalysisRun.id),
+                func.coalesce(func.sum(AnalysisRun.total_reviews), 0),
+                func.coalesce(func.sum(AnalysisRun.positive_count), 0),
+                func.coalesce(func.sum(AnalysisRun.negative_count), 0),
+                func.coalesce(func.sum(AnalysisRun.neutral_count), 0),
+                func.coalesce(func.sum(AnalysisRun.avg_compound_score * AnalysisRun.total_reviews), 0.0),
+            )
+            .filter(AnalysisRun.status == 'completed', AnalysisRun.completed_at.isnot(None))
+            .group_by(AnalysisRun.target_site, day_expr)
+            .all()
+        )
+
+        db.query(DailySentimentRollup).delete()
+        for site, day, runs, total, pos, neg, neu, compound_sum in rows:
+            if isinstance(day, str):  # SQLite يُرجع DATE كنص
+                day = datetime.strptime(day, '%Y-%m-%d').date()
+            db.add(DailySentimentRollup(
+                target_site=site, day=day, runs_count=runs, total_reviews=total,
+                positive_count=pos, negative_count=neg, neutral_count=neu, compound_sum=compound_sum,
+            ))
+        db.commit()
+        logger.info(f"✅ Rebuilt {len(rows)} daily rollup rows")
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Failed to rebuild daily rollups: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def ensure_rollups():
+    """
+    بناء جدول التجميع عند الحاجة فقط: فارغ رغم وجود تشغيلات مكتملة (قاعدة قديمة بعد ترقية المخطط).
+    تُستدعى من database.init_db؛ لإعادة البناء الكامل: python main.py --rebuild_rollups
+
+    Returns:
+        عدد الصفوف المبنية (0 إذا لم تلزم إعادة البناء)
+    """
+    db = SessionLocal()
+    try:
+        has_rollups = db.query(DailySentimentRollup.id).first() is not None
+        has_runs = db.query(AnalysisRun.id).filter(
+            AnalysisRun.status == 'completed', AnalysisRun.completed_at.isnot(None)
+        ).first() is not None
+    finally:
+        db.close()
+    if has_rollups or not has_runs:
+        return 0
+    return rebuild_rollups()
+
+# ----------------- 2. استعلامات الاتجاه -----------------
+
+def get_sentiment_trend(days=365, target_site=None, end_day=None):
+    """
+    جلب اتجاه المشاعر اليومي لآخر N يوم من جدول التجميع (مسح فهرس واحد).
+
+    Args:
+        days: طول النافذة الزمنية بالأيام
+        target_site: تصفية حسب موقع محدد (None = جميع المواقع مجمّعة لكل يوم)
+        end_day: آخر يوم في النافذة (افتراضياً اليوم)
+
+    Returns:
+        DataFrame بالأعمدة: day, target_site, runs_count, total_reviews, positive_count,
+        negative_count, neutral_count, avg_compound, positive_percentage
+    """
+    end_day = end_day or datetime.utcnow().date()
+    start_day = end_day - timedelta(days=days - 1)
+
+    db = SessionLocal()
+    try:
+        filters = [DailySentimentRollup.day >= start_day, DailySentimentRollup.day <= end_day]
+        if target_site:
+            filters.append(DailySentimentRollup.target_site == target_site)
+            site_col = DailySentimentRollup.target_site
+            group_by = [DailySentimentRollup.day, DailySentimentRollup.target_site]
+        else:
+            site_col = literal('all')  # عمود ثابت: جميع المواقع مجمّعة
+            group_by = [DailySentimentRollup.day]
+
+        rows = (
+            db.query(
+                DailySentimentRollup.day,
+                site_col,
+                func.sum(DailySentimentRollup.runs_count),
+                func.sum(DailySentimentRollup.total_reviews),
+                func.sum(DailySentimentRollup.positive_count),
+                func.sum(DailySentimentRollup.negative_count),
+                func.sum(DailySentimentRollup.neutral_count),
+                func.sum(DailySentimentRollup.compound_sum),
+            )
+            .filter(*filters)
+            .group_by(*group_by)
+            .order_by(DailySentimentRollup.day)
+            .all()
+        )
+    finally:
+        db.close()
+
+    import pandas as pd  # فقط للوحة التحكم؛ مسار التحليل (apply_run_to_rollup) لا يحتاجه
+
+    trend_df = pd.DataFrame(rows, columns=[
+        'day', 'target_site', 'runs_count', 'total_reviews', 'positive_count',
+        'negative_count', 'neutral_count', 'compound_sum',
+    ])
+    totals = trend_df['total_reviews'].where(trend_df['total_reviews'] > 0)
+    trend_df['avg_compound'] = (trend_df['compound_sum'] / totals).fillna(0.0)
+    trend_df['positive_percentage'] = (trend_df['positive_count'] / totals * 100).fillna(0.0)
+    return trend_df.drop(columns=['compound_sum'])
+
+def get_rollup_sites():
+    """قائمة المواقع الموجودة في جدول التجميع (لقائمة التصفية في لوحة التحكم)."""
+    db = SessionLocal()
+    try:
+        return [site for (site,) in db.query(DailySentimentRollup.target_site).distinct().order_by(DailySentimentRollup.target_site)]
+    finally:
+        db.close()
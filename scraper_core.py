@@ -2,21 +2,28 @@
 
 import aiohttp
 import asyncio
+import contextlib
+import functools
 import re
-import nltk
 from bs4 import BeautifulSoup
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-from db_helpers import save_analysis_result 
 from urllib.parse import urljoin # إضافة استيراد urljoin
-from app import load_config # افتراض أن load_config موجودة في app.py
+from config import load_config
+from url_filter import SeenURLSet
+from profiling import instrument_loop, maybe_profile
+from text_dedup import clean_text, fingerprint
 
 # --- Initialization ---
-try:
-    nltk.data.find('sentiment/vader_lexicon.zip')
-except nltk.downloader.DownloadError:
-    nltk.download('vader_lexicon')
+@functools.lru_cache(maxsize=None)
+def get_sentiment_analyzer():
+    """
+    VADER analyzer, built on first use (importing nltk costs ~0.3 s, which CLI commands
+    and dashboard reruns that never score text shouldn't pay). The lexicon is the bundled
+    memory-mapped copy (lexicons.py): no download, and pool workers share its pages.
+    Raises lexicons.ResourceMissingError if the bundled lexicon is missing.
+    """
+    from lexicons import load_vader_analyzer
 
-analyzer = SentimentIntensityAnalyzer()
+    return load_vader_analyzer()
 
 # --- Core Asynchronous Functions ---
 
@@ -44,9 +51,7 @@ def extract_text(html_content):
         soup = BeautifulSoup(html_content, 'html.parser')
         for script_or_style in soup(["script", "style"]):
             script_or_style.decompose() 
-        text = soup.get_text()
-        cleaned_text = re.sub(r'\s+', ' ', text).strip()
-        return cleaned_text
+        return clean_text(soup.get_text())
     except Exception as e:
         print(f"Error during text extraction: {e}")
         return ""
@@ -55,7 +60,7 @@ def analyze_sentiment(text):
     """Analyzes the sentiment of a given text using VADER."""
     if not text:
         return 0.0 
-    score = analyzer.polarity_scores(text)
+    score = get_sentiment_analyzer().polarity_scores(text)
     return score['compound'] 
 
 # --- NEW: Dynamic Link Discovery Function ---
@@ -87,96 +92,376 @@ def get_next_page_url(html_content, current_url):
         # print(f"⚠️ خطأ في استخلاص رابط الصفحة التالية من {current_url}: {e}") # إزالة الطباعة المتكررة
         return None
 
+# --- Page analysis (CPU-bound, runs in an executor) ---
+def sentiment_label(score):
+    """VADER compound score -> dashboard label."""
+    if score >= 0.05:
+        return 'إيجابي'
+    if score <= -0.05:
+        return 'سلبي'
+    return 'محايد'
+
+def analyze_page(html_content, current_url, next_page_selector=None):
+    """
+    Parses a page once: returns (clean text, compound score, next page URL or None).
+    Top-level and side-effect free so it can run in a thread or process pool.
+    """
+    if not html_content:
+        return "", 0.0, None
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    next_url = None
+    if next_page_selector:
+        next_page_link = soup.select_one(next_page_selector)
+        if next_page_link and 'href' in next_page_link.attrs:
+            # الروابط النسبية تُحل بالنسبة للصفحة الحالية
+            next_url = urljoin(current_url, next_page_link['href'])
+
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.decompose()
+    text = clean_text(soup.get_text())
+    return text, analyze_sentiment(text), next_url
+
+# --- Per-review extraction with config selectors (runs in an executor) ---
+_RATING_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5}
+_RATING_RE = re.compile(r'\d+(?:\.\d+)?')
+
+def _parse_rating(element):
+    """Numeric rating from the element text ("4/5") or a class word (star-rating Four)."""
+    if element is None:
+        return None
+    match = _RATING_RE.search(element.get_text())
+    if match:
+        return match.group(0)
+    for css_class in element.get('class', []):
+        if css_class.lower() in _RATING_WORDS:
+            return str(_RATING_WORDS[css_class.lower()])
+    return None
+
+def extract_reviews(html_content, current_url, selectors):
+    """
+    Extracts every review item on a page using the config selectors
+    (item_container, item_title, review_text, review_rating) plus pagination links
+    (next_page and optional page_links).
+
+    Returns:
+        (list of (review_text, title, rating), list of absolute page URLs discovered)
+    """
+    if not html_content:
+        return [], []
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    reviews = []
+    for item in soup.select(selectors.get('item_container') or 'body'):
+        title_el = item.select_one(selectors['item_title']) if selectors.get('item_title') else None
+        text_el = item.select_one(selectors['review_text']) if selectors.get('review_text') else item
+        rating_el = item.select_one(selectors['review_rating']) if selectors.get('review_rating') else None
+        text = clean_text(text_el.get_text()) if text_el else ''
+        if not text:
+            continue
+        title = (title_el.get('title') or title_el.get_text().strip()) if title_el else None
+        reviews.append((text, title, _parse_rating(rating_el)))
+
+    links = []
+    for key in ('next_page', 'page_links'):
+        if selectors.get(key):
+            links.extend(urljoin(current_url, a['href']) for a in soup.select(selectors[key]) if a.get('href'))
+    return reviews, links
+
+def analyze_reviews(html_content, current_url, selectors):
+    """
+    Per-review page analysis: extracts the items with the config selectors, scores each one
+    with VADER and fingerprints it for deduplication (text_dedup), in a single executor call per page.
+
+    Returns:
+        (list of (review_text, title, rating, compound score, content_hash, minhash signature),
+         list of absolute page URLs discovered)
+    """
+    reviews, links = extract_reviews(html_content, current_url, selectors)
+    polarity_scores = get_sentiment_analyzer().polarity_scores
+    return [
+        (text, title, rating, polarity_scores(text)['compound'], *fingerprint(text))
+        for text, title, rating in reviews
+    ], links
+
+async def iter_site_reviews(session, start_url, config, max_pages, concurrency, executor=None,
+                            global_limit=None, buffer_size=1000):
+    """
+    Async generator over (review_text, title, rating) for up to max_pages pages of a site.
+
+    Pages are fetched by `concurrency` workers over the given session (the crawler's
+    connection pool). If config has "page_url_template" (e.g. ".../page-{page}.html")
+    all page URLs are known up front and fetched concurrently; otherwise pages are
+    discovered through the next_page/page_links selectors. Extracted reviews pass through
+    a bounded queue (buffer_size), so workers pause when the consumer falls behind.
+    """
+    selectors = config.get('selectors', {})
+    template = config.get('page_url_template')
+    loop = asyncio.get_running_loop()
+    instrument_loop()
+    limit = global_limit or contextlib.nullcontext()
+
+    urls_queue = asyncio.Queue()
+    reviews_queue = asyncio.Queue(maxsize=buffer_size)
+    seen = SeenURLSet.temporary()
+    if template:
+        for page in range(1, max_pages + 1):
+            urls_queue.put_nowait(template.format(page=page))
+    else:
+        seen.add(start_url)
+        urls_queue.put_nowait(start_url)
+    pages_started = 0
+    done = object()
+
+    async def worker():
+        nonlocal pages_started
+        while True:
+            url = await urls_queue.get()
+            try:
+                if pages_started >= max_pages:
+                    continue
+                pages_started += 1
+                async with limit:
+                    html_content = await fetch_page(session, url)
+                if not html_content:
+                    continue
+                reviews, links = await loop.run_in_executor(executor, extract_reviews, html_content, url, selectors)
+                if not template:
+                    for link in links:
+                        if seen.add(link):
+                            urls_queue.put_nowait(link)
+                for review in reviews:
+                    await reviews_queue.put(review)  # ضغط عكسي: ينتظر إذا امتلأ الطابور
+            except Exception as worker_error:
+                print(f"⚠️ خطأ في استخلاص المراجعات من {url}: {worker_error}")
+            finally:
+                urls_queue.task_done()
+
+    async def supervise():
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            await urls_queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await reviews_queue.put(done)
+
+    supervisor = asyncio.create_task(supervise())
+    try:
+        while (review := await reviews_queue.get()) is not done:
+            yield review
+    finally:
+        supervisor.cancel()
+        await asyncio.gather(supervisor, return_exceptions=True)
+        seen.close(remove_store=True)
+
+def iter_site_reviews_sync(start_url, config, max_pages, concurrency, buffer_size=1000):
+    """
+    Synchronous bridge over iter_site_reviews for generator pipelines: the crawl runs on
+    its own event loop in a background thread and hands reviews over a bounded queue.
+    """
+    import queue
+    import threading
+
+    handoff = queue.Queue(maxsize=buffer_size)
+    done = object()
+    stop = threading.Event()
+
+    async def produce():
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async for review in iter_site_reviews(session, start_url, config, max_pages, concurrency,
+                                                  buffer_size=buffer_size):
+                while not stop.is_set():
+                    try:
+                        handoff.put_nowait(review)
+                        break
+                    except queue.Full:
+                        await asyncio.sleep(0.05)  # المستهلك متأخر: لا نحجز حلقة الأحداث
+                if stop.is_set():
+                    return
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            handoff.put(e)
+        finally:
+            handoff.put(done)
+
+    thread = threading.Thread(target=run, name='review-extractor', daemon=True)
+    thread.start()
+    try:
+        while (item := handoff.get()) is not done:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                handoff.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+# --- Crawl core shared by single-site and batch modes ---
+ALERT_POLL_SECONDS = 1.0  # how often crawl_site flushes due alert windows (StreamingAlertStage.poll)
+
+async def crawl_site(session, start_url, pages_to_scrape, concurrency, config=None,
+                     executor=None, global_limit=None, alert_stage=None, log_prefix="",
+                     checkpointer=None, resume_state=None):
+    """
+    Crawls one site from start_url following the next_page/page_links selectors and scores
+    every review item (item_container/review_text/review_rating selectors) on each page.
+
+    Args:
+        session: shared aiohttp.ClientSession (connection pool)
+        concurrency: number of workers for this site (per-site limit)
+        config: site config (selectors); loaded from config.json if None
+        executor: executor for page parsing/sentiment (None = loop default)
+        global_limit: asyncio.Semaphore shared by all sites (global request budget)
+        checkpointer: CrawlCheckpointer; the reviews of completed pages are handed to it and the frontier,
+                      seen-set and pages counter are checkpointed periodically
+        resume_state: dict(frontier, seen, pages_done) from CrawlCheckpointer.load() to continue a crawl
+
+    Returns:
+        list of {'url', 'title', 'review_text', 'rating', 'sentiment_score', 'content_hash', 'minhash'}
+        for the reviews of the pages crawled in this call; empty when a checkpointer is given, since
+        it already persists every page's reviews
+    """
+    config = config if config is not None else load_config()
+    selectors = config.get('selectors', {})
+    loop = asyncio.get_running_loop()
+    instrument_loop()
+    limit = global_limit or contextlib.nullcontext()
+
+    urls_queue = asyncio.Queue()
+    # مجموعة الروابط المزارة: مرشح Bloom في الذاكرة + مخزن تأكيد دقيق على القرص
+    # (ملف التشغيل عند وجود نقاط استئناف، وإلا ملف مؤقت يُحذف في النهاية)
+    if resume_state:
+        frontier = list(resume_state['frontier'])
+        scraped_urls = resume_state['seen'] # لضمان عدم تكرار زحف نفس الرابط
+        pages_started = resume_state['pages_done']
+    else:
+        frontier = [start_url]
+        scraped_urls = SeenURLSet(store_path=checkpointer.seen_store_path) if checkpointer else SeenURLSet.temporary()
+        scraped_urls.add(start_url)
+        pages_started = 0
+    for url in frontier:
+        urls_queue.put_nowait(url)
+    pending = set(frontier)  # الروابط المكتشفة التي لم تكتمل بعد (تُحفظ في نقطة الاستئناف)
+    pages_done = pages_started
+    results = []  # بدون checkpointer فقط؛ وإلا تبقى المراجعات في ذاكرة الزحف الطويل بلا حاجة
+
+    checkpoint_lock = asyncio.Lock()
+
+    async def alert_ticker():
+        # إرسال نوافذ التنبيه المنتهية خارج حلقة الأحداث (الكتابة في صندوق الإشعارات متزامنة)
+        while True:
+            await asyncio.sleep(ALERT_POLL_SECONDS)
+            await loop.run_in_executor(None, alert_stage.poll)
+
+    async def checkpoint(force=False):
+        if not checkpointer or not (force or checkpointer.due()):
+            return
+        async with checkpoint_lock:
+            # لقطة متسقة: الدفعة المسحوبة تطابق frontier في نفس اللحظة
+            batch = checkpointer.take()
+            await loop.run_in_executor(None, checkpointer.save, batch, list(pending), scraped_urls.to_bytes(), pages_done)
+
+    async def scraper_worker():
+        nonlocal pages_started, pages_done
+        while True:
+            url = await urls_queue.get()
+            try:
+                if pages_started >= pages_to_scrape:
+                    pending.discard(url)
+                    continue
+                pages_started += 1
+                print(f"{log_prefix}🌐 جاري الزحف إلى: {url} (الصفحة: {pages_started} من {pages_to_scrape})")
+
+                async with limit:
+                    html_content = await fetch_page(session, url)
+                if not html_content:
+                    pending.discard(url)
+                    pages_done += 1
+                    continue
+
+                # 1. استخلاص المراجعات بمُحدّدات الإعدادات وتحليل مشاعر كل منها (خارج حلقة الأحداث)
+                reviews, links = await loop.run_in_executor(executor, analyze_reviews, html_content, url, selectors)
+                page_results = [
+                    {'url': url, 'title': title, 'review_text': text, 'rating': rating, 'sentiment_score': score,
+                     'content_hash': text_hash, 'minhash': signature}
+                    for text, title, rating, score, text_hash, signature in reviews
+                ]
+                if not checkpointer:
+                    results.extend(page_results)
+                if alert_stage:
+                    for text, title, _, score, _, _ in reviews:
+                        alert_stage.observe(score, text, title=title or url)
+
+                # 2. اكتشاف الصفحات التالية وإضافتها للطابور
+                for next_url in links:
+                    if scraped_urls.add(next_url):
+                        pending.add(next_url)
+                        urls_queue.put_nowait(next_url)
+
+                # 3. تسليم مراجعات الصفحة لنقطة الاستئناف (الرابط يخرج من frontier في نفس المعاملة)
+                pending.discard(url)
+                pages_done += 1
+                if checkpointer:
+                    checkpointer.record(page_results)
+                    await checkpoint()
+            except Exception as worker_error:
+                print(f"{log_prefix}⚠️ خطأ في Worker عند {url}: {worker_error}")
+            finally:
+                urls_queue.task_done()
+
+    # إنشاء عمال بعدد يساوي قيمة التزامن (concurrency) ثم إيقافهم بمجرد إفراغ الطابور
+    workers = [asyncio.create_task(scraper_worker()) for _ in range(concurrency)]
+    if alert_stage:
+        workers.append(asyncio.create_task(alert_ticker()))
+    await urls_queue.join()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await checkpoint(force=True)
+    scraped_urls.close(remove_store=checkpointer is None)
+    return results
+
 # --- NEW: Orchestration Function with Dynamic Crawling ---
-def run_scraper_and_analysis(db_url, start_url, pages_to_scrape, concurrency):
+def run_scraper_and_analysis(db_url, start_url, pages_to_scrape, concurrency, profile=None):
     """
     Orchestrates the scraping and sentiment analysis process using a dynamic queue.
+
+    profile: optional profiling mode ('sampling' or 'cprofile'); the report is stored in run_profiles.
+
+    Returns:
+        run summary dict (run_id, pages, reviews, status, elapsed, error)
     """
+    with maybe_profile(profile, label=f"run_scraper_and_analysis {start_url}"):
+        return _scrape_and_save(db_url, start_url, pages_to_scrape, concurrency)
+
+def _scrape_and_save(db_url, start_url, pages_to_scrape, concurrency):
+    import database
+    from batch_crawl import crawl_single_site
+
     print(f"\n--- Starting Scraping and Analysis (Dynamic) ---")
     print(f"Target URL: {start_url}")
     print(f"Pages to scrape limit: {pages_to_scrape}")
     print(f"Concurrency limit: {concurrency}")
+    if db_url:
+        database.use_database(db_url)
 
-    urls_queue = asyncio.Queue()
-    urls_queue.put_nowait(start_url)
-    scraped_urls = {start_url} # لضمان عدم تكرار زحف نفس الرابط
-    all_results = [] 
-    
-    try:
-        loop = asyncio.get_event_loop()
-        
-        async def scraper_worker(session):
-            nonlocal all_results
-            pages_counter = 0
-            
-            # الحلقة تستمر ما دامت الروابط في الطابور لم تنتهِ ولم يتجاوز عداد الصفحات الحد الأقصى
-            while pages_counter < pages_to_scrape and not urls_queue.empty():
-                try:
-                    url = await asyncio.wait_for(urls_queue.get(), timeout=1) # timeout للحماية
-                    if url is None: continue
-                    
-                    print(f"🌐 جاري الزحف إلى: {url} (الصفحة: {pages_counter + 1} من {pages_to_scrape})")
-                    html_content = await fetch_page(session, url)
-                    
-                    if html_content:
-                        # 1. تحليل المحتوى واستخلاص النصوص والمشاعر
-                        extracted_text = extract_text(html_content)
-                        sentiment_score = analyze_sentiment(extracted_text)
-                        
-                        all_results.append({
-                            'url': url,
-                            'sentiment_score': sentiment_score,
-                            'text_content': extracted_text
-                        })
-                        
-                        # 2. اكتشاف الصفحة التالية وإضافتها للطابور
-                        next_url = get_next_page_url(html_content, url)
-                        if next_url and next_url not in scraped_urls:
-                            urls_queue.put_nowait(next_url)
-                            scraped_urls.add(next_url)
-                            print(f"-> تم اكتشاف الرابط التالي وإضافته: {next_url}")
-
-                        pages_counter += 1
-                    
-                    urls_queue.task_done()
-                    
-                except asyncio.TimeoutError:
-                    # قد يحدث عند انتظار رابط جديد في الطابور
-                    print("⌛ انتهى انتظار الروابط، جاري إنهاء العمل.")
-                    break 
-                except Exception as worker_error:
-                    print(f"⚠️ خطأ في Worker عند {url}: {worker_error}")
-                    urls_queue.task_done()
-
-        # تشغيل المهام غير المتزامنة
-        async def main_scraper_task():
-            async with aiohttp.ClientSession() as session:
-                # إنشاء عمال بعدد يساوي قيمة التزامن (concurrency)
-                workers = [asyncio.create_task(scraper_worker(session)) for _ in range(concurrency)]
-                await urls_queue.join()
-                
-                # إيقاف جميع العمال بمجرد إفراغ الطابور
-                for worker in workers:
-                    worker.cancel()
-
-        loop.run_until_complete(main_scraper_task())
-
-        print(f"\n✅ Finished dynamic scraping. Found {len(all_results)} analysis results.")
-
-        # Process results and save to database
-        for result in all_results:
-            try:
-                save_analysis_result(
-                    db_url, 
-                    result['url'], 
-                    result['sentiment_score'], 
-                    result['text_content']
-                )
-                # print(f"-> Saved analysis for {result['url']}")
-            except Exception as db_error:
-                print(f"⚠️ Error saving analysis for {result['url']}: {db_error}")
-
-    except Exception as e:
-        print(f"❌ An error occurred during the overall process: {e}")
+    # مراجعة لكل صف في جدول reviews ضمن سجل AnalysisRun (بدل نص الصفحة كاملاً)، مع نقاط استئناف
+    # وتنبيهات فورية كما في الزحف المتعدد
+    summary = crawl_single_site(load_config(), start_url, pages_to_scrape, concurrency)
+    if summary['status'] == 'completed':
+        print(f"\n✅ Finished dynamic scraping. Run {summary['run_id']}: {summary['reviews']} reviews "
+              f"from {summary['pages']} pages in {summary['elapsed']:.1f}s.")
+    else:
+        print(f"❌ An error occurred during the overall process: {summary['error']}")
 
-    print("--- Process Finished ---\n")
\ No newline at end of file
+    print("--- Process Finished ---\n")
+    return summary
@@ -0,0 +1,281 @@
+# search.py - بحث نصي كامل في المراجعات: FTS5 على SQLite و tsvector/GIN على PostgreSQL
+#
+# python search.py "شحن سريع" --run 3 --sentiment سلبي --page 2
+# python search.py --reindex          # فهرسة كل المراجعات غير المفهرسة (بعد ترقية قاعدة موجودة)
+
+import logging
+import os
+import re
+import time
+
+from sqlalchemy import text
+
+from text_dedup import fold_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+SYNC_CHUNK_SIZE = 5000  # عدد المراجعات في كل دفعة فهرسة (معاملة مستقلة)
+PG_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "english")  # إعداد tsvector (التجذيع الإنجليزي؛ العربي يُطبَّع في بايثون)
+
+# ----------------- 1. التطبيع -----------------
+# النص المفهرس والاستعلام يمران بنفس التطبيع في بايثون (fold_text: التشكيل والهمزات والتاء المربوطة
+# والأرقام الهندية)، ثم تُنزع "ال" التعريف مع الحروف الملتصقة بها، فتطابق "شحن" كلاً من
+# "الشحن" و"بالشحن" و"للشحن". نفس النتائج على SQLite و PostgreSQL.
+
+_ARTICLE_RE = re.compile(r'(?<!\S)(?:وال|بال|كال|فال|لل|ال)(?=\S\S)')
+_WORD_RE = re.compile(r'\w')
+
+def normalize_for_search(text_value):
+    return _ARTICLE_RE.sub('', fold_text(text_value))
+
+def query_terms(query):
+    """كلمات الاستعلام بعد التطبيع (بدون الرموز التعبيرية أو الكلمات الفارغة)."""
+    return [term for term in normalize_for_search(query).split() if _WORD_RE.search(term)]
+
+def _fts5_query(terms):
+    """كل الكلمات مطلوبة (AND)، وآخر كلمة كبادئة لتعمل أثناء الكتابة ("deliv" -> delivery)."""
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def _tsquery(terms):
+    quoted = ["'" + term.replace("'", "''") + "'" for term in terms]
+    quoted[-1] += ':*'
+    return ' & '.join(quoted)
+
+# ----------------- 2. الفهرس -----------------
+# جدول جانبي مفتاحه معرّف المراجعة: FTS5 بلا محتوى (content='') على SQLite فلا يتكرر النص،
+# و tsvector مع فهرس GIN على PostgreSQL. تُفهرس المراجعات الأصلية فقط (المكررة بلا نص،
+# وتُطابَق عبر أصلها عند التصفية بالتشغيل).
+
+_SCHEMA = {
+    'sqlite': (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS review_search USING fts5("
+        "document, content='', tokenize='porter unicode61 remove_diacritics 2')",
+    ),
+    'postgresql': (
+        "CREATE TABLE IF NOT EXISTS review_search ("
+        "review_id INTEGER PRIMARY KEY REFERENCES reviews(id) ON DELETE CASCADE, "
+        "document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_review_search_document ON review_search USING GIN (document)",
+    ),
+}
+_KEY_COLUMN = {'sqlite': 'rowid', 'postgresql': 'review_id'}
+_INSERT = {
+    'sqlite': "INSERT INTO review_search (rowid, document) VALUES (:id, :document)",
+    'postgresql': "INSERT INTO review_search (review_id, document) "
+                  "VALUES (:id, to_tsvector(CAST(:config AS regconfig), :document)) ON CONFLICT DO NOTHING",
+}
+
+_ready = set()  # عناوين قواعد البيانات التي أُنشئ فيها الفهرس (مرة واحدة لكل عملية)
+
+def _dialect(db):
+    name = db.get_bind().dialect.name
+    if name not in _SCHEMA:
+        raise NotImplementedError(f"Full-text search is not supported on {name} (only SQLite and PostgreSQL)")
+    return name
+
+def ensure_search_index(db):
+    """إنشاء جدول الفهرس إن لم يوجد (ترجع اسم المحرك: sqlite أو postgresql)."""
+    dialect = _dialect(db)
+    url = str(db.get_bind().url)
+    if url not in _ready:
+        for statement in _SCHEMA[dialect]:
+            db.execute(text(statement))
+        db.commit()
+        _ready.add(url)
+    return dialect
+
+def _index_rows(db, dialect, rows):
+    db.execute(text(_INSERT[dialect]), [
+        {'id': review_id, 'document': normalize_for_search(review_text), 'config': PG_TS_CONFIG}
+        for review_id, review_text in rows
+    ])
+    db.commit()
+
+def sync_search_index(db, analysis_run_id=None, chunk_size=SYNC_CHUNK_SIZE):
+    """
+    فهرسة المراجعات الأصلية غير المفهرسة على دفعات (مقارنة دقيقة بالفهرس: NOT EXISTS).
+    analysis_run_id: مراجعات هذا التشغيل فقط، وإلا كل المراجعات (للاستدعاء قبل كل بحث؛ تلتقط
+    أيضاً تشغيلاً قديماً فشلت فهرسته بعد فهرسة تشغيل أحدث منه).
+
+    Returns:
+        عدد المراجعات المفهرسة
+    """
+    from models import Review
+
+    dialect = ensure_search_index(db)
+    key = _KEY_COLUMN[dialect]
+    query = db.query(Review.id, Review.review_text).filter(
+        Review.review_text.isnot(None), Review.duplicate_of_id.is_(None),
+        text(f"NOT EXISTS (SELECT 1 FROM review_search WHERE review_search.{key} = reviews.id)"),
+    )
+    if analysis_run_id is not None:
+        query = query.filter(Review.analysis_run_id == analysis_run_id)
+
+    indexed = 0
+    last_id = 0
+    while True:
+        rows = query.filter(Review.id > last_id).order_by(Review.id).limit(chunk_size).all()
+        if not rows:
+            return indexed
+        _index_rows(db, dialect, rows)
+        indexed += len(rows)
+        last_id = rows[-1][0]
+
+def index_run(analysis_run_id):
+    """فهرسة مراجعات تشغيل مكتمل؛ فشل الفهرسة لا يُفشل التشغيل (البحث يستدرك لاحقاً)."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return sync_search_index(db, analysis_run_id)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Search indexing failed for run {analysis_run_id}: {e}")
+        return 0
+    finally:
+        db.close()
+
+# ----------------- 3. البحث -----------------
+
+# الترتيب حسب الصلة يحسب bm25 / ts_rank_cd لكل مطابقة، فكلمة شائعة في مئات آلاف المراجعات
+# تكلف مئات الميلي ثوانٍ. لذلك يُرتَّب أحدث RANK_WINDOW مطابقة فقط (بعد تطبيق المرشحات)،
+# ويُعرض العدد الكلي كـ "أكثر من" عند تجاوزها.
+RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "10000"))
+
+# (FROM ... WHERE المطابقة، المفتاح، تعبير الصلة، ربط reviews للمرشحات، اتجاه الترتيب)
+_MATCH_SQL = {
+    'sqlite': (
+        "FROM review_search{join} WHERE review_search MATCH :query{filters}",
+        "review_search.rowid",
+        "bm25(review_search)",
+        " JOIN reviews r ON r.id = review_search.rowid",
+        "ASC",  # bm25: الأصغر أنسب
+    ),
+    'postgresql': (
+        "FROM review_search s{join} WHERE s.document @@ to_tsquery(CAST(:config AS regconfig), :query){filters}",
+        "s.review_id",
+        "ts_rank_cd(s.document, to_tsquery(CAST(:config AS regconfig), :query))",
+        " JOIN reviews r ON r.id = s.review_id",
+        "DESC",
+    ),
+}
+RESULT_COLUMNS = ('id', 'analysis_run_id', 'title', 'review_text', 'rating', 'sentiment_label',
+                  'compound_score', 'scraped_at')
+
+def search_reviews(query, analysis_run_id=None, sentiment_label=None, page=1, page_size=DEFAULT_PAGE_SIZE,
+                   db=None):
+    """
+    بحث نصي مرتب حسب الصلة (bm25 / ts_rank_cd) مع ترقيم الصفحات.
+
+    Args:
+        query: كلمات البحث (عربية أو إنجليزية؛ كلها مطلوبة، وآخرها كبادئة)
+        analysis_run_id: مراجعات هذا التشغيل فقط (بما فيها المكررة المرتبطة بأصل في تشغيل سابق)
+        sentiment_label: 'إيجابي' أو 'سلبي' أو 'محايد'
+        page: رقم الصفحة (يبدأ من 1)
+
+    Returns:
+        dict: total, truncated (المطابقات أكثر من RANK_WINDOW)، page, page_size, pages, elapsed_ms،
+        results (قائمة dict بأعمدة RESULT_COLUMNS + score)
+    """
+    from database import SessionLocal
+
+    started = time.perf_counter()
+    page = max(int(page), 1)
+    response = {'total': 0, 'truncated': False, 'page': page, 'page_size': page_size, 'pages': 0,
+                'elapsed_ms': 0.0, 'results': []}
+    terms = query_terms(query or '')
+    if not terms:
+        return response
+
+    own_session = db is None
+    db = SessionLocal() if own_session else db
+    try:
+        dialect = ensure_search_index(db)
+        sync_search_index(db)  # المراجعات غير المفهرسة من أي تشغيل (عادة لا شيء)
+
+        filters, params = [], {
+            'query': _fts5_query(terms) if dialect == 'sqlite' else _tsquery(terms),
+            'config': PG_TS_CONFIG,
+            'window': RANK_WINDOW,
+            'limit': page_size,
+            'offset': (page - 1) * page_size,
+        }
+        if analysis_run_id is not None:
+            filters.append("(r.analysis_run_id = :run_id OR EXISTS (SELECT 1 FROM reviews d "
+                           "WHERE d.duplicate_of_id = r.id AND d.analysis_run_id = :run_id))")
+            params['run_id'] = analysis_run_id
+        if sentiment_label:
+            filters.append("r.sentiment_label = :sentiment")
+            params['sentiment'] = sentiment_label
+
+        match_sql, key, score_sql, join_sql, order = _MATCH_SQL[dialect]
+        match_sql = match_sql.format(join=join_sql if filters else '',
+                                     filters=''.join(f" AND {condition}" for condition in filters))
+        columns = ', '.join(f"r.{column}" for column in RESULT_COLUMNS)
+        rows = db.execute(text(
+            f"SELECT {columns}, m.score FROM (SELECT {key} AS id, {score_sql} AS score {match_sql} "
+            f"ORDER BY {key} DESC LIMIT :window) m JOIN reviews r ON r.id = m.id "
+            f"ORDER BY m.score {order} LIMIT :limit OFFSET :offset"
+        ), params).all()
+        # العدد حتى RANK_WINDOW + 1 فقط (ما بعدها لا يُرتَّب ولا يُعرض)
+        total = db.execute(text(f"SELECT count(*) FROM (SELECT 1 {match_sql} LIMIT :window) m"),
+                           {**params, 'window': RANK_WINDOW + 1}).scalar() or 0
+    finally:
+        if own_session:
+            db.close()
+
+    response.update(
+        total=min(total, RANK_WINDOW),
+        truncated=total > RANK_WINDOW,
+        pages=-(-min(total, RANK_WINDOW) // page_size),
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+        results=[dict(zip(RESULT_COLUMNS + ('score',), row)) for row in rows],
+    )
+    return response
+
+# ----------------- 4. سطر الأوامر -----------------
+
+def _main(argv=None):
+    import argparse
+
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Full-text search over the stored reviews.")
+    parser.add_argument('query', nargs='?', default=None)
+    parser.add_argument('--run', type=int, default=None, help="only reviews of this analysis run")
+    parser.add_argument('--sentiment', default=None, help="إيجابي / سلبي / محايد")
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--reindex', action='store_true', help="index every review that is not indexed yet")
+    args = parser.parse_args(argv)
+
+    if args.reindex:
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            from models import AnalysisRun
+            run_ids = [run_id for (run_id,) in db.query(AnalysisRun.id).order_by(AnalysisRun.id)]
+            indexed = sum(sync_search_index(db, run_id) for run_id in run_ids)
+            print(f"✅ Indexed {indexed} reviews of {len(run_ids)} runs in {time.perf_counter() - started:.1f}s")
+        finally:
+            db.close()
+        if not args.query:
+            return 0
+
+    if not args.query:
+        parser.error("a search query is required (or --reindex)")
+    response = search_reviews(args.query, args.run, args.sentiment, args.page, args.page_size)
+    print(f"{response['total']}{'+' if response['truncated'] else ''} results (page {response['page']}/{max(response['pages'], 1)}, "
+          f"{response['elapsed_ms']:.1f} ms)")
+    for row in response['results']:
+        snippet = (row['review_text'] or '')[:100].replace('\n', ' ')
+        print(f"#{row['id']:<8} run {row['analysis_run_id']:<5} {row['sentiment_label'] or '-':<7} "
+              f"{row['score']:8.3f}  {snippet}")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(_main())
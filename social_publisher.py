@@ -3,48 +3,253 @@
 import requests
 import logging
 import os # إضافة استيراد os
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 # import json # لا حاجة له ما دمنا لا نقرأ من config.json
+from config import LOG_FILENAME
 
-LOG_FILENAME = "app_scraper.log" 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', filename=LOG_FILENAME, filemode='a')
 
-def publish_to_social_media(message, platforms): # تم إزالة api_tokens من المعلمات
+# ----------------- إعدادات النشر -----------------
+
+# يمكن توجيهها إلى خوادم محلية للاختبار
+GRAPH_API_BASE = os.getenv("GRAPH_API_BASE", "https://graph.facebook.com/v18.0")
+TWITTER_API_BASE = os.getenv("TWITTER_API_BASE", "https://api.twitter.com/2")
+
+DEFAULT_TIMEOUTS = {'facebook': 10, 'twitter': 10}  # ثوانٍ لكل منصة
+DEFAULT_RETRIES = 2
+RETRY_STATUSES = (429, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+# ----------------- 1. جلسة HTTP مشتركة -----------------
+
+def get_http_session():
     """
-    ينشر نفس المحتوى على منصات متعددة بضغطة زر.
-    (رموز الوصول يتم قراءتها الآن من متغيرات البيئة لضمان الأمان)
+    جلسة requests مشتركة (تجمع اتصالات لكل منصة) مع إعادة محاولة تلقائية.
+    لا تُعاد محاولة الطلب بعد انتهاء مهلة القراءة (read=0) حتى لا يُنشر المحتوى مرتين.
     """
-    
-    results = {}
-    
-    # 1. النشر على فيسبوك (Facebook Page)
-    if 'facebook' in platforms:
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=DEFAULT_RETRIES, connect=DEFAULT_RETRIES, read=0, status=DEFAULT_RETRIES,
+                backoff_factor=0.5, status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(['GET', 'POST']), respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+# ----------------- 2. المنصات -----------------
+
+def _resolve_token(api_tokens, key, env_name):
+    """الرمز من إعدادات لوحة التحكم (api_tokens) أولاً، ثم من متغيرات البيئة."""
+    value = (api_tokens or {}).get(key)
+    return value or os.getenv(env_name)
+
+def _facebook_request(message, api_tokens):
+    page_access_token = _resolve_token(api_tokens, 'facebook_token', 'FACEBOOK_TOKEN')
+    page_id = _resolve_token(api_tokens, 'facebook_page_id', 'FACEBOOK_PAGE_ID')
+    if not page_access_token or not page_id:
+        return None, "⚠️ رموز الوصول لفيسبوك غير متوفرة (تحتاج لتعيين FACEBOOK_TOKEN و FACEBOOK_PAGE_ID في متغيرات البيئة)."
+    return {
+        'url': f"{GRAPH_API_BASE}/{page_id}/feed",
+        'data': {'message': message, 'access_token': page_access_token},
+    }, None
+
+def _twitter_request(message, api_tokens):
+    twitter_token = _resolve_token(api_tokens, 'twitter_token', 'TWITTER_BEARER_TOKEN')
+    if not twitter_token:
+        return None, "⚠️ رمز الوصول لتويتر غير متوفر (TWITTER_BEARER_TOKEN غير مُعيّن)."
+    return {
+        'url': f"{TWITTER_API_BASE}/tweets",
+        'json': {'text': message[:280]},
+        'headers': {'Authorization': f"Bearer {twitter_token}"},
+    }, None
+
+PLATFORMS = {
+    'facebook': ('فيسبوك', _facebook_request),
+    'twitter': ('تويتر/X', _twitter_request),
+}
+
+def _publish_one(platform, message, api_tokens, timeout):
+    """
+    النشر على منصة واحدة عبر الجلسة المشتركة.
+
+    Returns:
+        dict: ok, message, status_code, latency_ms, post_id
+    """
+    if platform not in PLATFORMS:
+        return {'ok': False, 'message': f"❌ منصة غير مدعومة: {platform}", 'status_code': None,
+                'latency_ms': 0.0, 'post_id': None}
+
+    label, build_request = PLATFORMS[platform]
+    request_kwargs, missing = build_request(message, api_tokens)
+    if missing:
+        return {'ok': False, 'message': missing, 'status_code': None, 'latency_ms': 0.0, 'post_id': None}
+
+    started = time.perf_counter()
+    try:
+        response = get_http_session().post(timeout=timeout, **request_kwargs)
+        latency_ms = (time.perf_counter() - started) * 1000
         try:
-            # القراءة الآمنة مباشرة من متغيرات البيئة
-            page_access_token = os.getenv('FACEBOOK_TOKEN') 
-            page_id = os.getenv('FACEBOOK_PAGE_ID')
-            
-            if page_access_token and page_id:
-                url = f"https://graph.facebook.com/v18.0/{page_id}/feed"
-                payload = {'message': message, 'access_token': page_access_token}
-                response = requests.post(url, data=payload)
-                
-                if response.status_code == 200:
-                    results['facebook'] = "✅ تم النشر بنجاح على فيسبوك!"
-                    logging.info(f"Published to Facebook: {message[:50]}...")
-                else:
-                    results['facebook'] = f"❌ فشل فيسبوك: {response.json().get('error', 'غير معروف')}"
-            else:
-                 results['facebook'] = "⚠️ رموز الوصول لفيسبوك غير متوفرة (تحتاج لتعيين FACEBOOK_TOKEN و FACEBOOK_PAGE_ID في متغيرات البيئة)."
-                 
-        except Exception as e:
-            results['facebook'] = f"❌ خطأ الاتصال بفيسبوك: {e}"
-
-    # 2. النشر على تويتر (X) - (محاكاة)
-    if 'twitter' in platforms:
-        twitter_token = os.getenv('TWITTER_BEARER_TOKEN')
-        if twitter_token:
-             results['twitter'] = "⚠️ التويتر/X يحتاج إلى تطبيق منطق النشر الفعلي. (الرمز موجود)"
-        else:
-             results['twitter'] = "⚠️ رمز الوصول لتويتر غير متوفر (TWITTER_BEARER_TOKEN غير مُعيّن)."
-        
-    return results
\ No newline at end of file
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.ok:
+            logging.info(f"Published to {platform} in {latency_ms:.0f} ms: {message[:50]}...")
+            post_id = body.get('id') or (body.get('data') or {}).get('id')
+            return {'ok': True, 'message': f"✅ تم النشر بنجاح على {label}!", 'status_code': response.status_code,
+                    'latency_ms': latency_ms, 'post_id': post_id}
+        error = body.get('error') or body.get('detail') or response.reason or 'غير معروف'
+        if isinstance(error, dict):
+            error = error.get('message', error)
+        return {'ok': False, 'message': f"❌ فشل {label}: {error}", 'status_code': response.status_code,
+                'latency_ms': latency_ms, 'post_id': None}
+    except requests.exceptions.RequestException as e:
+        return {'ok': False, 'message': f"❌ خطأ الاتصال بـ{label}: {e}", 'status_code': None,
+                'latency_ms': (time.perf_counter() - started) * 1000, 'post_id': None}
+
+# ----------------- 3. النشر المتزامن -----------------
+
+def publish_to_social_media(message, platforms, api_tokens=None, timeouts=None):
+    """
+    ينشر نفس المحتوى على منصات متعددة بضغطة زر، على جميع المنصات بالتوازي.
+    (رموز الوصول من api_tokens في لوحة التحكم إن وُجدت، وإلا من متغيرات البيئة)
+
+    Returns:
+        dict: {platform: {'ok', 'message', 'status_code', 'latency_ms', 'post_id'}}
+    """
+    timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+    platforms = list(dict.fromkeys(platforms))
+    if not platforms:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(platforms)) as pool:
+        futures = {
+            platform: pool.submit(_publish_one, platform, message, api_tokens, timeouts.get(platform, 10))
+            for platform in platforms
+        }
+        return {platform: future.result() for platform, future in futures.items()}
+
+# ----------------- 4. طابور النشر المجدول -----------------
+
+class PublishScheduler:
+    """
+    طابور نشر مجدول داخل العملية: كل منشور يُنشر في وقته المحدد عبر publish_to_social_media
+    من خيط خلفي واحد. النتائج تُحفظ في history لعرضها في لوحة التحكم.
+    """
+
+    def __init__(self, publish=publish_to_social_media, history_size=50):
+        self._publish = publish
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.history_size = history_size
+        self.history = []
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name='publish-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def schedule(self, message, platforms, publish_at, api_tokens=None):
+        """إضافة منشور إلى الطابور (publish_at: datetime محلي). ترجع معرف المنشور."""
+        post_id = next(self._counter)
+        with self._cond:
+            heapq.heappush(self._heap, (publish_at.timestamp(), post_id, message, list(platforms), dict(api_tokens or {})))
+            self._cond.notify()
+        return post_id
+
+    def pending(self):
+        """المنشورات المنتظرة مرتبة حسب الوقت: [(post_id, publish_at, platforms, message)]"""
+        with self._cond:
+            return [(post_id, datetime.fromtimestamp(ts), platforms, message)
+                    for ts, post_id, message, platforms, _ in sorted(self._heap)]
+
+    def cancel(self, post_id):
+        with self._cond:
+            before = len(self._heap)
+            self._heap = [item for item in self._heap if item[1] != post_id]
+            heapq.heapify(self._heap)
+            return len(self._heap) < before
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop and (not self._heap or self._heap[0][0] > time.time()):
+                    self._cond.wait(None if not self._heap else self._heap[0][0] - time.time())
+                if self._stop:
+                    return
+                _, post_id, message, platforms, api_tokens = heapq.heappop(self._heap)
+            results = self._publish(message, platforms, api_tokens)
+            self.history.append((post_id, datetime.now(), platforms, results))
+            del self.history[:-self.history_size]
+
+# ----------------- اختبار محلي مقابل خادم يحاكي Graph API -----------------
+
+if __name__ == "__main__":
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from datetime import timedelta
+
+    attempts = {'count': 0}
+
+    class GraphStandIn(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            attempts['count'] += 1
+            time.sleep(0.3)  # زمن استجابة المنصة
+            # أول طلب لتويتر يفشل بـ 503 لاختبار إعادة المحاولة
+            if self.path.endswith('/tweets') and attempts['count'] <= 2:
+                self.send_response(503)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'id': f"post_{attempts['count']}"}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 8766), GraphStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    GRAPH_API_BASE = TWITTER_API_BASE = 'http://127.0.0.1:8766'
+    tokens = {'facebook_token': 't', 'facebook_page_id': '1', 'twitter_token': 't'}
+
+    started = time.perf_counter()
+    results = publish_to_social_media("منتج رائع!", ['facebook', 'twitter'], tokens)
+    print(f"total {(time.perf_counter() - started) * 1000:.0f} ms")
+    for platform, result in results.items():
+        print(f"{platform}: {result['message']} ({result['latency_ms']:.0f} ms, id={result['post_id']})")
+
+    scheduler = PublishScheduler().start()
+    scheduler.schedule("منشور مجدول", ['facebook'], datetime.now() + timedelta(seconds=1), tokens)
+    time.sleep(2)
+    print(f"scheduled: {scheduler.history[-1][3]['facebook']['message']}")
+    scheduler.stop()
+    server.shutdown()
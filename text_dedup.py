@@ -0,0 +1,242 @@
+# text_dedup.py - تطبيع نصوص المراجعات وكشف المكرر والمكرر التقريبي (MinHash) داخل التشغيل وعبر التشغيلات
+
+import functools
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+
+# ----------------- 1. التطبيع -----------------
+# التعابير مُجمّعة مرة واحدة عند الاستيراد (تُستدعى لكل مراجعة ولكل صفحة)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+# محارف التحكم والمحارف غير المرئية (عرض صفري، علامات الاتجاه، BOM)
+_INVISIBLE_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b-\u200f\u202a-\u202e\u2066-\u2069\ufeff]')
+# التشكيل وعلامات القرآن والتطويل
+_DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_EMOJI_CHARS = '\U0001F000-\U0001FAFF\u2600-\u27bf\u2b00-\u2bff'
+# رمز تعبيري واحد مع تكراره المتتالي ومحدد الشكل (😍😍😍 -> 😍)
+_EMOJI_RE = re.compile(f'([{_EMOJI_CHARS}])(?:\ufe0f|\\1)*')
+_PUNCTUATION_RE = re.compile(f'[^\\w\\s{_EMOJI_CHARS}]+|_+')
+
+# توحيد أشكال الحروف العربية والأرقام الهندية (للمقارنة فقط، لا يُعرض).
+# سلسلة replace أسرع بكثير من str.translate بقاموس على النصوص غير اللاتينية.
+_ARABIC_FOLD = (
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'),
+    ('ى', 'ي'), ('ئ', 'ي'), ('ی', 'ي'),
+    ('ؤ', 'و'), ('ة', 'ه'), ('ک', 'ك'),
+)
+_ARABIC_DIGITS_RE = re.compile('[\u0660-\u0669\u06f0-\u06f9]')
+_DIGITS = str.maketrans({chr(base + d): str(d) for base in (0x0660, 0x06F0) for d in range(10)})
+
+def _fold_arabic(text):
+    for source, target in _ARABIC_FOLD:
+        if source in text:
+            text = text.replace(source, target)
+    if _ARABIC_DIGITS_RE.search(text):
+        text = text.translate(_DIGITS)
+    return text
+
+def clean_text(text):
+    """تنظيف النص للعرض والتحليل: حذف المحارف غير المرئية وتوحيد المسافات (دون تغيير المحتوى)."""
+    if not text:
+        return ''
+    return _WHITESPACE_RE.sub(' ', _INVISIBLE_RE.sub('', text)).strip()
+
+def fold_text(text):
+    """
+    الشكل المطبّع للمقارنة: NFKC، أحرف صغيرة، بلا تشكيل أو تطويل، همزات وألفات موحّدة،
+    أرقام لاتينية، بلا علامات ترقيم، وكل رمز تعبيري كلمة مستقلة (بلا تكرار).
+    """
+    if not text:
+        return ''
+    if text.isascii():  # أغلب النصوص الإنجليزية: لا حاجة لـ NFKC أو الطي العربي أو الرموز التعبيرية
+        return _WHITESPACE_RE.sub(' ', _PUNCTUATION_RE.sub(' ', text.lower())).strip()
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = _fold_arabic(_DIACRITICS_RE.sub('', _INVISIBLE_RE.sub('', text)))
+    text = _PUNCTUATION_RE.sub(' ', _EMOJI_RE.sub(r' \1 ', text))
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+# ----------------- 2. البصمات -----------------
+# التطابق التام: بصمة النص المطبّع بلا مسافات ("و الترجمة" = "والترجمة").
+# التقارب: MinHash على الكلمات والأزواج المتتالية، مع LSH (شرائح من قيم التوقيع) حتى لا يُقارن
+# إلا المرشحون. المكرر يرث تحليل الأصل، لذلك العتبة متحفظة (0.9) وأدوات النفي يجب أن تتطابق:
+# "not good at all" و"good at all" متشابهتان بنسبة ~0.8 لكن معناهما معكوس.
+
+NUM_PERM = 64                # طول توقيع MinHash
+_BANDS, _ROWS = 8, 8         # 8 شرائح × 8 قيم
+MIN_MINHASH_TOKENS = 6       # النصوص الأقصر تُقارن بالتطابق التام فقط
+DEFAULT_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))  # تشابه Jaccard المقدّر الأدنى
+NEGATIONS = frozenset((
+    'not', 'no', 'never', 'nor', 'none', 'nothing', 'nobody', 'cannot', 'without', 't',  # don't -> don t
+    'لا', 'لم', 'لن', 'ليس', 'ليست', 'غير', 'بدون', 'ما', 'مش', 'مو',
+))
+
+@functools.lru_cache(maxsize=None)
+def _permutations():
+    """معاملات التبديل (a, b) لكل صف؛ numpy يُستورد هنا لا عند الاستيراد (scraper_core يحتاج clean_text فقط)."""
+    import numpy as np
+    rng = np.random.default_rng(20240611)  # معاملات ثابتة: التواقيع المحفوظة تبقى قابلة للمقارنة
+    return (rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1),
+            rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64))
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True)
+
+def content_hash(folded):
+    """بصمة التطابق التام للنص المطبّع (int64 بإشارة، لعمود BigInteger)."""
+    return _hash64(folded.replace(' ', '').encode('utf-8'))
+
+def minhash(tokens):
+    """
+    توقيع MinHash لمجموعة الكلمات والأزواج: NUM_PERM قيمة uint16 (128 بايت) ثم بصمة
+    أدوات النفي في النص (بايتان).
+    Returns: bytes، أو None إذا كان النص أقصر من MIN_MINHASH_TOKENS.
+    """
+    if len(tokens) < MIN_MINHASH_TOKENS:
+        return None
+    import numpy as np
+    perm_a, perm_b = _permutations()
+    shingles = set(tokens)
+    shingles.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    # تبديل عشوائي لكل صف: (a*h + b) mod 2^64، ثم البتات العليا (الأفضل توزيعاً)
+    permuted = (hashes[:, None] * perm_a + perm_b) >> np.uint64(48)
+    negations = ' '.join(sorted(token for token in tokens if token in NEGATIONS))
+    return permuted.min(axis=0).astype('<u2').tobytes() + (zlib.crc32(negations.encode('utf-8')) & 0xFFFF).to_bytes(2, 'little')
+
+def fingerprint(text):
+    """(content_hash, توقيع MinHash أو None) لنص مراجعة خام."""
+    folded = fold_text(text)
+    return content_hash(folded), minhash(folded.split())
+
+def similarity(signature_a, signature_b):
+    """تشابه Jaccard المقدّر من توقيعين (نسبة القيم المتساوية)."""
+    import numpy as np
+    a = np.frombuffer(signature_a, dtype='<u2', count=NUM_PERM)
+    b = np.frombuffer(signature_b, dtype='<u2', count=NUM_PERM)
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+def _band_keys(signature):
+    """مفتاح كل شريحة يبدأ ببصمة النفي، فلا يلتقي نصان يختلفان في أدوات النفي."""
+    size = _ROWS * 2  # بايتان لكل قيمة
+    negations = signature[NUM_PERM * 2:]
+    return [negations + signature[band * size:(band + 1) * size] for band in range(_BANDS)]
+
+# ----------------- 3. فهرس المراجعات الأصلية -----------------
+
+DEFAULT_INDEX_SIZE = int(os.getenv("DEDUP_INDEX_SIZE", "50000"))  # أقصى عدد مراجعات أصلية في الذاكرة (~1 KiB لكل منها)
+
+class Canonical:
+    """مراجعة أصلية في الفهرس: معرّفها (بعد الحفظ) ونتيجة تحليلها لنسخها إلى المكررات."""
+
+    __slots__ = ('review_id', 'label', 'score', 'subjectivity', 'language')
+
+    def __init__(self, review_id=None, label=None, score=0.0, subjectivity=0.5, language='unknown'):
+        self.review_id = review_id
+        self.label = label
+        self.score = score
+        self.subjectivity = subjectivity
+        self.language = language
+
+class DuplicateIndex:
+    """
+    فهرس المراجعات الأصلية: قاموس للتطابق التام بعد التطبيع، وشرائح LSH لتواقيع MinHash
+    (المرشحون فقط يُقارنون بالتشابه المقدّر). يمتد عبر دفعات التشغيل، ويمكن تهيئته من
+    مراجعات التشغيلات السابقة لنفس الموقع (load_recent).
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_INDEX_SIZE):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._exact = {}
+        self._bands = [{} for _ in range(_BANDS)]
+        self.exact_hits = 0
+        self.near_hits = 0
+
+    def __len__(self):
+        return len(self._exact)
+
+    def find(self, text_hash, signature):
+        """المراجعة الأصلية المطابقة (Canonical) أو None."""
+        entry = self._exact.get(text_hash)
+        if entry is not None:
+            self.exact_hits += 1
+            return entry
+        if signature is None or self.threshold > 1:
+            return None
+        seen = set()
+        for band, key in zip(self._bands, _band_keys(signature)):
+            for candidate, entry in band.get(key, ()):
+                if id(entry) in seen:
+                    continue
+                seen.add(id(entry))
+                if similarity(candidate, signature) >= self.threshold:
+                    self.near_hits += 1
+                    return entry
+        return None
+
+    def add(self, text_hash, signature, entry):
+        """تسجيل مراجعة أصلية (يتوقف عن الإضافة عند max_entries؛ البحث يستمر)."""
+        if len(self._exact) >= self.max_entries:
+            return False
+        self._exact[text_hash] = entry
+        if signature is not None:
+            for band, key in zip(self._bands, _band_keys(signature)):
+                band.setdefault(key, []).append((signature, entry))
+        return True
+
+    def load_recent(self, db, target_site, limit=None):
+        """تهيئة الفهرس بآخر المراجعات الأصلية لنفس الموقع من التشغيلات السابقة."""
+        from models import AnalysisRun, Review
+
+        rows = (
+            db.query(Review.id, Review.content_hash, Review.minhash, Review.sentiment_label,
+                     Review.compound_score, Review.subjectivity, Review.language)
+            .join(AnalysisRun, AnalysisRun.id == Review.analysis_run_id)
+            .filter(AnalysisRun.target_site == target_site, Review.duplicate_of_id.is_(None),
+                    Review.content_hash.isnot(None))
+            .order_by(Review.id.desc())
+            .limit(limit or self.max_entries)
+        )
+        loaded = 0
+        for review_id, text_hash, signature, label, score, subjectivity, language in rows:
+            if text_hash in self._exact:
+                continue
+            self.add(text_hash, signature, Canonical(review_id, label, score or 0.0,
+                                                     subjectivity if subjectivity is not None else 0.5,
+                                                     language or 'unknown'))
+            loaded += 1
+        return loaded
+
+# ----------------- مثال: مراجعات مكررة بعلامات ترقيم وتشكيل مختلفة -----------------
+
+if __name__ == "__main__":
+    import time
+
+    samples = [
+        "الكتابُ رائعٌ جداً والترجمة ممتازة، أنصح به بشدة!!! 😍😍😍",
+        "الكتاب رائع جدا و الترجمة ممتازه ، انصح به بشده 😍",
+        "The story was gripping and beautifully written, highly recommended.",
+        "the story was gripping & beautifully written — highly recommended!!",
+        "The story was gripping and beautifully written, highly recommended. Five stars.",
+        "Arrived late and the cover was damaged, very disappointing.",
+    ]
+    index = DuplicateIndex()
+    for text in samples:
+        text_hash, signature = fingerprint(text)
+        match = index.find(text_hash, signature)
+        if match is None:
+            index.add(text_hash, signature, Canonical(review_id=samples.index(text)))
+        print(f"{'dup of #' + str(match.review_id) if match else 'new':>10}  {fold_text(text)}")
+
+    from benchmarks.corpus import make_reviews
+    reviews = [text for text, _, _ in make_reviews(20_000)]
+    started = time.perf_counter()
+    for text in reviews:
+        fingerprint(text)
+    elapsed = time.perf_counter() - started
+    print(f"\nfingerprint: {elapsed / len(reviews) * 1e6:.1f} µs/review")
@@ -0,0 +1,300 @@
+# url_filter.py - مجموعة روابط مزارة مضغوطة: مرشح Bloom قابل للتوسع + تأكيد دقيق على القرص
+
+import hashlib
+import os
+import sqlite3
+import struct
+import tempfile
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import numpy as np
+
+DEFAULT_INITIAL_CAPACITY = 100_000
+DEFAULT_ERROR_RATE = 0.001
+GROWTH_FACTOR = 2          # سعة كل مرشح جديد مقارنة بالسابق
+TIGHTENING_RATIO = 0.85    # تشديد نسبة الخطأ لكل مرشح جديد حتى يبقى الخطأ الكلي محدوداً
+
+_MAGIC = b'SBF1'
+_FILTER_HEADER = struct.Struct('<QdQQI')  # capacity, error_rate, count, num_bits, num_hashes
+_MASK64 = (1 << 64) - 1
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# ----------------- 1. تطبيع الروابط وبصمتها -----------------
+
+def normalize_url(url):
+    """
+    تطبيع الرابط حتى تُعامل الصيغ المتكافئة كرابط واحد: أحرف صغيرة للمخطط والمضيف،
+    إزالة المنفذ الافتراضي والجزء (#fragment)، وترتيب معاملات الاستعلام.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+def url_fingerprint(url):
+    """بصمة 128 بت للرابط المطبّع (16 بايت)."""
+    return hashlib.blake2b(normalize_url(url).encode('utf-8'), digest_size=16).digest()
+
+def _split_fingerprint(fingerprint):
+    h1, h2 = struct.unpack('<QQ', fingerprint)
+    return h1, h2 | 1  # h2 فردي حتى تختلف المواضع في التجزئة المزدوجة
+
+# ----------------- 2. مرشح Bloom -----------------
+
+class BloomFilter:
+    """مرشح Bloom بحجم ثابت فوق مصفوفة بتات NumPy، مع تجزئة مزدوجة (h1 + i*h2)."""
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE, _bits=None, _count=0):
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        self.num_bits = max(8, int(-self.capacity * np.log(self.error_rate) / (np.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * np.log(2))))
+        self.bits = _bits if _bits is not None else np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = _count
+
+    def _positions(self, h1, h2):
+        return [((h1 + i * h2) & _MASK64) % self.num_bits for i in range(self.num_hashes)]
+
+    def add_hashes(self, h1, h2):
+        for pos in self._positions(h1, h2):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def contains_hashes(self, h1, h2):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(h1, h2))
+
+    def add_many(self, h1, h2):
+        """إضافة مجمّعة (مصفوفتا uint64) - تُستخدم في بناء المرشح والقياسات."""
+        positions = self._vector_positions(h1, h2)
+        np.bitwise_or.at(self.bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+        self.count += len(h1)
+
+    def contains_many(self, h1, h2):
+        positions = self._vector_positions(h1, h2)
+        hits = (self.bits[positions >> 3] >> (positions & 7).astype(np.uint8)) & 1
+        return hits.reshape(len(h1), self.num_hashes).all(axis=1)
+
+    def _vector_positions(self, h1, h2):
+        i = np.arange(self.num_hashes, dtype=np.uint64)
+        # الجمع والضرب في uint64 يلتف تلقائياً (mod 2**64) كما في النسخة الفردية
+        with np.errstate(over='ignore'):
+            combined = h1[:, None] + i[None, :] * h2[:, None]
+        return (combined % np.uint64(self.num_bits)).ravel().astype(np.int64)
+
+    @property
+    def is_full(self):
+        return self.count >= self.capacity
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+class ScalableBloomFilter:
+    """
+    سلسلة مرشحات Bloom تنمو عند امتلاء الأخير (سعة ×2 ونسبة خطأ ×0.85)،
+    فلا يلزم معرفة عدد الروابط مسبقاً ويبقى معدل الخطأ الكلي قريباً من error_rate.
+    """
+
+    def __init__(self, initial_capacity=DEFAULT_INITIAL_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.filters = []
+
+    def _grow(self):
+        n = len(self.filters)
+        self.filters.append(BloomFilter(
+            self.initial_capacity * GROWTH_FACTOR ** n,
+            self.error_rate * (1 - TIGHTENING_RATIO) * TIGHTENING_RATIO ** n,
+        ))
+
+    def _active(self):
+        if not self.filters or self.filters[-1].is_full:
+            self._grow()
+        return self.filters[-1]
+
+    def add_hashes(self, h1, h2):
+        self._active().add_hashes(h1, h2)
+
+    def contains_hashes(self, h1, h2):
+        return any(f.contains_hashes(h1, h2) for f in reversed(self.filters))
+
+    def add_many(self, h1, h2):
+        start = 0
+        while start < len(h1):
+            active = self._active()
+            end = start + min(len(h1) - start, active.capacity - active.count)
+            active.add_many(h1[start:end], h2[start:end])
+            start = end
+
+    def contains_many(self, h1, h2):
+        result = np.zeros(len(h1), dtype=bool)
+        for f in self.filters:
+            result |= f.contains_many(h1, h2)
+        return result
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    @property
+    def nbytes(self):
+        return sum(f.nbytes for f in self.filters)
+
+    def to_bytes(self):
+        """تسلسل كامل (لنقاط استئناف الزحف)."""
+        chunks = [_MAGIC, struct.pack('<QdI', self.initial_capacity, self.error_rate, len(self.filters))]
+        for f in self.filters:
+            chunks.append(_FILTER_HEADER.pack(f.capacity, f.error_rate, f.count, f.num_bits, f.num_hashes))
+            chunks.append(f.bits.tobytes())
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != _MAGIC:
+            raise ValueError("not a serialized ScalableBloomFilter")
+        offset = 4
+        initial_capacity, error_rate, n = struct.unpack_from('<QdI', data, offset)
+        offset += struct.calcsize('<QdI')
+        sbf = cls(initial_capacity, error_rate)
+        for _ in range(n):
+            capacity, f_error, count, num_bits, _ = _FILTER_HEADER.unpack_from(data, offset)
+            offset += _FILTER_HEADER.size
+            size = (num_bits + 7) // 8
+            bits = np.frombuffer(data, dtype=np.uint8, count=size, offset=offset).copy()
+            offset += size
+            sbf.filters.append(BloomFilter(capacity, f_error, _bits=bits, _count=count))
+        return sbf
+
+# ----------------- 3. مجموعة الروابط المزارة -----------------
+
+class SeenURLSet:
+    """
+    بديل مضغوط لـ set() الروابط في الزاحف. المرشح يجيب عن "غير مزار" بدقة تامة؛
+    وعند إجابة "ربما مزار" يتم التأكيد من مخزن دقيق على القرص (SQLite لبصمات 16 بايت)
+    إذا حُدد store_path، وإلا تُقبل نتيجة المرشح (خطأ إيجابي بنسبة error_rate).
+    """
+
+    def __init__(self, store_path=None, initial_capacity=DEFAULT_INITIAL_CAPACITY,
+                 error_rate=DEFAULT_ERROR_RATE, bloom=None):
+        self.bloom = bloom or ScalableBloomFilter(initial_capacity, error_rate)
+        self.store_path = store_path
+        self._store = None
+        if store_path:
+            self._store = sqlite3.connect(store_path, check_same_thread=False)
+            self._store.execute("PRAGMA journal_mode=WAL")
+            self._store.execute("CREATE TABLE IF NOT EXISTS seen (fp BLOB PRIMARY KEY) WITHOUT ROWID")
+
+    @classmethod
+    def temporary(cls, **kwargs):
+        """مجموعة بمخزن تأكيد في ملف مؤقت (يُحذف عند close(remove_store=True))."""
+        fd, path = tempfile.mkstemp(prefix='crawl_seen_', suffix='.sqlite')
+        os.close(fd)
+        return cls(store_path=path, **kwargs)
+
+    def _confirmed(self, fingerprint):
+        if self._store is None:
+            return True
+        return self._store.execute("SELECT 1 FROM seen WHERE fp = ?", (fingerprint,)).fetchone() is not None
+
+    def __contains__(self, url):
+        fingerprint = url_fingerprint(url)
+        return self.bloom.contains_hashes(*_split_fingerprint(fingerprint)) and self._confirmed(fingerprint)
+
+    def add(self, url):
+        """
+        إضافة رابط.
+
+        Returns:
+            True إذا كان الرابط جديداً (يجب زحفه)، False إذا كان مزاراً من قبل
+        """
+        fingerprint = url_fingerprint(url)
+        h1, h2 = _split_fingerprint(fingerprint)
+        if self.bloom.contains_hashes(h1, h2) and self._confirmed(fingerprint):
+            return False
+        self.bloom.add_hashes(h1, h2)
+        if self._store is not None:
+            self._store.execute("INSERT OR IGNORE INTO seen (fp) VALUES (?)", (fingerprint,))
+        return True
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __len__(self):
+        return len(self.bloom)
+
+    def to_bytes(self):
+        """تسلسل المرشح (المخزن الدقيق يبقى في ملفه على القرص)."""
+        if self._store is not None:
+            self._store.commit()
+        return self.bloom.to_bytes()
+
+    @classmethod
+    def from_bytes(cls, data, store_path=None):
+        """
+        استعادة المجموعة من نقطة استئناف. إذا لم يعد ملف المخزن موجوداً
+        تعمل المجموعة بالمرشح وحده.
+        """
+        if store_path and not os.path.exists(store_path):
+            store_path = None
+        return cls(store_path=store_path, bloom=ScalableBloomFilter.from_bytes(data))
+
+    def close(self, remove_store=False):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+            if remove_store and self.store_path:
+                for path in (self.store_path, self.store_path + '-wal', self.store_path + '-shm'):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+# ----------------- قياس الذاكرة ونسبة الخطأ عند 1M و 10M رابط -----------------
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import tracemalloc
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000, 10_000_000]
+
+    def fingerprints(start, n):
+        """
+        بصمات روابط منتجات اصطناعية (مجمّعة في مصفوفتي uint64). الروابط مطبّعة مسبقاً
+        فتُجزأ مباشرة - التطبيع (~15 µs/رابط) لا يؤثر على الذاكرة أو نسبة الخطأ.
+        """
+        raw = b''.join(
+            hashlib.blake2b(f"https://shop.example.com/catalogue/product-{i}/index.html?ref=list".encode(),
+                            digest_size=16).digest()
+            for i in range(start, start + n)
+        )
+        pairs = np.frombuffer(raw, dtype='<u8').reshape(n, 2)
+        return pairs[:, 0].copy(), pairs[:, 1] | np.uint64(1)
+
+    for n in sizes:
+        started = time.perf_counter()
+        h1, h2 = fingerprints(0, n)
+        sbf = ScalableBloomFilter(initial_capacity=n // 8 or 1)
+        sbf.add_many(h1, h2)
+        build = time.perf_counter() - started
+
+        probe = min(n, 1_000_000)
+        q1, q2 = fingerprints(n, probe)  # روابط لم تُضف أبداً
+        fp_rate = sbf.contains_many(q1, q2).mean()
+        assert sbf.contains_many(h1[:probe], h2[:probe]).all()  # لا أخطاء سلبية
+
+        # ذاكرة set() من السلاسل الكاملة (تُقاس فعلياً حتى 1M ثم تُقدّر خطياً)
+        measured = min(n, 1_000_000)
+        tracemalloc.start()
+        urls = {f"https://shop.example.com/catalogue/product-{i}/index.html?ref=list" for i in range(measured)}
+        set_bytes = tracemalloc.get_traced_memory()[0] * (n / measured)
+        tracemalloc.stop()
+        del urls
+
+        print(f"{n:>11,} URLs: bloom {sbf.nbytes / 2**20:7.1f} MiB ({len(sbf.filters)} filters), "
+              f"set() {set_bytes / 2**20:8.1f} MiB{'' if measured == n else ' (est.)'}, "
+              f"false positives {fp_rate:.5f} (target {sbf.error_rate}), "
+              f"serialized {len(sbf.to_bytes()) / 2**20:.1f} MiB, build {build:.1f}s")